@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchBatch.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Throughput of the offline batch renderer with 1, 2 and 4 worker processes, against the stub engine,
+in characters per second and per second per core, then the time to resume a batch with some files left to render.
+The stub engine sleeps to simulate synthesis, so the scaling shown is that of the pool rather than of the cores of this machine.
+Usage: python benchBatch.py [numFiles] [linesPerFile]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import benchCommon
+import fakeNvda
+import stubEngine
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_batch
+
+WORDS = (u"नमस्ते", u"भारत", u"भाषा", u"किताब", u"पानी", u"घर", u"स्कूल", u"बच्चे", u"समय", u"दिन",
+	u"रात", u"शहर", u"गाँव", u"लोग", u"काम", u"सुबह", u"खाना", u"रास्ता", u"दोस्त", u"आज")
+
+def _makeProgramData(directory):
+	"""Puts the stub engine where the add-on looks for the engine DLL, with a Hindi voice."""
+	hear2Read = os.path.join(directory, "Hear2Read")
+	os.makedirs(os.path.join(hear2Read, "Languages"))
+	shutil.copy(stubEngine.build(), os.path.join(hear2Read, stubEngine.ENGINE_DLL_NAME))
+	fakeNvda.writeVoiceFile(os.path.join(hear2Read, "Languages", "H2R_hi_voice_Male.flitevox"), "hi")
+
+def _makeInputs(directory, numFiles, linesPerFile):
+	rng = random.Random(1)
+	paths = []
+	for i in range(numFiles):
+		path = os.path.join(directory, "chapter%02d.txt" % i)
+		with open(path, "w", encoding="utf-8") as f:
+			for j in range(linesPerFile):
+				f.write(u" ".join(rng.choice(WORDS) for k in range(12)) + u"।\n")
+		paths.append(path)
+	return paths
+
+def _run(directory, programData, inputs, workers, manifestPath=None):
+	manifestPath = manifestPath or os.path.join(directory, "batch%d.json" % workers)
+	outputDir = os.path.join(directory, "out%d" % workers)
+	os.makedirs(outputDir, exist_ok=True)
+	manifest = _H2R_batch.Manifest.open(manifestPath, {"language": "hi", "format": "wav", "rate": None, "volume": None})
+	manifest.addInputs(inputs, outputDir)
+	return manifest, _H2R_batch.renderBatch(manifest, workers, programData)
+
+def main():
+	numFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+	linesPerFile = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+	directory = tempfile.mkdtemp()
+	try:
+		programData = os.path.join(directory, "ProgramData")
+		_makeProgramData(programData)
+		inputs = _makeInputs(directory, numFiles, linesPerFile)
+		for workers in (1, 2, 4):
+			manifest, report = _run(directory, programData, inputs, workers)
+			print("%d workers: %d files, %d chars, %.1f s of audio in %.2f s" % (
+				workers, report.files, report.chars, report.audioSeconds, report.wallSeconds))
+			print("  %.0f chars/s, %.0f chars/s per core" % (report.charsPerSecond, report.charsPerSecondPerCore))
+		# Resume the last batch after losing two outputs and editing one input.
+		for job in manifest.jobs[:2]:
+			os.remove(job["output"])
+		with open(inputs[-1], "a", encoding="utf-8") as f:
+			f.write(u"और एक पंक्ति।\n")
+		start = time.perf_counter()
+		manifest, report = _run(directory, programData, inputs, 4, manifest.path)
+		print("resumed: %d of %d files rendered again" % (report.files, len(inputs)))
+		benchCommon.report("  resume", time.perf_counter() - start, "s")
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
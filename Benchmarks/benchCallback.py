@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchCallback.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Time and allocations per call of the engine audio callback, driven by a fake event array.
+Compares _H2R_Speak.callback, which copies into the PCM ring buffer, with the version before the ring,
+which put each piece between indexes on the feed queue, and with the string_at and slice version before that.
+Calls are timed both as the first buffer of a sentence, which the new callback hands to the feeder at once,
+and streaming the buffers of whole sentences, most of which wait in the ring for a whole block.
+Usage: python benchCallback.py [numCallbacks]
+"""
+
+import queue
+import sys
+import tracemalloc
+from ctypes import CFUNCTYPE, POINTER, c_int, c_short, c_void_p, sizeof, string_at
+from functools import partial
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+
+#: Samples per callback, 10 ms at 16 kHz as delivered by the engine.
+NUM_SAMPLES = 160
+#: Buffers in each sentence when streaming, 5 s of audio.
+SENTENCE_BUFFERS = 500
+
+def _legacyCallback(wav, numsamples, event):
+	# The callback body before the zero copy rewrite, logging included.
+	log = _H2R_Speak.log
+	player = _H2R_Speak.player
+	if not _H2R_Speak.isSpeaking:
+		player.stop()
+		return _H2R_Speak.CALLBACK_ABORT_SYNTHESIS
+	indexes = []
+	for e in event:
+		if e.type==_H2R_Speak.H2R_SpeakEVENT_MARK:
+			log.info("H2R_SpeakEVENT_MARK found")
+			indexNum = int(_H2R_Speak.decodeH2RSpeakString(e.id.name))
+			log.info("+_H2R_SpeakEVENT indexNum = %d", indexNum)
+			BYTES_PER_SAMPLE = 2
+			MS_PER_SEC = 1000
+			bytesPerMS = player.samplesPerSec * BYTES_PER_SAMPLE // MS_PER_SEC
+			indexByte = e.audio_position * bytesPerMS
+			indexByte -= _H2R_Speak._numBytesPushed
+			indexes.append((indexNum, indexByte))
+		elif e.type==_H2R_Speak.H2R_SpeakEVENT_LIST_TERMINATED:
+			break
+	wav = string_at(wav, numsamples * sizeof(c_short)) if numsamples>0 else b""
+	prevByte = 0
+	for indexNum, indexByte in indexes:
+		player.feed(wav[prevByte:indexByte],
+			onDone=lambda indexNum=indexNum: _H2R_Speak.onIndexReached(indexNum))
+		prevByte = indexByte
+	player.feed(wav[prevByte:])
+	_H2R_Speak._numBytesPushed += len(wav)
+	return _H2R_Speak.CALLBACK_CONTINUE_SYNTHESIS
+
+legacyCallback = CFUNCTYPE(c_int, POINTER(c_short), c_int, POINTER(_H2R_Speak.H2R_Speak_EVENT))(_legacyCallback)
+
+def _queueCallback(wav, numsamples, event):
+	# The callback body before the ring buffer: each piece between indexes copied out and put on the feed queue.
+	S = _H2R_Speak
+	try:
+		if not S.isSpeaking or S._synthGeneration != S._generation:
+			return S.CALLBACK_ABORT_SYNTHESIS
+		indexes = None
+		i = 0
+		while True:
+			e = event[i]
+			eventType = e.type
+			if eventType == S.H2R_SpeakEVENT_LIST_TERMINATED:
+				break
+			if eventType == S.H2R_SpeakEVENT_MARK:
+				if indexes is None:
+					indexes = []
+				indexes.append((int(e.id.name), e.audio_position * S._sampleRate // S.MS_PER_SEC * S.BYTES_PER_SAMPLE - S._numBytesPushed))
+			i += 1
+		numBytes = numsamples * S.BYTES_PER_SAMPLE if numsamples > 0 else 0
+		generation = S._synthGeneration
+		prevByte = 0
+		if indexes is not None:
+			for indexNum, indexByte in indexes:
+				if indexByte < prevByte:
+					indexByte = prevByte
+				elif indexByte > numBytes:
+					indexByte = numBytes
+				S.feedQueue.put((generation, S.FEED_AUDIO, string_at(wav + prevByte, indexByte - prevByte), partial(S.onIndexReached, indexNum)))
+				prevByte = indexByte
+		S.feedQueue.put((generation, S.FEED_AUDIO, string_at(wav + prevByte, numBytes - prevByte), None))
+		S._numBytesPushed += numBytes
+		return S.CALLBACK_CONTINUE_SYNTHESIS
+	except:
+		S.log.error("callback FAILED", exc_info=True)
+
+queueCallback = CFUNCTYPE(c_int, c_void_p, c_int, POINTER(_H2R_Speak.H2R_Speak_EVENT))(_queueCallback)
+
+def makeEvents(numMarks):
+	"""@return: an event array with C{numMarks} marks spread over one buffer, then the terminator,
+	and the ms into the buffer of each mark.
+	"""
+	events = (_H2R_Speak.H2R_Speak_EVENT * (numMarks + 1))()
+	offsets = []
+	for i in range(numMarks):
+		events[i].type = _H2R_Speak.H2R_SpeakEVENT_MARK
+		offsets.append((i + 1) * 10 // (numMarks + 1))
+		events[i].id.name = str(i + 1).encode("ascii")
+	events[numMarks].type = _H2R_Speak.H2R_SpeakEVENT_LIST_TERMINATED
+	return events, offsets
+
+def _startSentence():
+	_H2R_Speak._numBytesPushed = 0
+	# There is no feeder, so the ring and feed queue are emptied for it.
+	_H2R_Speak._resetRing()
+	_H2R_Speak.feedQueue.queue.clear()
+
+def run(func, wav, events, offsets, number, streaming):
+	"""Times C{func} called with one buffer.
+	@param streaming: whether each call is the next buffer of a sentence of L{SENTENCE_BUFFERS} buffers, rather than the first.
+	"""
+	sentenceBytes = SENTENCE_BUFFERS * NUM_SAMPLES * sizeof(c_short)
+	marks = [events[i] for i in range(len(offsets))]
+	def once():
+		if not streaming or _H2R_Speak._numBytesPushed >= sentenceBytes:
+			_startSentence()
+		# Mark positions are ms since the start of the sentence.
+		startMs = _H2R_Speak._numBytesPushed // (16 * sizeof(c_short))
+		for e, offset in zip(marks, offsets):
+			e.audio_position = startMs + offset
+		return func(wav, NUM_SAMPLES, events)
+	# The callback logs and swallows its exceptions, and the fake log discards them,
+	# so a callback that fails would otherwise be timed as if it worked.
+	result = once()
+	if result != _H2R_Speak.CALLBACK_CONTINUE_SYNTHESIS:
+		raise RuntimeError("%s returned %r rather than continuing synthesis" % (getattr(func, "__name__", func), result))
+	seconds = benchCommon.timePerCall(once, number)
+	tracemalloc.start()
+	once()
+	tracemalloc.reset_peak()
+	current = tracemalloc.get_traced_memory()[0]
+	once()
+	peak = tracemalloc.get_traced_memory()[1] - current
+	tracemalloc.stop()
+	return seconds, peak
+
+def main(number=20000):
+	_H2R_Speak.player = fakeNvda.FakeWavePlayer(1, 16000, 16)
+	_H2R_Speak.onIndexReached = lambda index: None
+	_H2R_Speak.isSpeaking = True
+	# The callback hands audio to the feeder through the feed queue, which there is no pipeline here to create.
+	_H2R_Speak.feedQueue = queue.Queue()
+	wav = (c_short * NUM_SAMPLES)()
+	print("%-28s %10s %10s %10s %12s %12s %12s" % ("events", "legacy us", "queue us", "ring us", "legacy peak", "queue peak", "ring peak"))
+	for streaming in (False, True):
+		for numMarks in (0, 1, 4):
+			events, offsets = makeEvents(numMarks)
+			legacySeconds, legacyPeak = run(legacyCallback, wav, events, offsets, number, streaming)
+			queueSeconds, queuePeak = run(queueCallback, wav, events, offsets, number, streaming)
+			newSeconds, newPeak = run(_H2R_Speak.callback, wav, events, offsets, number, streaming)
+			print("%-28s %10.2f %10.2f %10.2f %12d %12d %12d" % (
+				"%d marks, %s" % (numMarks, "streaming" if streaming else "first buffer"),
+				legacySeconds * 1e6, queueSeconds * 1e6, newSeconds * 1e6, legacyPeak, queuePeak, newPeak))
+	print("peaks are in bytes")
+
+if __name__ == "__main__":
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchCallerThread.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Time spent on NVDA's thread in each SynthDriver entry point, through a fake engine whose voice loads are slow.
+Each call is made with the synthesis thread idle, which is when engine calls used to be made on the calling thread.
+Run with $H2R_SOURCE_DIR set to a copy of an earlier revision to compare.
+Usage: python benchCallerThread.py [calls] [voiceLoadMs]
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install("hi")
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from speech.commands import IndexCommand
+
+LANGUAGES = ("en", "hi", "ta")
+INIT_DELAY = 0.05
+
+def _makeVoices(directory):
+	languagesDir = os.path.join(directory, "Hear2Read", "Languages")
+	os.makedirs(languagesDir)
+	for language in LANGUAGES:
+		fakeNvda.writeVoiceFile(os.path.join(languagesDir, "H2R_%s_voice_Male.flitevox" % language), language)
+
+def _idle():
+	"""Waits for the synthesis thread to run everything queued and the player to be fed."""
+	S = _H2R_Speak
+	S.bgQueue.join()
+	while not S.feedQueue.empty():
+		time.sleep(0.001)
+
+def _timed(times, name, func, *args):
+	start = time.perf_counter()
+	func(*args)
+	times.setdefault(name, []).append(time.perf_counter() - start)
+
+def main():
+	numCalls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+	voiceLoadMs = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+	S = _H2R_Speak
+	directory = tempfile.mkdtemp()
+	try:
+		_makeVoices(directory)
+		os.environ["ALLUSERSPROFILE"] = directory
+		dll = fakeNvda.FakeEngineDLL(S, startDelay=0.002, msPerChar=10, realTimeFactor=100.0, initDelay=INIT_DELAY, setVoiceDelay=voiceLoadMs / 1000)
+		S.cdll = fakeNvda.FakeCdll(dll)
+		driverModule = importlib.import_module("synthDrivers.Hear2Read voices")
+		times = {}
+		start = time.perf_counter()
+		driver = driverModule.SynthDriver()
+		times["__init__"] = [time.perf_counter() - start]
+		_idle()
+		for i in range(numCalls):
+			_timed(times, "voice", setattr, driver, "voice", LANGUAGES[i % len(LANGUAGES)])
+			_idle()
+			_timed(times, "rate", setattr, driver, "rate", i % 100)
+			_idle()
+			_timed(times, "rate read", getattr, driver, "rate")
+			_timed(times, "volume read", getattr, driver, "volume")
+			_timed(times, "speak", driver.speak, [u"नमस्ते, this is line %d." % i, IndexCommand(i)])
+			_timed(times, "cancel", driver.cancel)
+			_idle()
+		print("%d calls of each, voice loads take %.0f ms" % (numCalls, voiceLoadMs))
+		print("%-14s %10s %10s" % ("entry point", "p50", "max"))
+		for name, values in times.items():
+			print("%-14s %8.3fms %8.3fms" % (name, benchCommon.percentile(values, 50) * 1000, max(values) * 1000))
+		print("engine calls: SetVoice %d, GetParameter %d" % (dll.setVoiceCalls, dll.getParameterCalls))
+		driver.terminate()
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
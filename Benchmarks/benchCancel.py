@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchCancel.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Cost of stopping speech.
+First the time of one _H2R_Speak.stop call against the length of the queued say all backlog,
+compared with the stop that drained the queue.
+Then the time from each stop to the last of the stopped audio reaching the player,
+with rapid stops during a say all through a fake engine and a player paced to real time.
+Usage: python benchCancel.py [numStops]
+"""
+
+import queue
+import random
+import sys
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak, _H2R_metrics
+
+SENTENCE = u"यह एक लंबा वाक्य है जो पूरे पाठ को पढ़ते समय बोला जाता है। "
+
+def _legacyStop():
+	# The stop before generation based cancellation: drains the queue, requeuing parameter changes.
+	S = _H2R_Speak
+	S.isSpeaking = False
+	params = []
+	try:
+		while True:
+			item = S.bgQueue.get_nowait()
+			if item[0] not in (S._speak, S._speakCharacter, S._queueIndex):
+				params.append(item)
+			S.bgQueue.task_done()
+	except queue.Empty:
+		pass
+	for item in params:
+		S.bgQueue.put(item)
+	try:
+		while True:
+			S.feedQueue.get_nowait()
+	except queue.Empty:
+		pass
+	S.player.stop()
+
+def _fillBacklog(length):
+	S = _H2R_Speak
+	S.bgQueue = queue.Queue()
+	S.feedQueue = queue.Queue()
+	for i in range(length):
+		if i % 20 == 19:
+			S._execWhenDone(S._setParameter, S.H2R_SpeakRATE, 50, 0)
+		else:
+			S._queueSpeech(S._speak, SENTENCE)
+
+def benchStopCall():
+	_H2R_Speak.player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	for length in (10, 100, 1000, 10000):
+		for label, stopFunc in (("drain", _legacyStop), ("generation", _H2R_Speak.stop)):
+			elapsed = 0
+			number = 20
+			for i in range(number):
+				_fillBacklog(length)
+				start = time.perf_counter()
+				stopFunc()
+				elapsed += time.perf_counter() - start
+			benchCommon.report("stop, %s, backlog %d" % (label, length), elapsed / number)
+
+def benchCancelToSilence(numStops):
+	dll = fakeNvda.FakeEngineDLL(_H2R_Speak)
+	player = fakeNvda.PacedWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16, speed=4.0)
+	fakeNvda.startPipeline(_H2R_Speak, dll, player)
+	_H2R_metrics.reset()
+	random.seed(1)
+	for i in range(numStops):
+		_H2R_Speak.speak(SENTENCE * 40, "hi")
+		time.sleep(random.uniform(0.005, 0.1))
+		_H2R_Speak.stop()
+	time.sleep(0.2)
+	values = _H2R_metrics.summary(stage=_H2R_metrics.CANCEL_TO_SILENCE)
+	for key, summary in values.items():
+		print("%d stops" % summary["count"])
+		for name in ("p50", "p95", "p99", "max"):
+			benchCommon.report("cancel to silence " + name, summary[name], "ms")
+	fakeNvda.stopPipeline(_H2R_Speak)
+
+def main():
+	numStops = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	benchStopCall()
+	benchCancelToSilence(numStops)
+
+if __name__ == "__main__":
+	main()
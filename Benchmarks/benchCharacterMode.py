@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchCharacterMode.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Typed character echo latency: the time from the synth driver being handed a character
+to its first audio reaching the player, through a fake engine with a simulated synthesis speed.
+Compares speaking each character as an utterance, with and without the PCM cache,
+against the character mode glyph tables.
+Usage: python benchCharacterMode.py [numCharacters]
+"""
+
+import random
+import sys
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+
+#: Typed text, Hindi in Devanagari with digits and punctuation.
+TYPED_TEXT = u"नमस्ते दुनिया, यह एक परीक्षण है। 123 कमल गगन 45."
+
+class EchoPlayer(fakeNvda.FakeWavePlayer):
+	"""Notes when the first audio of each echo is fed."""
+
+	def __init__(self, *args, **kwargs):
+		super(EchoPlayer, self).__init__(*args, **kwargs)
+		self.firstFeed = threading.Event()
+		self.firstFeedTime = None
+
+	def feed(self, data, onDone=None):
+		if not self.firstFeed.is_set():
+			self.firstFeedTime = time.perf_counter()
+			self.firstFeed.set()
+		super(EchoPlayer, self).feed(data, onDone)
+
+def _measure(label, speakFunc, characters, player, done):
+	latencies = []
+	for char in characters:
+		done.clear()
+		player.firstFeed.clear()
+		start = time.perf_counter()
+		speakFunc(char, "hi")
+		player.firstFeed.wait()
+		latencies.append(player.firstFeedTime - start)
+		done.wait()
+	latencies.sort()
+	benchCommon.report(label + " p50", latencies[len(latencies) // 2], "ms")
+	benchCommon.report(label + " p95", latencies[int(len(latencies) * 0.95)], "ms")
+	return latencies
+
+def main():
+	numCharacters = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+	random.seed(1)
+	typed = [c for c in TYPED_TEXT if not c.isspace()]
+	characters = [random.choice(typed) for i in range(numCharacters)]
+	done = threading.Event()
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+
+	dll = fakeNvda.FakeEngineDLL(_H2R_Speak)
+	player = EchoPlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	_H2R_Speak.warmGlyphs = False
+	fakeNvda.startPipeline(_H2R_Speak, dll, player, onIndexReached)
+	_H2R_Speak._curVoicePath = "hi_kamal_m.flitevox"
+	_H2R_Speak._curLanguage = "hi"
+	print("%d typed characters, engine start delay %.0f ms" % (numCharacters, dll.startDelay * 1000))
+
+	maxBytes = _H2R_Speak.pcmCache.maxBytes
+	_H2R_Speak.pcmCache.maxBytes = 0
+	_measure("speak, no cache", _H2R_Speak.speak, characters, player, done)
+	_H2R_Speak.pcmCache.maxBytes = maxBytes
+	_measure("speak, PCM cache", _H2R_Speak.speak, characters, player, done)
+
+	_H2R_Speak.warmGlyphs = True
+	_H2R_Speak._scheduleGlyphWarmup()
+	warmStart = time.perf_counter()
+	while _H2R_Speak._glyphsToWarm or _H2R_Speak.bgQueue.unfinished_tasks:
+		time.sleep(0.01)
+	benchCommon.report("glyph table warm-up", time.perf_counter() - warmStart, "ms")
+	_measure("speakCharacter, glyph table", _H2R_Speak.speakCharacter, characters, player, done)
+	print(_H2R_Speak.glyphTables)
+	fakeNvda.stopPipeline(_H2R_Speak)
+
+if __name__ == "__main__":
+	main()
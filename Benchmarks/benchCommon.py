@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchCommon.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Helpers shared by the benchmark scripts.
+The add-on modules are imported as C{synthDrivers.<module>} from the Source directory,
+the same way NVDA imports them.
+"""
+
+import os
+import sys
+import time
+
+#: The Source directory the add-on is imported from, which $H2R_SOURCE_DIR overrides,
+#: for example to benchmark a copy of an earlier revision.
+SOURCE_DIR = os.environ.get("H2R_SOURCE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Source")
+
+def addSourceToPath():
+	path = os.path.normpath(SOURCE_DIR)
+	if path not in sys.path:
+		sys.path.insert(0, path)
+
+def timePerCall(func, number):
+	"""Runs C{func} C{number} times.
+	@return: the mean time of one call in seconds.
+	"""
+	start = time.perf_counter()
+	for i in range(number):
+		func()
+	return (time.perf_counter() - start) / number
+
+def percentile(values, pct):
+	"""@return: the C{pct} percentile of C{values} by the nearest rank, or C{None} if there are none."""
+	if not values:
+		return None
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+def report(label, seconds, unit="us"):
+	scale = {"s": 1, "ms": 1e3, "us": 1e6}[unit]
+	print("%-48s %12.3f %s" % (label, seconds * scale, unit))
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchIndexSkew.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Index skew during say all: how long before or after playback reaches an index NVDA is told about it.
+Speaks sentences separated by index commands through a fake engine and a buffered player on a simulated clock,
+comparing indexes fired when the synthesis thread reaches them with indexes fired by the player.
+Usage: python benchIndexSkew.py [numSentences]
+"""
+
+import sys
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+
+SENTENCES = (
+	u"Hear2Read voices speak Indian languages",
+	u"The next line of the document follows here",
+	u"Say all moves the caret as it reads",
+	u"Each sentence ends with an index command",
+)
+
+def _run(label, queueIndexFactory, numSentences):
+	S = _H2R_Speak
+	done = threading.Event()
+	fired = {}
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+		else:
+			fired[index] = time.perf_counter()
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0.005, msPerChar=20, realTimeFactor=20.0)
+	player = fakeNvda.BufferedWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16, bufferSeconds=0.3, speed=4.0)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.pcmCache.clear()
+	positions = {}
+	originalQueueIndex = S._queueIndex
+	S._queueIndex = queueIndexFactory(dll, positions, originalQueueIndex)
+	try:
+		for i in range(numSentences):
+			S.speak(u"%s number %d." % (SENTENCES[i % len(SENTENCES)], i), "en")
+			S.sendIndex(i + 1)
+		done.wait()
+	finally:
+		S._queueIndex = originalQueueIndex
+	skews = sorted(fired[index] - player.timeAtByte(positions[index]) for index in positions if index in fired)
+	print("%s: %d of %d indexes fired" % (label, len(skews), numSentences))
+	benchCommon.report("  skew p50", skews[len(skews) // 2], "ms")
+	benchCommon.report("  skew min (early)", skews[0], "ms")
+	benchCommon.report("  skew max (late)", skews[-1], "ms")
+	fakeNvda.stopPipeline(S)
+
+def _synthesisThreadIndex(dll, positions, originalQueueIndex):
+	# The index fires as the synthesis thread reaches it, as sendIndex did before indexes went through the player.
+	def queueIndex(index):
+		positions[index] = dll.bytesProduced
+		_H2R_Speak.onIndexReached(index)
+	return queueIndex
+
+def _playbackIndex(dll, positions, originalQueueIndex):
+	def queueIndex(index):
+		positions[index] = dll.bytesProduced
+		originalQueueIndex(index)
+	return queueIndex
+
+def main():
+	numSentences = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+	_run("fired by the synthesis thread", _synthesisThreadIndex, numSentences)
+	_run("fired by the player", _playbackIndex, numSentences)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchNormalizer.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Time per character of text normalization (synthDrivers._H2R_normalizer) on prose and on text full of
+numbers, URLs, emoji, control characters and pathological runs: normalizing every time, on a cache miss and on a cache hit,
+against passing the text through unchanged as _processText did and against encoding it for the engine.
+Also shows the longest run without white space the engine is given before and after normalization.
+Usage: python benchNormalizer.py [repeat]
+"""
+
+import random
+import sys
+import time
+
+import benchCommon
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_normalizer
+
+def _lines(seed, count, make):
+	rng = random.Random(seed)
+	return [make(rng, i) for i in range(count)]
+
+CORPORA = (
+	("English prose", "en", _lines(1, 200, lambda rng, i: u"Line %d: the screen reader reads each line of the document aloud, quickly and clearly." % i)),
+	("Hindi prose", "hi", _lines(2, 200, lambda rng, i: u"पंक्ति %d: नदी में पानी बहुत था, इसलिए नाव नहीं चली और हम किनारे पर रुके।" % i)),
+	("numbers and money", "hi", _lines(3, 200, lambda rng, i: u"कुल ₹%s, यानी %d%% ज़्यादा, खाता %d।" % (
+		u"{:,}".format(rng.randrange(10 ** 7)), rng.randrange(100), rng.randrange(10 ** 11)))),
+	("URLs", "en", _lines(4, 200, lambda rng, i: u"See https://www.example.org/docs/page_%d.html?lang=en&id=%d for details." % (i, rng.randrange(10 ** 6)))),
+	("emoji and controls", "en", _lines(5, 200, lambda rng, i: u"Great\x01 news \U0001F468‍\U0001F469‍\U0001F467\U0001F3FD %s️\x0b done" % (u"\U0001F602" * rng.randrange(2, 30)))),
+	("pathological runs", "en", _lines(6, 50, lambda rng, i: u"".join(rng.choice(u"0123456789") for j in range(500)) + u" " + u"-" * 200 + u"!" * 50)),
+)
+
+def _perChar(func, lines, repeat):
+	chars = sum(len(line) for line in lines)
+	start = time.perf_counter()
+	for i in range(repeat):
+		for line in lines:
+			func(line)
+	return (time.perf_counter() - start) / (chars * repeat)
+
+def _report(label, seconds):
+	print("%-48s %12.1f ns" % (label, seconds * 1e9))
+
+def _longestRun(lines):
+	return max(len(word) for line in lines for word in line.split())
+
+def main():
+	repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	for name, language, lines in CORPORA:
+		normalizer = _H2R_normalizer.getNormalizer(language)
+		print("%s, %d chars" % (name, sum(len(line) for line in lines)))
+		_report("  unchanged, per char", _perChar(lambda text: text, lines, repeat))
+		_report("  encode for the engine, per char", _perChar(lambda text: text.encode("utf8", errors="ignore"), lines, repeat))
+		_report("  normalize, per char", _perChar(normalizer.normalize, lines, repeat))
+		misses = _H2R_normalizer.NormalizationCache()
+
+		def miss(text):
+			misses.clear()
+			return misses.normalize(text, language)
+
+		_report("  cache miss, per char", _perChar(miss, lines, repeat))
+		cache = _H2R_normalizer.NormalizationCache()
+		for line in lines:
+			cache.normalize(line, language)
+		_report("  cache hit, per char", _perChar(lambda text: cache.normalize(text, language), lines, repeat))
+		print("  longest run without white space: %d chars before, %d after" % (
+			_longestRun(lines), _longestRun([normalizer.normalize(line) for line in lines])))
+
+if __name__ == "__main__":
+	main()
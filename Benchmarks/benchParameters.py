@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchParameters.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Engine parameter calls while dragging the rate and volume sliders.
+Each slider step sets the parameter, reads it back as the settings dialog does, and speaks the new value.
+Compares queuing one engine call per step and reading from the engine with the parameter store.
+Usage: python benchParameters.py [numSteps]
+"""
+
+import sys
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+
+#: (name, seconds between slider steps, steps per spoken value) for each way of moving a slider.
+SCENARIOS = (
+	("arrow keys", 0.02, 1),
+	("mouse drag", 0.002, 10),
+)
+
+def _legacySetParameter(param, value, relative):
+	_H2R_Speak._execWhenDone(_H2R_Speak._setParameter, param, value, relative)
+
+def _legacyGetParameter(param, current):
+	return _H2R_Speak.H2R_SpeakDLL.H2R_Speak_GetParameter(param, current)
+
+def _drag(label, setParameter, getParameter, numSteps, stepInterval, speakEvery):
+	S = _H2R_Speak
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0.001, msPerChar=20)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	S.paramStore = S.ParameterStore()
+	fakeNvda.startPipeline(S, dll, player)
+	callerTime = 0
+	for step in range(numSteps):
+		param = S.H2R_SpeakRATE if step % 2 else S.H2R_SpeakVOLUME
+		start = time.perf_counter()
+		setParameter(param, step % 100, 0)
+		getParameter(param, 1)
+		callerTime += time.perf_counter() - start
+		if step % speakEvery == speakEvery - 1:
+			S.stop()
+			S.speak(str(step % 100), "en")
+		time.sleep(stepInterval)
+	while S.bgQueue.unfinished_tasks:
+		time.sleep(0.01)
+	print("%-36s setParameter calls %5d, getParameter calls %5d, %.2f us per step on the caller's thread" % (
+		label, dll.setParameterCalls, dll.getParameterCalls, callerTime / numSteps * 1e6))
+	fakeNvda.stopPipeline(S)
+
+def main():
+	numSteps = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	for name, stepInterval, speakEvery in SCENARIOS:
+		_drag(name + ", queued per step", _legacySetParameter, _legacyGetParameter, numSteps, stepInterval, speakEvery)
+		_drag(name + ", parameter store", _H2R_Speak.setParameter, _H2R_Speak.getParameter, numSteps, stepInterval, speakEvery)
+		print(_H2R_Speak.paramStore)
+
+if __name__ == "__main__":
+	main()
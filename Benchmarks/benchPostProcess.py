@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchPostProcess.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Post-processing of 10 ms engine buffers at 3 times speed with gain, against the real time budget:
+at 3 times speed a second of synthesized audio plays in a third of a second, which is all the time there is to process it.
+Also reports the added latency, how far index callbacks land from where they should,
+and the audio and indexes of a say all through the feeder with rate boost.
+Needs numpy.
+Usage: python benchPostProcess.py [seconds]
+"""
+
+import math
+import sys
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers import _H2R_postProcess
+from synthDrivers._H2R_plan import PlanBuilder
+
+SPEED = 3.0
+GAIN = 1.5
+#: Bytes per engine buffer, 10 ms at 16 kHz.
+BUFFER_BYTES = 320
+#: An index every this many buffers.
+INDEX_EVERY = 50
+
+def makeSpeechLike(seconds, sampleRate):
+	"""@return: 16 bit PCM of voiced sound with a gliding pitch and syllable rate amplitude changes."""
+	numpy = _H2R_postProcess.numpy
+	t = numpy.arange(int(seconds * sampleRate)) / float(sampleRate)
+	pitch = 120 + 30 * numpy.sin(2 * math.pi * 0.7 * t)
+	phase = 2 * math.pi * numpy.cumsum(pitch) / sampleRate
+	voice = sum(numpy.sin(h * phase) / h for h in range(1, 8))
+	envelope = 0.5 + 0.5 * numpy.sin(2 * math.pi * 4 * t)
+	return (6000 * voice * envelope).astype("<i2").tobytes()
+
+def _process(audio, sampleRate, speed, gain):
+	processor = _H2R_postProcess.PostProcessor(sampleRate, speed, gain)
+	bytesPerMS = sampleRate * 2 / 1000.0
+	out = 0
+	lags = []
+	errors = []
+	times = []
+
+	def fired(inputByte):
+		# Where the index landed in the output, against where its input position scales to.
+		errors.append(abs(out - inputByte / speed) / bytesPerMS)
+
+	for i in range(0, len(audio), BUFFER_BYTES):
+		onDone = None
+		if (i // BUFFER_BYTES) % INDEX_EVERY == INDEX_EVERY - 1:
+			onDone = lambda inputByte=i + BUFFER_BYTES: fired(inputByte)
+		start = time.perf_counter()
+		pieces = processor.feed(audio[i:i + BUFFER_BYTES], onDone)
+		times.append(time.perf_counter() - start)
+		for data, pieceOnDone in pieces:
+			out += len(data)
+			if pieceOnDone:
+				pieceOnDone()
+		# The input not yet output, in ms of output.
+		lags.append(((i + BUFFER_BYTES) / speed - out) / bytesPerMS)
+	for data, pieceOnDone in processor.flush():
+		out += len(data)
+		if pieceOnDone:
+			pieceOnDone()
+	return out, sum(times), times, lags, errors
+
+def _run(seconds, sampleRate, speed, gain):
+	audio = makeSpeechLike(seconds, sampleRate)
+	out, total, times, lags, errors = _process(audio, sampleRate, speed, gain)
+	budget = seconds / speed
+	print("%d Hz, speed %.1f, gain %.1f: %.2f s in, %.2f s out, %.1f ms to process, %.2f%% of the %.2f s real time budget" % (
+		sampleRate, speed, gain, seconds, out / (sampleRate * 2.0), total * 1000, total / budget * 100, budget))
+	benchCommon.report("  per 10 ms buffer p50", benchCommon.percentile(times, 50))
+	benchCommon.report("  per 10 ms buffer p99", benchCommon.percentile(times, 99))
+	print("  added latency %.1f ms max, index error %.1f ms max" % (max(lags), max(errors) if errors else 0))
+
+def _sayAll(speed):
+	"""Speaks lines with indexes through the feeder with rate boost, checking that every index fires in order."""
+	S = _H2R_Speak
+	done = threading.Event()
+	fired = []
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+		else:
+			fired.append(index)
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0, msPerChar=60, realTimeFactor=200.0)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.pcmCache.maxBytes = 0
+	S.setPostProcessing(speed=speed)
+	builder = PlanBuilder("en")
+	for i in range(20):
+		builder.text(u"Line %d of the chapter, read at a rate beyond the engine." % i)
+		builder.index(i + 1)
+	start = time.perf_counter()
+	S.speakPlan(builder.build())
+	done.wait()
+	elapsed = time.perf_counter() - start
+	S.setPostProcessing(speed=1)
+	print("say all at speed %.1f: %.2f s synthesized, %.2f s fed, indexes %s, %.0f ms" % (
+		speed, dll.bytesProduced / 32000.0, player.bytesFed / 32000.0,
+		"in order" if fired == list(range(1, 21)) else "WRONG %r" % fired, elapsed * 1000))
+	fakeNvda.stopPipeline(S)
+
+def main():
+	if not _H2R_postProcess.available:
+		print("Post-processing needs numpy")
+		return
+	seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+	_run(seconds, 16000, 1.0, GAIN)
+	_run(seconds, 16000, SPEED, 1.0)
+	_run(seconds, 16000, SPEED, GAIN)
+	_run(seconds, 22050, SPEED, GAIN)
+	_sayAll(SPEED)
+
+if __name__ == "__main__":
+	main()
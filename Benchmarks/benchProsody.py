@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchProsody.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Engine calls for prosody and pauses in speech plans.
+Spells words with capitals at a raised pitch, as NVDA does, comparing setting every parameter before each segment
+with sending only the parameters that change, then speaks text with pauses, which are generated as silence.
+Usage: python benchProsody.py [numWords] [numSequences]
+"""
+
+import sys
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers._H2R_plan import PlanBuilder
+
+WORDS = (u"NVDA", u"Hear2Read", u"McDonald", u"USB", u"iPhone", u"Delhi", u"OK", u"PowerShell")
+
+#: The pitch multiplier for capitals, as a capital pitch change of 30 at a pitch of 50.
+CAPITAL_PITCH = 1.6
+
+def _legacyApplyParameters():
+	S = _H2R_Speak
+	for param, value, relative in S.paramStore.takePending():
+		S._baseParams[param] = value
+	for param, base in S._baseParams.items():
+		S._setParameter(param, S._effectiveValue(param, base), 0)
+
+def spellingPlan(numWords):
+	builder = PlanBuilder("en")
+	builder.characterMode(True)
+	for i in range(numWords):
+		for char in WORDS[i % len(WORDS)]:
+			if char.isupper():
+				builder.prosody("pitch", CAPITAL_PITCH)
+				builder.text(char)
+				builder.prosody("pitch", 1)
+			else:
+				builder.text(char)
+		builder.index(i + 1)
+	return builder.build()
+
+def pausePlan(numWords):
+	builder = PlanBuilder("en")
+	for i in range(numWords):
+		builder.text(u"Item %d, %s." % (i + 1, WORDS[i % len(WORDS)]))
+		builder.pause(250)
+		builder.index(i + 1)
+	return builder.build()
+
+def _run(label, plan, numSequences, applyParameters=None):
+	S = _H2R_Speak
+	done = threading.Event()
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0, msPerChar=1, realTimeFactor=1000.0)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.pcmCache.maxBytes = 0
+	S.paramStore = S.ParameterStore()
+	for param in (S.H2R_SpeakRATE, S.H2R_SpeakVOLUME, S.H2R_SpeakPITCH):
+		S.paramStore.set(param, 50, 0)
+	realApplyParameters = S._applyParameters
+	if applyParameters:
+		S._applyParameters = applyParameters
+	try:
+		start = time.perf_counter()
+		for i in range(numSequences):
+			done.clear()
+			S.speakPlan(plan)
+			done.wait()
+		total = time.perf_counter() - start
+	finally:
+		S._applyParameters = realApplyParameters
+	audioSeconds = player.bytesFed / (S._sampleRate * S.BYTES_PER_SAMPLE) / numSequences
+	print("%-34s %5d setParameter calls, %4d synthesizeText calls, %5.2f s of audio, %7.2f ms until done per sequence" % (
+		label, dll.setParameterCalls // numSequences, dll.synthesizeCalls // numSequences, audioSeconds, total / numSequences * 1000))
+	fakeNvda.stopPipeline(S)
+
+def _timeSilence(numBreaks):
+	"""@return: the synthesis thread's time per 250 ms pause."""
+	S = _H2R_Speak
+	dll = fakeNvda.FakeEngineDLL(S)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player)
+	start = time.perf_counter()
+	for i in range(numBreaks):
+		S._queueSilence(250)
+	elapsed = time.perf_counter() - start
+	fakeNvda.stopPipeline(S)
+	return elapsed / numBreaks
+
+def main():
+	numWords = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+	numSequences = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+	plan = spellingPlan(numWords)
+	print("Spelling %d words, %d plan steps" % (numWords, len(plan.steps)))
+	_run("  every parameter per segment", plan, numSequences, _legacyApplyParameters)
+	_run("  changed parameters only", plan, numSequences)
+	plan = pausePlan(numWords)
+	print("%d items with 250 ms pauses, %d plan steps" % (numWords, len(plan.steps)))
+	_run("  pauses as silence", plan, numSequences)
+	benchCommon.report("  synthesis thread time per pause", _timeSilence(1000))
+
+if __name__ == "__main__":
+	main()
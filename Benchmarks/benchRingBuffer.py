@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchRingBuffer.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Feeding engine audio to the player through the PCM ring buffer at several block sizes.
+A fake engine delivers 10 ms buffers with index marks inside sentences, so a 10 ms block is close to
+feeding each buffer as it came, as the feeder did before the ring.
+Reports player feed calls and feed queue items per second of audio, CPU time per second of audio,
+how full the ring got and how far each index callback is from the byte position of its mark.
+Usage: python benchRingBuffer.py [numSentences]
+"""
+
+import sys
+import threading
+import time
+from ctypes import addressof
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak, _H2R_metrics
+
+#: The block sizes compared, in ms.
+BLOCK_MS = (10, 50, 100, 200)
+#: Numbered, and with no comma to split it at, so no sentence comes from the PCM cache with the index numbers of another.
+SENTENCE = u"Sentence %d of this say all is spoken by Hear2Read voices in one of the Indian languages."
+
+class MarkingEngineDLL(fakeNvda.FakeEngineDLL):
+	"""A fake engine which also delivers an index mark in every C{markEveryBlocks}th buffer,
+	part way into it, and remembers the byte position in the speech of each mark.
+	"""
+
+	def __init__(self, speakModule, markEveryBlocks=7, **kwargs):
+		super(MarkingEngineDLL, self).__init__(speakModule, **kwargs)
+		self.markEveryBlocks = markEveryBlocks
+		#: The byte position in the speech of each mark, by index.
+		self.markPositions = {}
+		self._nextIndex = 1
+		self._markEvents = (speakModule.H2R_Speak_EVENT * 2)()
+		self._markEvents[0].type = speakModule.H2R_SpeakEVENT_MARK
+		self._markEvents[1].type = speakModule.H2R_SpeakEVENT_LIST_TERMINATED
+
+	def H2R_Speak_synthesizeText(self, text):
+		S = self.speakModule
+		self.synthesizeCalls += 1
+		callback = S.callback
+		time.sleep(self.startDelay)
+		numBlocks = max(1, len(text.decode("utf8")) * self.msPerChar // 10)
+		blockDelay = 0.01 / self.realTimeFactor
+		utteranceStart = self.bytesProduced
+		for i in range(numBlocks):
+			time.sleep(blockDelay)
+			events = self._events
+			if i % self.markEveryBlocks == self.markEveryBlocks - 1:
+				# 3 ms into this 10 ms buffer.
+				positionMs = i * 10 + 3
+				self._markEvents[0].id.name = str(self._nextIndex).encode("ascii")
+				self._markEvents[0].audio_position = positionMs
+				self.markPositions[self._nextIndex] = utteranceStart + S._msToBytes(positionMs)
+				self._nextIndex += 1
+				events = self._markEvents
+			if callback(addressof(self._block), self.BLOCK_SAMPLES, events):
+				return 0
+			self.bytesProduced += self.BLOCK_SAMPLES * 2
+		callback(None, 0, self._events)
+		return 0
+
+class PositionPlayer(fakeNvda.FakeWavePlayer):
+	"""Counts what is fed to it, and records the bytes fed when each index callback is run."""
+
+	def __init__(self, *args, **kwargs):
+		super(PositionPlayer, self).__init__(*args, **kwargs)
+		self.reached = {}
+
+	def feed(self, data, onDone=None):
+		self.feedCalls += 1
+		self.bytesFed += len(data)
+		if onDone:
+			onDone()
+
+def _run(blockMs, numSentences):
+	S = _H2R_Speak
+	done = threading.Event()
+	player = PositionPlayer(1, 16000, 16)
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+		else:
+			player.reached[index] = player.bytesFed
+
+	dll = MarkingEngineDLL(S, startDelay=0.001, msPerChar=60, realTimeFactor=1000.0)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.feedBlockMs = blockMs
+	S.trimSilence = False
+	S.pcmCache.clear()
+	_H2R_metrics.reset()
+	publishes = [0]
+	originalPublishRing = S._publishRing
+
+	def publishRing(generation):
+		if (S.ringBuffer.writePos, S.ringBuffer.markCount) != S._ringPublished:
+			publishes[0] += 1
+		originalPublishRing(generation)
+
+	S._publishRing = publishRing
+	try:
+		cpuStart = time.process_time()
+		for i in range(numSentences):
+			S.speak(SENTENCE % i, "en")
+		done.wait()
+		cpu = time.process_time() - cpuStart
+	finally:
+		S._publishRing = originalPublishRing
+	audioSeconds = player.bytesFed / (player.samplesPerSec * 2.0)
+	errors = [abs(player.reached.get(index, -1) - position) for index, position in dll.markPositions.items()]
+	feedCallRate = _H2R_metrics.getHistogram(_H2R_metrics.FEED_CALL_RATE, None, None)
+	fill = _H2R_metrics.getHistogram(_H2R_metrics.RING_BUFFER_FILL, None, None)
+	print("%8d %12.1f %12.1f %12.1f %12.2f %9.1f%% %9.1f%% %8d %8d" % (
+		blockMs, player.feedCalls / audioSeconds, feedCallRate.percentile(50), publishes[0] / audioSeconds,
+		cpu * 1000 / audioSeconds, fill.percentile(99) * 100, S.ringBuffer.maxUsed * 100.0 / S.ringBuffer.capacity,
+		len(errors), max(errors)))
+	fakeNvda.stopPipeline(S)
+
+def main():
+	numSentences = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	print("%d sentences, %d ms of audio each" % (numSentences, len(SENTENCE % 0) * 60))
+	print("%8s %12s %12s %12s %12s %10s %10s %8s %8s" % (
+		"block ms", "feeds/s", "metric /s", "queued/s", "cpu ms/s", "fill p99", "fill max", "indexes", "err bytes"))
+	for blockMs in BLOCK_MS:
+		_run(blockMs, numSentences)
+	print("per second of audio; err bytes is the largest distance of an index callback from its mark")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchScripts.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Throughput of script run routing (synthDrivers._H2R_scripts) on lines of text mixing Indian scripts and Latin,
+as on Indian web pages, and on text in one script, against a character loop looking scripts up by Unicode character name.
+Also counts the voice switches a line needs with short runs merged and without,
+and checks that speech sequences with a short acronym item speak it without switching voices.
+Usage: python benchScripts.py [kilobytes]
+"""
+
+import sys
+import time
+import unicodedata
+
+import benchCommon
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_scripts
+
+#: The voices taken to be installed.
+LANGUAGES = ("en", "hi", "mr", "bn", "ta", "te", "kn", "ml", "gu", "pa", "or")
+
+SAMPLES = (
+	("English", "en", u"The quick brown fox jumps over the lazy dog, and the clerk agreed that it was fair."),
+	("Hindi", "hi", u"भारत एक विशाल देश है। यहाँ अनेक भाषाएँ बोली जाती हैं, और हर राज्य की अपनी संस्कृति है।"),
+	("Hindi with acronyms", "hi", u"अपनी PDF फ़ाइल को NVDA से पढ़ें, फिर OK दबाएँ और ID नंबर 1234 लिखें।"),
+	("Hindi and English", "hi", u"आज का मौसम: Partly cloudy with light rain in the evening. कल धूप निकलेगी।"),
+	("Tamil and English", "ta", u"தமிழ் செய்திகள் - Latest news from Chennai and Madurai. மேலும் படிக்க Click here."),
+	("many scripts", "hi", u"भाषा चुनें: English | हिन्दी | বাংলা | தமிழ் | తెలుగు | ಕನ್ನಡ | മലയാളം | ગુજરાતી | ਪੰਜਾਬੀ | ଓଡ଼ିଆ"),
+)
+
+#: Speech sequences, with the language of the voice in use, whose short runs must not switch voices.
+SHORT_RUN_SEQUENCES = (
+	("hi", (u"बटन", u"OK", u"दबाएँ")),
+	("hi", (u"OK",)),
+	("hi", (u"फ़ाइल", u"PDF")),
+	("ta", (u"சரி", u"ID", u"எண்")),
+)
+
+_SCRIPT_NAMES = dict((name.upper(), script) for script, name in _H2R_scripts.SCRIPT_NAMES.items())
+
+def characterLoopRuns(text):
+	"""Splits C{text} into runs of one script by the first word of each character's Unicode name, in a Python loop."""
+	runs = []
+	script = None
+	start = 0
+	for i, ch in enumerate(text):
+		name = unicodedata.name(ch, "")
+		chScript = _SCRIPT_NAMES.get(name.split(" ", 1)[0], _H2R_scripts.COMMON)
+		if chScript != _H2R_scripts.COMMON and chScript != script:
+			if script is not None:
+				runs.append((script, start, i))
+				start = i
+			script = chScript
+	runs.append((script, start, len(text)))
+	return runs
+
+def _time(func, lines):
+	start = time.perf_counter()
+	for line in lines:
+		func(line)
+	return time.perf_counter() - start
+
+def _switches(routes, language):
+	"""@return: the voice switches speaking the runs of each of C{routes} in order takes, starting with the voice for C{language}."""
+	switches = 0
+	current = language
+	for runs in routes:
+		for runLanguage, run in runs:
+			if runLanguage is not None and runLanguage != current:
+				switches += 1
+				current = runLanguage
+	return switches
+
+def main(kilobytes=512):
+	router = _H2R_scripts.ScriptRouter(LANGUAGES)
+	unmerged = _H2R_scripts.ScriptRouter(LANGUAGES, minRunChars=1)
+	print("%-20s %8s %12s %12s %9s %12s %12s" % ("corpus", "lines", "loop MB/s", "router MB/s", "speedup", "switches", "unmerged"))
+	for name, language, sample in SAMPLES:
+		count = int(kilobytes * 1024 // len(sample.encode("utf8"))) + 1
+		# Numbered, as lines on a page differ.
+		lines = [u"%d. %s" % (i, sample) for i in range(count)]
+		megabytes = sum(len(line.encode("utf8")) for line in lines) / (1024.0 * 1024)
+		loopTime = _time(characterLoopRuns, lines)
+		routerTime = _time(lambda line: router.split(line, language), lines)
+		print("%-20s %8d %12.2f %12.2f %8.1fx %12.2f %12.2f" % (
+			name, count, megabytes / loopTime, megabytes / routerTime, loopTime / routerTime,
+			_switches([router.split(line, language) for line in lines], language) / float(count),
+			_switches([unmerged.split(line, language) for line in lines], language) / float(count)))
+	print("switches are per line")
+	for language, texts in SHORT_RUN_SEQUENCES:
+		routes = router.splitSequence(texts, language)
+		if _switches(routes, language):
+			raise RuntimeError("Voice switches for a short run in %r: %r" % (texts, routes))
+	print("no voice switches for a short run in %d sequences" % len(SHORT_RUN_SEQUENCES))
+
+if __name__ == "__main__":
+	main(float(sys.argv[1]) if len(sys.argv) > 1 else 512)
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchSegmenter.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Segmentation throughput of L{_H2R_segmenter} against the character loop it replaced,
+on multi-megabyte Hindi, Tamil, Bengali and English corpora.
+Usage: python benchSegmenter.py [megabytes]
+"""
+
+import sys
+import time
+
+import benchCommon
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_segmenter
+
+SAMPLES = {
+	"hi": u"भारत एक विशाल देश है। यहाँ अनेक भाषाएँ बोली जाती हैं, और हर राज्य की अपनी संस्कृति है। डॉ. शर्मा ने कहा कि शिक्षा सबसे ज़रूरी है! क्या आप सहमत हैं? मूल्य 3.50 रुपये है॥ ",
+	"ta": u"தமிழ் ஒரு பழமையான மொழி. இது இந்தியா, இலங்கை மற்றும் சிங்கப்பூரில் பேசப்படுகிறது. திரு. ராமன் நாளை வருவார்! நீங்கள் வருவீர்களா? விலை 2.75 ரூபாய்; சரி. ",
+	"bn": u"বাংলা একটি সমৃদ্ধ ভাষা। এটি বাংলাদেশ ও ভারতে কথিত হয়, এবং এর সাহিত্য বিখ্যাত। মো. করিম আজ আসবেন! আপনি কি আসবেন? দাম ৩.৫০ টাকা। ",
+	"en": u"The quick brown fox jumps over the lazy dog. Dr. Smith paid $3.50, which was fair; the clerk agreed. Really? Yes! Wait... then what happened? ",
+}
+
+def legacyFindNextTerminator(string, start):
+	# The character loop that _H2R_Speak.speak used before the segmenter.
+	index = start
+	whitespace = { " ", "\r", "\t", "\n"  }
+	while (index < len(string)) :
+		if (string[index] == "." or
+		    string[index] == "!" or
+		    string[index] == "?" or
+		    string[index] == "," or
+		    string[index] == ";" or
+		    ord(string[index]) == 0x0964) :
+			if (string[index + 1] in whitespace) : break
+		index += 1
+	if start == index : return 0
+	return index
+
+def legacySegments(text):
+	segments = []
+	startIndex = 0
+	index = legacyFindNextTerminator(text, startIndex)
+	while ( index != 0 and index <= len(text) ):
+		sentence = text[startIndex : index + 1].strip()
+		if sentence != "" :
+			segments.append(sentence)
+		startIndex = index + 1
+		index = legacyFindNextTerminator(text, startIndex)
+	if startIndex < len(text) :
+		sentence = text[startIndex : ].strip()
+		if sentence != "" :
+			segments.append(sentence)
+	return segments
+
+def makeCorpus(sample, megabytes):
+	# Every sample ends in a space, as the legacy loop reads past the end of text ending in a terminator.
+	size = int(megabytes * 1024 * 1024)
+	return sample * (size // len(sample.encode("utf8")) + 1)
+
+def main(megabytes=2.0):
+	print("%-4s %10s %12s %12s %12s %12s %10s" % ("lang", "chars", "legacy MB/s", "new MB/s", "legacy segs", "new segs", "speedup"))
+	for language, sample in SAMPLES.items():
+		corpus = makeCorpus(sample, megabytes)
+		bytesLen = len(corpus.encode("utf8")) / (1024.0 * 1024)
+		start = time.perf_counter()
+		legacy = legacySegments(corpus)
+		legacyTime = time.perf_counter() - start
+		segmenter = _H2R_segmenter.getSegmenter(language)
+		start = time.perf_counter()
+		new = list(segmenter.iterSegments(corpus))
+		newTime = time.perf_counter() - start
+		print("%-4s %10d %12.2f %12.2f %12d %12d %9.1fx" % (
+			language, len(corpus), bytesLen / legacyTime, bytesLen / newTime, len(legacy), len(new), legacyTime / newTime))
+	# Incremental use: the same Hindi corpus fed in 4 KB blocks.
+	corpus = makeCorpus(SAMPLES["hi"], megabytes)
+	incremental = _H2R_segmenter.IncrementalSegmenter(_H2R_segmenter.getSegmenter("hi"))
+	start = time.perf_counter()
+	count = 0
+	for pos in range(0, len(corpus), 4096):
+		count += len(incremental.feed(corpus[pos:pos + 4096]))
+	count += len(incremental.flush())
+	elapsed = time.perf_counter() - start
+	print("hi incremental, 4096 character blocks: %d segments, %.2f MB/s" % (count, len(corpus.encode("utf8")) / (1024.0 * 1024) / elapsed))
+
+if __name__ == "__main__":
+	main(*[float(arg) for arg in sys.argv[1:]])
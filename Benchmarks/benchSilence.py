@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchSilence.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Listening time saved by silence trimming on a say all of a document,
+with a fake engine that puts silence before and after each sentence as the engine does.
+Reports the audio fed to the player and the silence before the first sound with and without trimming,
+and checks that each index still falls at the same point in the speech.
+Then checks that a quiet onset before loud speech is kept at each volume.
+Needs numpy.
+Usage: python benchSilence.py [numSentences] [leadSilenceMs] [trailSilenceMs]
+"""
+
+import sys
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers._H2R_plan import PlanBuilder
+from synthDrivers._H2R_postProcess import SilenceTrimmer, numpy
+
+SENTENCES = (
+	u"The river was high that spring, and the ferry did not run.",
+	u"We waited on the bank.",
+	u"Boats passed, one every few minutes, heavy with sand from upstream.",
+	u"Nobody spoke.",
+	u"By noon the water had started to fall, and the ferryman came down to look at it.",
+)
+
+class SoundPlayer(fakeNvda.FakeWavePlayer):
+	"""Counts the audio fed, the sound in it and how much sound came before each index callback."""
+
+	def __init__(self, *args, **kwargs):
+		super(SoundPlayer, self).__init__(*args, **kwargs)
+		#: The bytes fed before the first sound, or C{None}.
+		self.silenceBeforeSound = None
+		#: The non zero samples fed so far.
+		self.soundSamples = 0
+
+	def feed(self, data, onDone=None):
+		if data:
+			samples = numpy.frombuffer(data, "<i2")
+			nonZero = numpy.flatnonzero(samples)
+			if len(nonZero) and self.silenceBeforeSound is None:
+				self.silenceBeforeSound = self.bytesFed + int(nonZero[0]) * 2
+			self.soundSamples += len(nonZero)
+		super(SoundPlayer, self).feed(data, onDone)
+
+def makePlan(numSentences):
+	builder = PlanBuilder("en")
+	for i in range(numSentences):
+		builder.text(SENTENCES[i % len(SENTENCES)])
+		builder.index(i + 1)
+	return builder.build()
+
+def _run(trim, plan, leadSilence, trailSilence):
+	"""@return: the player and the sound samples fed before each index."""
+	S = _H2R_Speak
+	done = threading.Event()
+	soundAtIndex = {}
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0, msPerChar=60, realTimeFactor=500.0, leadSilence=leadSilence, trailSilence=trailSilence)
+	player = SoundPlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+		else:
+			soundAtIndex[index] = player.soundSamples
+
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.pcmCache.maxBytes = 0
+	S.trimSilence = trim
+	start = time.perf_counter()
+	S.speakPlan(plan)
+	done.wait()
+	elapsed = time.perf_counter() - start
+	print("%-18s %7.2f s of audio fed, %6.0f ms before the first sound, %.0f ms until done" % (
+		"trimmed" if trim else "untrimmed", player.bytesFed / 32000.0, player.silenceBeforeSound / 32.0, elapsed * 1000))
+	S.trimSilence = True
+	fakeNvda.stopPipeline(S)
+	return player, soundAtIndex
+
+#: The volumes at which the onset is checked, as the engine applies them, in dB.
+VOLUMES_DB = (0, -20, -30)
+
+def _checkOnset(volumeDb):
+	"""Feeds the trimmer 100 ms of silence, 40 ms of an onset 34 dB below the speech and 200 ms of speech
+	in 10 ms buffers, as the engine delivers them at a volume of C{volumeDb}.
+	@return: the ms of the onset which were kept.
+	"""
+	gain = 10 ** (volumeDb / 20.0)
+	t = numpy.arange(160)
+	speech = (10000 * gain * numpy.sin(2 * numpy.pi * t / 80)).astype("<i2").tobytes()
+	onset = (200 * gain * numpy.sin(2 * numpy.pi * t / 8)).astype("<i2").tobytes()
+	trimmer = SilenceTrimmer(16000)
+	kept = 0
+	for data in [b"\0" * 320] * 10 + [onset] * 4 + [speech] * 20:
+		for out, onDone in trimmer.feed(data):
+			kept += len(out)
+	return (kept - len(speech) * 20) / 32.0
+
+def main():
+	numSentences = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	leadSilence = (float(sys.argv[2]) if len(sys.argv) > 2 else 150) / 1000
+	trailSilence = (float(sys.argv[3]) if len(sys.argv) > 3 else 350) / 1000
+	if not _H2R_Speak.postProcessingAvailable:
+		print("Silence trimming needs numpy")
+		return
+	plan = makePlan(numSentences)
+	print("%d sentences, %.0f ms of silence before and %.0f ms after each, pauses cut to %d ms" % (
+		numSentences, leadSilence * 1000, trailSilence * 1000, _H2R_Speak.maxPauseMs))
+	untrimmed, untrimmedIndexes = _run(False, plan, leadSilence, trailSilence)
+	trimmed, trimmedIndexes = _run(True, plan, leadSilence, trailSilence)
+	saved = (untrimmed.bytesFed - trimmed.bytesFed) / 32000.0
+	print("saved %.2f s, %.1f%% of the listening time" % (saved, saved * 32000.0 / untrimmed.bytesFed * 100))
+	same = trimmed.soundSamples == untrimmed.soundSamples and trimmedIndexes == untrimmedIndexes
+	print("sound and index positions in the speech %s, %d indexes" % ("unchanged" if same else "CHANGED", len(trimmedIndexes)))
+	for volumeDb in VOLUMES_DB:
+		print("at %3d dB, %2.0f ms of the 40 ms onset kept" % (volumeDb, _checkOnset(volumeDb)))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchSpeechPlan.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Queue operations and caller's thread time for a say all sized speech sequence.
+Compares queuing each text and index separately, as SynthDriver.speak did, with compiling the sequence into one plan.
+Usage: python benchSpeechPlan.py [numLines] [numSequences]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers._H2R_plan import PlanBuilder
+from synthDrivers._H2R_voiceCatalog import VoiceCatalog
+
+LINES = (
+	("en", u"Chapter one. The river was high that spring, and the ferry did not run."),
+	("hi", u"नदी में पानी बहुत था। नाव नहीं चली।"),
+	("en", u"We waited on the bank, counting the boats that passed."),
+)
+
+def makeSequence(numLines):
+	"""@return: a speech sequence as (kind, value) tuples, a line of text and an index per line with language changes."""
+	sequence = []
+	for i in range(numLines):
+		language, text = LINES[i % len(LINES)]
+		sequence.append(("lang", language))
+		sequence.append(("text", text))
+		sequence.append(("index", i + 1))
+	return sequence
+
+def speakPerItem(sequence, language):
+	S = _H2R_Speak
+	first = True
+	for kind, value in sequence:
+		if kind == "text":
+			S.speak(value, language, first=first)
+			first = False
+		elif kind == "index":
+			S.sendIndex(value)
+		elif value != language:
+			S.setVoiceAndVariant(value, None)
+			language = value
+
+def speakPlan(sequence, language):
+	builder = PlanBuilder(language)
+	for kind, value in sequence:
+		if kind == "text":
+			builder.text(value)
+		elif kind == "index":
+			builder.index(value)
+		else:
+			builder.switchLanguage(value)
+	_H2R_Speak.speakPlan(builder.build())
+
+class CountingQueue(object):
+	"""Wraps a queue, counting puts."""
+
+	def __init__(self, queue):
+		self._queue = queue
+		self.puts = 0
+
+	def put(self, item):
+		self.puts += 1
+		self._queue.put(item)
+
+	def __getattr__(self, name):
+		return getattr(self._queue, name)
+
+def _run(label, speakFunc, sequence, numSequences, directory):
+	S = _H2R_Speak
+	done = threading.Event()
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0, msPerChar=1, realTimeFactor=1000.0)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.voiceCatalog = VoiceCatalog(directory)
+	S._curVoicePath = None
+	S.setVoiceByLanguage("en")
+	S.bgQueue = CountingQueue(S.bgQueue)
+	S.pcmCache.maxBytes = 0
+	callerTime = 0
+	totalStart = time.perf_counter()
+	for i in range(numSequences):
+		done.clear()
+		start = time.perf_counter()
+		speakFunc(sequence, "en")
+		callerTime += time.perf_counter() - start
+		done.wait()
+	total = time.perf_counter() - totalStart
+	print("%-28s %6d queue puts per sequence, %8.3f ms on the caller's thread, %8.3f ms until done" % (
+		label, S.bgQueue.puts // numSequences, callerTime / numSequences * 1000, total / numSequences * 1000))
+	S.bgQueue = S.bgQueue._queue
+	fakeNvda.stopPipeline(S)
+
+def main():
+	numLines = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	numSequences = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+	sequence = makeSequence(numLines)
+	directory = tempfile.mkdtemp()
+	try:
+		for language in ("en", "hi"):
+			fakeNvda.writeVoiceFile(os.path.join(directory, "H2R_%s_voice_Male.flitevox" % language), language)
+		_run("queued per item", speakPerItem, sequence, numSequences, directory)
+		_run("compiled plan", speakPlan, sequence, numSequences, directory)
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
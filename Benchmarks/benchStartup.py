@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchStartup.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Synthesizer start up time, broken down by phase, through a fake engine with simulated start up costs.
+Compares starting everything before returning, as SynthDriver did, with the background start up,
+measuring both the time until initialize returns and the time until the first utterance reaches the player.
+Usage: python benchStartup.py [numVoices] [voiceFileMB]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+
+#: Simulated costs in seconds.
+LOAD_LIBRARY_DELAY = 0.02
+INIT_DELAY = 0.05
+ADD_VOICE_DELAY = 0.005
+
+LANGUAGES = ("as", "bn", "en", "gu", "hi", "kn", "ml", "mr", "ne", "or", "pa", "sa", "ta", "te")
+
+class FirstFeedPlayer(fakeNvda.FakeWavePlayer):
+
+	def __init__(self, *args, **kwargs):
+		super(FirstFeedPlayer, self).__init__(*args, **kwargs)
+		self.firstFeed = threading.Event()
+		self.firstFeedTime = None
+
+	def feed(self, data, onDone=None):
+		if not self.firstFeed.is_set():
+			self.firstFeedTime = time.perf_counter()
+			self.firstFeed.set()
+		super(FirstFeedPlayer, self).feed(data, onDone)
+
+def _makeVoices(directory, numVoices, voiceFileMB):
+	languagesDir = os.path.join(directory, "Hear2Read", "Languages")
+	os.makedirs(languagesDir)
+	block = os.urandom(1024 * 1024)
+	for language in LANGUAGES[:numVoices]:
+		with open(os.path.join(languagesDir, "H2R_%s_voice_Male.flitevox" % language), "wb") as f:
+			for i in range(voiceFileMB):
+				f.write(block)
+
+def _legacyStart(S):
+	# Everything the old SynthDriver.__init__ did before returning, with the library loaded twice.
+	S.cdll.LoadLibrary("C:/ProgramData/Hear2Read/Hear2Read_addon_engine.dll")
+	S.initialize()
+	S._execWhenDone(lambda: None)
+	S.bgQueue.join()
+	S.getAvailableLanguages()
+	S.setVoiceByLanguage("hi")
+
+def _newStart(S):
+	S.initialize(None, "hi")
+
+def _run(label, startFunc):
+	S = _H2R_Speak
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0.01, readVoiceFiles=True, initDelay=INIT_DELAY, addVoiceDelay=ADD_VOICE_DELAY)
+	S.cdll = fakeNvda.FakeCdll(dll, LOAD_LIBRARY_DELAY)
+	fakeNvda.sys.modules["nvwave"].WavePlayer = FirstFeedPlayer
+	S._curVoicePath = None
+	start = time.perf_counter()
+	startFunc(S)
+	returned = time.perf_counter() - start
+	# Speech arriving straight away is queued until the voice is loaded.
+	S.speak(u"नमस्ते", "hi")
+	S.player.firstFeed.wait()
+	firstAudio = S.player.firstFeedTime - start
+	print(label)
+	benchCommon.report("  returned", returned, "ms")
+	benchCommon.report("  first audio", firstAudio, "ms")
+	for phase, seconds in S.startupTimes.items():
+		benchCommon.report("  phase " + phase, seconds, "ms")
+	S.terminate()
+
+def main():
+	numVoices = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	voiceFileMB = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	directory = tempfile.mkdtemp()
+	try:
+		_makeVoices(directory, numVoices, voiceFileMB)
+		os.environ["ALLUSERSPROFILE"] = directory
+		_run("everything before returning", _legacyStart)
+		_run("background start up", _newStart)
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
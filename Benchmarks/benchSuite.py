@@ -0,0 +1,398 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchSuite.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Benchmark suite for the whole synthesizer, run outside NVDA.
+Drives the SynthDriver in "Hear2Read voices.py" as NVDA does, through speak, cancel, voice switches and rate changes,
+against the stub engine library in stubEngine, which is built with the C compiler on first use,
+and the stand-ins for nvwave and the other NVDA modules in fakeNvda.
+Reports say all throughput, time to first audio, cancel latency, voice switch and parameter change costs,
+and allocations during say all, each the median over --repeat runs.
+
+Results can be saved and compared, so that a change which makes any of them worse shows up:
+	python benchSuite.py --save before.json
+	(change _H2R_Speak.py)
+	python benchSuite.py --compare before.json
+or, to measure a committed revision and then the working tree:
+	python benchSuite.py --baseline HEAD
+A comparison exits with status 1 if any metric is worse by more than --threshold percent.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import benchCommon
+import fakeNvda
+import stubEngine
+
+REPO_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+#: The metrics reported, as name: (unit, whether higher is better, the smallest difference taken as real).
+#: Times are in ms.
+METRICS = OrderedDict((
+	("sayAllCharsPerSec", ("chars/s", True, 20)),
+	("sayAllSpeakCall", ("ms", False, 0.05)),
+	("sayAllPeakAllocation", ("KB", False, 64)),
+	("firstAudioP50", ("ms", False, 1)),
+	("firstAudioP95", ("ms", False, 2)),
+	("cancelCallP95", ("ms", False, 0.1)),
+	("cancelToSilenceP50", ("ms", False, 2)),
+	("cancelToSilenceP95", ("ms", False, 5)),
+	("voiceSwitchSequenceP50", ("ms", False, 2)),
+	("voiceSwitchEngineCalls", ("calls", False, 0.5)),
+	("rateChangeCallP95", ("ms", False, 0.1)),
+	("rateChangeEngineCalls", ("calls", False, 2)),
+))
+
+LANGUAGES = ("hi", "ta", "en")
+
+WORDS = {
+	"hi": (u"नमस्ते", u"भारत", u"भाषा", u"किताब", u"पानी", u"घर", u"स्कूल", u"बच्चे", u"समय", u"दिन",
+		u"रात", u"शहर", u"गाँव", u"लोग", u"काम", u"सुबह", u"खाना", u"रास्ता", u"दोस्त", u"आज"),
+	"ta": (u"வணக்கம்", u"தமிழ்", u"மொழி", u"புத்தகம்", u"தண்ணீர்", u"வீடு", u"பள்ளி", u"நேரம்", u"நாள்", u"ஊர்"),
+	"en": ("the", "screen", "reader", "reads", "each", "line", "of", "text", "aloud", "quickly"),
+}
+
+class Recorder(object):
+	"""Collects what reaches the player and the notifications the driver sends, from whichever thread."""
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.firstAudio = threading.Event()
+		self.firstAudioTime = None
+		self.lastAudioTime = None
+		self.bytesFed = 0
+		self.done = threading.Event()
+		self.indexes = {}
+
+	def audio(self, numBytes):
+		now = time.perf_counter()
+		self.lastAudioTime = now
+		self.bytesFed += numBytes
+		if not self.firstAudio.is_set():
+			self.firstAudioTime = now
+			self.firstAudio.set()
+
+	def onIndexReached(self, synth=None, index=None):
+		self.indexes[index] = time.perf_counter()
+
+	def onDoneSpeaking(self, synth=None):
+		self.done.set()
+
+	def waitForIndex(self, index, timeout=10):
+		end = time.perf_counter() + timeout
+		while index not in self.indexes:
+			if time.perf_counter() > end:
+				raise RuntimeError("Index %r was not reached" % index)
+			time.sleep(0.001)
+		return self.indexes[index]
+
+recorder = Recorder()
+
+class SuitePlayer(fakeNvda.BufferedWavePlayer):
+	"""Opened by the add-on in place of nvwave.WavePlayer. Plays L{playbackSpeed} times faster than real time."""
+
+	playbackSpeed = 50.0
+
+	def __init__(self, channels, samplesPerSec, bitsPerSample, **kwargs):
+		super(SuitePlayer, self).__init__(channels, samplesPerSec, bitsPerSample, bufferSeconds=0.3, speed=self.playbackSpeed)
+
+	def feed(self, data, onDone=None):
+		if data:
+			recorder.audio(len(data))
+		super(SuitePlayer, self).feed(data, onDone)
+
+class Sentences(object):
+	"""Makes sentences that are never repeated, so that no run is helped by audio cached by an earlier one."""
+
+	def __init__(self, seed):
+		self._random = random.Random(seed)
+		self._count = 0
+
+	def make(self, language, numWords):
+		self._count += 1
+		words = [self._random.choice(WORDS[language]) for i in range(numWords)]
+		return u"%s %d." % (u" ".join(words), self._count)
+
+def _makeVoices(directory):
+	languagesDir = os.path.join(directory, "Hear2Read", "Languages")
+	os.makedirs(languagesDir)
+	for language in LANGUAGES:
+		fakeNvda.writeVoiceFile(os.path.join(languagesDir, "H2R_%s_voice_Male.flitevox" % language), language, sizeMB=2)
+	# Some revisions spell the directory in lower case, which matters on Linux.
+	os.symlink("Hear2Read", os.path.join(directory, "hear2read"))
+
+class Suite(object):
+
+	def __init__(self, driverClass, engine):
+		self.driverClass = driverClass
+		self.engine = engine
+		self.sentences = Sentences(1)
+		self.driver = None
+
+	def start(self, playbackSpeed):
+		"""Creates the driver and waits until it has spoken, so the engine is started and the voice loaded."""
+		SuitePlayer.playbackSpeed = playbackSpeed
+		self.engine.configure(startDelay=0.01, msPerChar=60, realTimeFactor=20.0)
+		recorder.reset()
+		self.driver = self.driverClass()
+		self._speakAndWait([u"तैयार", self._index(0)])
+		self.engine.resetStats()
+		recorder.reset()
+
+	def stop(self):
+		self.driver.cancel()
+		self.driver.terminate()
+		self.driver = None
+
+	def _index(self, index):
+		return sys.modules["speech.commands"].IndexCommand(index)
+
+	def _langChange(self, language):
+		return sys.modules["speech.commands"].LangChangeCommand(language)
+
+	def _speakAndWait(self, sequence, timeout=10):
+		recorder.done.clear()
+		self.driver.speak(sequence)
+		if not recorder.done.wait(timeout):
+			raise RuntimeError("Speech did not finish")
+
+	def sayAll(self, numLines=60, trace=False):
+		"""Queues a say all of C{numLines} lines, an index after each, as NVDA does, and waits for the last index."""
+		lines = [self.sentences.make("hi", 12) for i in range(numLines)]
+		recorder.reset()
+		speakTime = 0
+		if trace:
+			tracemalloc.start()
+			baseline = tracemalloc.get_traced_memory()[0]
+		start = time.perf_counter()
+		for index, line in enumerate(lines, 1):
+			callStart = time.perf_counter()
+			self.driver.speak([line, self._index(index)])
+			speakTime += time.perf_counter() - callStart
+		end = recorder.waitForIndex(numLines, timeout=60)
+		results = {}
+		if trace:
+			results["sayAllPeakAllocation"] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024.0
+			tracemalloc.stop()
+		else:
+			results["sayAllCharsPerSec"] = sum(len(line) for line in lines) / (end - start)
+			results["sayAllSpeakCall"] = speakTime / numLines * 1000
+		return results
+
+	def firstAudio(self, numTrials=20):
+		latencies = []
+		for i in range(numTrials):
+			self.driver.cancel()
+			time.sleep(0.02)
+			recorder.reset()
+			start = time.perf_counter()
+			self.driver.speak([self.sentences.make("hi", 3), self._index(i + 1)])
+			if not recorder.firstAudio.wait(5):
+				raise RuntimeError("No audio")
+			latencies.append((recorder.firstAudioTime - start) * 1000)
+			recorder.done.wait(5)
+		return {
+			"firstAudioP50": benchCommon.percentile(latencies, 50),
+			"firstAudioP95": benchCommon.percentile(latencies, 95),
+		}
+
+	def cancel(self, numTrials=12):
+		"""Cancels speech part way through a paragraph, measuring the cancel call and the time until audio stops reaching the player."""
+		callTimes = []
+		latencies = []
+		rng = random.Random(2)
+		for i in range(numTrials):
+			recorder.reset()
+			paragraph = u" ".join(self.sentences.make("hi", 12) for j in range(6))
+			self.driver.speak([paragraph, self._index(i + 1)])
+			if not recorder.firstAudio.wait(5):
+				raise RuntimeError("No audio")
+			time.sleep(rng.uniform(0.02, 0.15))
+			start = time.perf_counter()
+			self.driver.cancel()
+			callTimes.append((time.perf_counter() - start) * 1000)
+			time.sleep(0.3)
+			latencies.append(max(0, recorder.lastAudioTime - start) * 1000)
+		return {
+			"cancelCallP95": benchCommon.percentile(callTimes, 95),
+			"cancelToSilenceP50": benchCommon.percentile(latencies, 50),
+			"cancelToSilenceP95": benchCommon.percentile(latencies, 95),
+		}
+
+	def voiceSwitch(self, numSequences=20):
+		"""Speaks sequences switching from Hindi to Tamil to English and back, as in mixed language documents."""
+		times = []
+		for i in range(numSequences):
+			sequence = []
+			for language in ("ta", "en", "hi"):
+				sequence.extend((self._langChange(language), self.sentences.make(language, 4)))
+			sequence.append(self._index(i + 1))
+			start = time.perf_counter()
+			self._speakAndWait(sequence)
+			times.append((time.perf_counter() - start) * 1000)
+		return {
+			"voiceSwitchSequenceP50": benchCommon.percentile(times, 50),
+			"voiceSwitchEngineCalls": self.engine.stats()["setVoiceCalls"] / float(numSequences),
+		}
+
+	def rateChanges(self, numSteps=50):
+		"""Drags the rate slider at 50 steps a second during say all."""
+		lines = [self.sentences.make("hi", 12) for i in range(20)]
+		recorder.reset()
+		for index, line in enumerate(lines, 1):
+			self.driver.speak([line, self._index(index)])
+		callTimes = []
+		for i in range(numSteps):
+			start = time.perf_counter()
+			self.driver.rate = 30 + i % 40
+			callTimes.append((time.perf_counter() - start) * 1000)
+			time.sleep(0.02)
+		recorder.waitForIndex(len(lines), timeout=60)
+		return {
+			"rateChangeCallP95": benchCommon.percentile(callTimes, 95),
+			"rateChangeEngineCalls": float(self.engine.stats()["setParameterCalls"]),
+		}
+
+	#: (scenario, playback speed)
+	SCENARIOS = (
+		("sayAll", 50.0),
+		("firstAudio", 50.0),
+		("cancel", 2.0),
+		("voiceSwitch", 50.0),
+		("rateChanges", 50.0),
+	)
+
+	def run(self, repeat):
+		"""@return: a dict mapping each metric to its median over C{repeat} runs, leaving out those of scenarios which failed."""
+		samples = {}
+		for i in range(repeat):
+			for name, playbackSpeed in self.SCENARIOS:
+				try:
+					self.start(playbackSpeed)
+					try:
+						results = getattr(self, name)()
+						if name == "sayAll":
+							results.update(self.sayAll(20, trace=True))
+					finally:
+						self.stop()
+				except Exception as e:
+					# Revisions being compared may not get through every scenario, so report the rest.
+					sys.stderr.write("%s failed: %r\n" % (name, e))
+					continue
+				for metric, value in results.items():
+					samples.setdefault(metric, []).append(value)
+		return OrderedDict((metric, benchCommon.percentile(samples[metric], 50)) for metric in METRICS if metric in samples)
+
+def _loadDriverClass():
+	benchCommon.addSourceToPath()
+	return importlib.import_module("synthDrivers.Hear2Read voices").SynthDriver
+
+def runSuite(repeat):
+	fakeNvda.install("hi")
+	engine = stubEngine.install()
+	synthDriverHandler = sys.modules["synthDriverHandler"]
+	synthDriverHandler.synthIndexReached.register(recorder.onIndexReached)
+	synthDriverHandler.synthDoneSpeaking.register(recorder.onDoneSpeaking)
+	sys.modules["nvwave"].WavePlayer = SuitePlayer
+	directory = tempfile.mkdtemp()
+	try:
+		_makeVoices(directory)
+		os.environ["ALLUSERSPROFILE"] = directory
+		return Suite(_loadDriverClass(), engine).run(repeat)
+	finally:
+		shutil.rmtree(directory)
+
+def printResults(results):
+	for metric, value in results.items():
+		unit = METRICS[metric][0]
+		print("%-32s %12.3f %s" % (metric, value, unit))
+
+def compare(baseline, results, threshold):
+	"""Prints each metric against C{baseline}.
+	@return: the names of the metrics worse by more than C{threshold} percent and their noise allowance.
+	"""
+	worse = []
+	print("%-32s %12s %12s %9s" % ("metric", "baseline", "this run", "change"))
+	for metric, value in results.items():
+		if baseline.get(metric) is None:
+			print("%-32s %12s %12.3f" % (metric, "-", value))
+			continue
+		unit, higherIsBetter, noise = METRICS[metric]
+		old = baseline[metric]
+		change = (value - old) / old * 100 if old else 0
+		loss = old - value if higherIsBetter else value - old
+		flag = ""
+		if loss > noise and (not old or loss / abs(old) * 100 > threshold):
+			flag = "WORSE"
+			worse.append(metric)
+		print("%-32s %12.3f %12.3f %+8.1f%% %s" % (metric, old, value, change, flag))
+	return worse
+
+def runBaseline(revision, repeat):
+	"""Runs the suite in a separate process against the Source directory of C{revision}.
+	@return: its results.
+	"""
+	directory = tempfile.mkdtemp()
+	try:
+		archive = subprocess.run(["git", "-C", REPO_DIR, "archive", revision, "Source"],
+			stdout=subprocess.PIPE, check=True).stdout
+		with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+			tar.extractall(directory)
+		resultsPath = os.path.join(directory, "results.json")
+		env = dict(os.environ, H2R_SOURCE_DIR=os.path.join(directory, "Source"))
+		print("Measuring %s" % revision)
+		subprocess.run([sys.executable, os.path.abspath(__file__), "--repeat", str(repeat), "--save", resultsPath],
+			env=env, check=True)
+		with open(resultsPath) as f:
+			return json.load(f)
+	finally:
+		shutil.rmtree(directory)
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark suite for the Hear2Read voices synthesizer.")
+	parser.add_argument("--repeat", type=int, default=3, help="runs of each scenario, of which the median is reported")
+	parser.add_argument("--save", metavar="FILE", help="save the results as JSON")
+	parser.add_argument("--compare", metavar="FILE", help="compare the results with those saved in FILE")
+	parser.add_argument("--baseline", metavar="REVISION", help="compare the results with those of a git revision")
+	parser.add_argument("--threshold", type=float, default=10.0, help="percentage by which a metric may get worse")
+	args = parser.parse_args()
+	baseline = None
+	if args.baseline:
+		baseline = runBaseline(args.baseline, args.repeat)
+		print("Measuring the working tree")
+	elif args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+	results = runSuite(args.repeat)
+	if args.save:
+		with open(args.save, "w") as f:
+			json.dump(results, f, indent="\t")
+	if baseline is None:
+		printResults(results)
+		return 0
+	worse = compare(baseline, results, args.threshold)
+	if worse:
+		print("Worse: %s" % ", ".join(worse))
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
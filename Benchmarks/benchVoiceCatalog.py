@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchVoiceCatalog.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Compares voice lookups through L{VoiceCatalog} with listing the Languages directory on every lookup.
+Usage: python benchVoiceCatalog.py [numVoices]
+"""
+
+import os
+import sys
+import tempfile
+
+import benchCommon
+benchCommon.addSourceToPath()
+from synthDrivers._H2R_voiceCatalog import VoiceCatalog
+
+def legacyLookup(pathName, lang):
+	# The per lookup scan done by setVoiceByLanguage before the catalog existed.
+	for fileName in os.listdir(pathName):
+		parts = fileName.split("_")
+		if parts[0] == "H2R" or parts[0] == "H2Rplay":
+			if parts[1] == lang:
+				return os.path.join(pathName, fileName)
+	return None
+
+def makeVoiceDirectory(directory, numVoices):
+	for i in range(numVoices):
+		fileName = "H2R_l%03d_Voice%d_%s.flitevox" % (i, i, "Male" if i % 2 else "Female")
+		open(os.path.join(directory, fileName), "wb").close()
+	open(os.path.join(directory, "readme.txt"), "wb").close()
+
+def main(numVoices=300):
+	with tempfile.TemporaryDirectory() as directory:
+		makeVoiceDirectory(directory, numVoices)
+		catalog = VoiceCatalog(directory)
+		languages = ["l%03d" % i for i in range(0, numVoices, max(1, numVoices // 10))] + ["missing"]
+		def legacy():
+			for lang in languages:
+				legacyLookup(directory, lang)
+		def cataloged():
+			for lang in languages:
+				catalog.get(lang)
+		print("%d voice files, %d lookups per round" % (numVoices, len(languages)))
+		benchCommon.report("legacy listdir scan per lookup", benchCommon.timePerCall(legacy, 200) / len(languages))
+		benchCommon.report("VoiceCatalog.get", benchCommon.timePerCall(cataloged, 2000) / len(languages))
+		# Adding a voice bumps the directory mtime and must be seen by the next lookup.
+		rebuilds = catalog.rebuildCount
+		open(os.path.join(directory, "H2R_new_Added_Female.flitevox"), "wb").close()
+		os.utime(directory, ns=(0, os.stat(directory).st_mtime_ns + 1000000))
+		assert catalog.get("new") is not None
+		print("rebuilds after adding a voice: %d" % (catalog.rebuildCount - rebuilds))
+
+if __name__ == "__main__":
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,83 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchVoiceHeader.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Reading voice details from .flitevox headers.
+Compares the memory mapped header reader with reading the whole file,
+then switches between voices at 16 and 22.05 kHz to count how often the player is reopened.
+Usage: python benchVoiceHeader.py [numVoices] [voiceFileMB]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers._H2R_flitevox import readVoiceHeader, parseVoiceHeader
+from synthDrivers._H2R_voiceCatalog import VoiceCatalog
+
+class CountingPlayer(fakeNvda.FakeWavePlayer):
+	opened = 0
+
+	def __init__(self, *args, **kwargs):
+		super(CountingPlayer, self).__init__(*args, **kwargs)
+		CountingPlayer.opened += 1
+
+def _readWholeFile(path):
+	with open(path, "rb") as f:
+		return parseVoiceHeader(f.read())
+
+def benchHeaders(directory, paths):
+	for label, func in (("read whole file", _readWholeFile), ("memory mapped header", readVoiceHeader)):
+		start = time.perf_counter()
+		for path in paths:
+			header = func(path)
+		benchCommon.report("%s, per voice" % label, (time.perf_counter() - start) / len(paths), "ms")
+	start = time.perf_counter()
+	catalog = VoiceCatalog(directory)
+	details = [(record.language, record.sampleRate, record.header.features["description"]) for record in catalog.voices()]
+	benchCommon.report("list %d voices with details" % len(details), time.perf_counter() - start, "ms")
+
+def benchSwitches(directory, numSwitches):
+	S = _H2R_Speak
+	fakeNvda.sys.modules["nvwave"].WavePlayer = CountingPlayer
+	dll = fakeNvda.FakeEngineDLL(S)
+	player = CountingPlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player)
+	S.voiceCatalog = VoiceCatalog(directory)
+	S._curVoicePath = None
+	CountingPlayer.opened = 0
+	# Two 16 kHz voices for every 22.05 kHz one.
+	languages = ("l000", "l001", "l002")
+	for i in range(numSwitches):
+		S._execWhenDone(S.setVoiceByLanguage, languages[i % len(languages)])
+	S.bgQueue.join()
+	time.sleep(0.1)
+	print("%d voice switches, player reopened %d times, now at %d Hz" % (numSwitches, CountingPlayer.opened, S.player.samplesPerSec))
+	fakeNvda.stopPipeline(S)
+
+def main():
+	numVoices = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	voiceFileMB = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	directory = tempfile.mkdtemp()
+	try:
+		paths = []
+		for i in range(numVoices):
+			path = os.path.join(directory, "H2R_l%03d_Voice%d_Male.flitevox" % (i, i))
+			fakeNvda.writeVoiceFile(path, "l%03d" % i, sampleRate=22050 if i % 3 == 2 else 16000, sizeMB=voiceFileMB)
+			paths.append(path)
+		benchHeaders(directory, paths)
+		benchSwitches(directory, 30)
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
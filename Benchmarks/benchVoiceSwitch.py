@@ -0,0 +1,134 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/benchVoiceSwitch.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Voice switches in text alternating between English, Hindi and a language without a voice.
+A fake engine reads the whole voice file on every SetVoice, as the real one parses it, so a switch costs a reload
+even when the file is in the OS file cache.
+Compares loading the voice on every language change with skipping the load when the engine already has the voice,
+with the voice files dropped from the OS file cache before each switch to simulate memory pressure and with them cached,
+and the first switch to a voice after start up read from disk and prefetched.
+Usage: python benchVoiceSwitch.py [numSwitches] [voiceFileMB]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import benchCommon
+import fakeNvda
+fakeNvda.install()
+benchCommon.addSourceToPath()
+from synthDrivers import _H2R_Speak
+from synthDrivers._H2R_voiceCatalog import VoiceCatalog
+from synthDrivers._H2R_voicePrefetch import VoicePrefetcher
+
+VOICE_FILES = ("H2R_en_kal_Male.flitevox", "H2R_hi_kamal_Male.flitevox", "H2R_ta_valluvar_Male.flitevox")
+#: (language, text) runs, repeated. French has no voice, so it falls back to English.
+RUNS = (
+	("en", u"The file"),
+	("hi", u"दस्तावेज़"),
+	("en", u"was saved to"),
+	("fr", u"Mes documents"),
+	("en", u"folder"),
+	("ta", u"சேமிக்கப்பட்டது"),
+)
+
+def _dropFromCache(directory):
+	if not hasattr(os, "posix_fadvise"):
+		return
+	for fileName in VOICE_FILES:
+		fd = os.open(os.path.join(directory, fileName), os.O_RDONLY)
+		try:
+			os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+		finally:
+			os.close(fd)
+
+def _startPipeline(directory):
+	S = _H2R_Speak
+	done = threading.Event()
+
+	def onIndexReached(index):
+		if index is None:
+			done.set()
+
+	dll = fakeNvda.FakeEngineDLL(S, startDelay=0.001, msPerChar=10, realTimeFactor=100.0, readVoiceFiles=True)
+	player = fakeNvda.FakeWavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16)
+	fakeNvda.startPipeline(S, dll, player, onIndexReached)
+	S.voiceCatalog = VoiceCatalog(directory)
+	S.voicePrefetcher = VoicePrefetcher()
+	S._curVoicePath = None
+	S._execWhenDone(S.setVoiceByLanguage, "en").result()
+	return dll, done
+
+def _run(label, directory, skipCurrent, dropCache, numSwitches):
+	S = _H2R_Speak
+	dll, done = _startPipeline(directory)
+	language = "en"
+	switchTime = 0
+	switches = 0
+	setVoiceCalls = dll.setVoiceCalls
+	while switches < numSwitches:
+		for runLanguage, text in RUNS:
+			if runLanguage != language:
+				if dropCache:
+					_dropFromCache(directory)
+				if not skipCurrent:
+					S._curVoicePath = None
+				start = time.perf_counter()
+				# Until the voice is loaded on the synthesis thread.
+				S.setVoiceAndVariant(runLanguage, None).result()
+				switchTime += time.perf_counter() - start
+				switches += 1
+				language = runLanguage
+			done.clear()
+			S.speak(text, language)
+			done.wait()
+	print("%-36s %4d switches, %4d SetVoice calls, %7.3f ms per switch" % (
+		label, switches, dll.setVoiceCalls - setVoiceCalls, switchTime / switches * 1000))
+	fakeNvda.stopPipeline(S)
+
+def _firstSwitch(label, directory, prefetch):
+	"""Times the first switch to Hindi after start up, with its voice file dropped from the OS file cache,
+	and read back by the prefetcher first if C{prefetch}.
+	"""
+	S = _H2R_Speak
+	_startPipeline(directory)
+	_dropFromCache(directory)
+	if prefetch:
+		S.prefetchVoices(("hi",))
+		S.voicePrefetcher.wait()
+	start = time.perf_counter()
+	S.setVoiceAndVariant("hi", None).result()
+	print("%-36s %7.3f ms %s" % (label, (time.perf_counter() - start) * 1000, S.voicePrefetcher if prefetch else ""))
+	fakeNvda.stopPipeline(S)
+
+def main():
+	numSwitches = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+	voiceFileMB = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	directory = tempfile.mkdtemp()
+	try:
+		block = os.urandom(1024 * 1024)
+		for fileName in VOICE_FILES:
+			with open(os.path.join(directory, fileName), "wb") as f:
+				for i in range(voiceFileMB):
+					f.write(block)
+		print("%d MB voice files" % voiceFileMB)
+		_run("load on every change, from disk", directory, False, True, numSwitches)
+		_run("skip the current voice, from disk", directory, True, True, numSwitches)
+		_run("load on every change, cached", directory, False, False, numSwitches)
+		_run("skip the current voice, cached", directory, True, False, numSwitches)
+		_firstSwitch("first switch, from disk", directory, False)
+		_firstSwitch("first switch, prefetched", directory, True)
+		print("a cached switch is the engine's reload of the voice file, which no prefetch avoids")
+	finally:
+		_H2R_Speak.voicePrefetcher = VoicePrefetcher()
+		shutil.rmtree(directory)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,449 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/fakeNvda.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Stand-ins for the NVDA modules the add-on imports, so that it can be benchmarked outside NVDA.
+These cover nvwave, config, logHandler, languageHandler, synthDriverHandler and speech.commands,
+so the SynthDriver in "Hear2Read voices.py" can be imported and driven as NVDA drives it.
+Call L{install} before importing anything from synthDrivers.
+"""
+
+import builtins
+import heapq
+import math
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+from ctypes import addressof, c_short
+
+class FakeLog(object):
+	"""Discards everything, like NVDA's log at a level that filters the message out."""
+
+	def _discard(self, *args, **kwargs):
+		pass
+
+	debug = info = debugWarning = warning = error = exception = _discard
+
+class FakeWavePlayer(object):
+	"""Counts what is fed to it and calls C{onDone} callbacks straight away."""
+
+	def __init__(self, channels, samplesPerSec, bitsPerSample, outputDevice=None, buffered=False, **kwargs):
+		self.channels = channels
+		self.samplesPerSec = samplesPerSec
+		self.bitsPerSample = bitsPerSample
+		self.feedCalls = 0
+		self.bytesFed = 0
+		self.stopCalls = 0
+
+	def feed(self, data, onDone=None):
+		self.feedCalls += 1
+		self.bytesFed += len(data)
+		if onDone:
+			onDone()
+
+	def idle(self):
+		pass
+
+	def stop(self):
+		self.stopCalls += 1
+
+	def pause(self, switch):
+		pass
+
+	def close(self):
+		pass
+
+class PacedWavePlayer(FakeWavePlayer):
+	"""Blocks in feed for the duration of the audio divided by C{speed}, like a buffered player with a full buffer.
+	A stop cuts the wait short and drops the C{onDone} callback, as nvwave does.
+	"""
+
+	def __init__(self, channels, samplesPerSec, bitsPerSample, speed=1.0, **kwargs):
+		super(PacedWavePlayer, self).__init__(channels, samplesPerSec, bitsPerSample, **kwargs)
+		self.speed = speed
+		self._bytesPerSec = channels * samplesPerSec * bitsPerSample // 8
+		self._stopEvent = threading.Event()
+
+	def feed(self, data, onDone=None):
+		stopEvent = self._stopEvent
+		if stopEvent.wait(len(data) / self._bytesPerSec / self.speed):
+			return
+		super(PacedWavePlayer, self).feed(data, onDone)
+
+	def stop(self):
+		stopEvent = self._stopEvent
+		self._stopEvent = threading.Event()
+		stopEvent.set()
+		super(PacedWavePlayer, self).stop()
+
+class _FakeFunction(object):
+	"""Wraps a method so that ctypes attributes such as argtypes and errcheck can be set on it."""
+
+	def __init__(self, func):
+		self._func = func
+
+	def __call__(self, *args):
+		return self._func(*args)
+
+class BufferedWavePlayer(FakeWavePlayer):
+	"""Plays audio on a simulated clock, C{speed} times real time, buffering up to C{bufferSeconds} ahead like nvwave.
+	feed returns once the audio is buffered. Each C{onDone} callback runs on a timer thread
+	when playback reaches the end of the audio it was fed with, or straight after the audio before it for empty audio.
+	"""
+
+	def __init__(self, channels, samplesPerSec, bitsPerSample, bufferSeconds=0.3, speed=1.0, **kwargs):
+		super(BufferedWavePlayer, self).__init__(channels, samplesPerSec, bitsPerSample, **kwargs)
+		self.bufferSeconds = bufferSeconds
+		self.speed = speed
+		self._bytesPerSec = channels * samplesPerSec * bitsPerSample // 8
+		self._condition = threading.Condition()
+		self._stopEvent = threading.Event()
+		#: The time at which everything fed so far will have played.
+		self._playEnd = 0
+		self._callbacks = []
+		self._callbackSeq = 0
+		self._closed = False
+		#: (total bytes fed, time they will have played) after each feed, so playback times can be looked up.
+		self.playbackMarks = []
+		self.totalBytes = 0
+		self._timerThread = threading.Thread(target=self._runCallbacks, name="BufferedWavePlayer")
+		self._timerThread.daemon = True
+		self._timerThread.start()
+
+	def feed(self, data, onDone=None):
+		self.feedCalls += 1
+		self.bytesFed += len(data)
+		now = time.perf_counter()
+		with self._condition:
+			self._playEnd = max(now, self._playEnd) + len(data) / self._bytesPerSec / self.speed
+			self.totalBytes += len(data)
+			self.playbackMarks.append((self.totalBytes, self._playEnd))
+			if onDone:
+				self._callbackSeq += 1
+				heapq.heappush(self._callbacks, (self._playEnd, self._callbackSeq, onDone))
+				self._condition.notify()
+			wait = self._playEnd - self.bufferSeconds - now
+			stopEvent = self._stopEvent
+		if wait > 0:
+			stopEvent.wait(wait)
+
+	def timeAtByte(self, byteOffset):
+		"""@return: the time playback reached C{byteOffset} bytes into everything fed, or C{None} if it has not been fed."""
+		prevBytes = 0
+		for totalBytes, playEnd in self.playbackMarks:
+			if totalBytes >= byteOffset and totalBytes > prevBytes:
+				# Playback of this piece ends at playEnd, and it plays for its length at the player's rate.
+				return playEnd - (totalBytes - byteOffset) / self._bytesPerSec / self.speed
+			if totalBytes >= byteOffset:
+				return playEnd
+			prevBytes = totalBytes
+		return None
+
+	def _runCallbacks(self):
+		while True:
+			with self._condition:
+				while not self._closed and not self._callbacks:
+					self._condition.wait()
+				if self._closed:
+					return
+				due, seq, onDone = self._callbacks[0]
+				delay = due - time.perf_counter()
+				if delay > 0:
+					self._condition.wait(delay)
+					continue
+				heapq.heappop(self._callbacks)
+			onDone()
+
+	def idle(self):
+		with self._condition:
+			wait = self._playEnd - time.perf_counter()
+			stopEvent = self._stopEvent
+		if wait > 0:
+			stopEvent.wait(wait)
+
+	def stop(self):
+		with self._condition:
+			self._callbacks = []
+			self._playEnd = 0
+			stopEvent = self._stopEvent
+			self._stopEvent = threading.Event()
+		stopEvent.set()
+		self.stopCalls += 1
+
+	def close(self):
+		with self._condition:
+			self._closed = True
+			self._condition.notify()
+
+class FakeEngineDLL(object):
+	"""Stands in for the engine DLL, delivering a tone to the add-on's callback at a simulated synthesis speed.
+	Each synthesizeText call waits C{startDelay}, then produces C{msPerChar} ms of audio per character
+	in 10 ms blocks, taking C{1 / realTimeFactor} of the audio's duration to do so.
+	H2R_Speak_init takes C{initDelay}, H2R_Speak_Add_Voice C{addVoiceDelay} and H2R_Speak_SetVoice C{setVoiceDelay}.
+	The tone of each text may have C{leadSilence} and C{trailSilence} seconds of silence before and after it, as the engine's does.
+	"""
+
+	#: Samples per callback, 10 ms at 16 kHz.
+	BLOCK_SAMPLES = 160
+
+	def __init__(self, speakModule, startDelay=0.01, msPerChar=60, realTimeFactor=20.0, readVoiceFiles=False, initDelay=0, addVoiceDelay=0, leadSilence=0, trailSilence=0, setVoiceDelay=0):
+		self.speakModule = speakModule
+		self.setVoiceDelay = setVoiceDelay
+		self.leadSilence = leadSilence
+		self.trailSilence = trailSilence
+		self.initDelay = initDelay
+		self.addVoiceDelay = addVoiceDelay
+		#: Whether SetVoice reads the whole voice file, as the engine does.
+		self.readVoiceFiles = readVoiceFiles
+		self.startDelay = startDelay
+		self.msPerChar = msPerChar
+		self.realTimeFactor = realTimeFactor
+		self.synthesizeCalls = 0
+		#: The bytes of audio delivered to the callback so far.
+		self.bytesProduced = 0
+		self.setParameterCalls = 0
+		self.getParameterCalls = 0
+		self.setVoiceCalls = 0
+		# Two periods of a 200 Hz tone, so the audio is not taken for silence.
+		self._block = (c_short * self.BLOCK_SAMPLES)(*(int(3000 * math.sin(2 * math.pi * i / 80)) for i in range(self.BLOCK_SAMPLES)))
+		self._silentBlock = (c_short * self.BLOCK_SAMPLES)()
+		self._events = (speakModule.H2R_Speak_EVENT * 1)()
+		for name in dir(self):
+			if name.startswith("H2R_Speak_"):
+				setattr(self, name, _FakeFunction(getattr(self, name)))
+
+	def H2R_Speak_init(self, path, callback):
+		time.sleep(self.initDelay)
+		return 0
+
+	def H2R_Speak_synthesizeText(self, text):
+		self.synthesizeCalls += 1
+		callback = self.speakModule.callback
+		time.sleep(self.startDelay)
+		numBlocks = max(1, len(text.decode("utf8")) * self.msPerChar // 10)
+		leadBlocks = int(self.leadSilence * 100)
+		toneEnd = leadBlocks + numBlocks
+		numBlocks = toneEnd + int(self.trailSilence * 100)
+		blockDelay = 0.01 / self.realTimeFactor
+		for i in range(numBlocks):
+			time.sleep(blockDelay)
+			block = self._block if leadBlocks <= i < toneEnd else self._silentBlock
+			if callback(addressof(block), self.BLOCK_SAMPLES, self._events):
+				return 0
+			self.bytesProduced += self.BLOCK_SAMPLES * 2
+		callback(None, 0, self._events)
+		return 0
+
+	def H2R_Speak_SetParameter(self, param, value, relative):
+		self.setParameterCalls += 1
+		return 0
+
+	def H2R_Speak_GetParameter(self, param, current):
+		self.getParameterCalls += 1
+		return 50
+
+	def H2R_Speak_SetVoice(self, language, path):
+		self.setVoiceCalls += 1
+		time.sleep(self.setVoiceDelay)
+		if self.readVoiceFiles:
+			with open(path.decode("utf8"), "rb") as f:
+				while f.read(1024 * 1024):
+					pass
+		return 0
+
+	def H2R_Speak_Add_Voice(self, language):
+		time.sleep(self.addVoiceDelay)
+		return 0
+
+	def H2R_Speak_Terminate(self):
+		return 0
+
+def writeVoiceFile(path, language, sampleRate=16000, numTypes=300, sizeMB=0):
+	"""Writes a voice file with a Flite clustergen header and C{sizeMB} MB of padding standing in for the models."""
+	def string(text):
+		data = text.encode("utf-8") + b"\0"
+		return struct.pack("<i", len(data)) + data
+	features = (("language", language), ("country", "IN"), ("variant", "none"), ("age", "30"),
+		("gender", "male"), ("build_date", "Thu Jan  1 00:00:00 2021"), ("description", "Hear2Read %s voice" % language))
+	with open(path, "wb") as f:
+		f.write(b"CMU_FLITE_CG_VOXDATA-v2.0\0")
+		f.write(struct.pack("<i", 1))
+		for name, value in features:
+			f.write(string(name) + string(value))
+		f.write(string("end_of_features"))
+		f.write(string("cmu_%s_voice" % language))
+		f.write(struct.pack("<i", numTypes))
+		for i in range(numTypes):
+			f.write(string("type_%d" % i))
+		f.write(struct.pack("<ii", numTypes, sampleRate))
+		block = b"\0" * (1024 * 1024)
+		for i in range(sizeMB):
+			f.write(block)
+
+class FakeCdll(object):
+	"""Stands in for ctypes.cdll, loading C{dll} in C{loadDelay} whatever the path."""
+
+	def __init__(self, dll, loadDelay=0):
+		self.dll = dll
+		self.loadDelay = loadDelay
+		self.loadedPaths = []
+
+	def LoadLibrary(self, path):
+		time.sleep(self.loadDelay)
+		self.loadedPaths.append(path)
+		return self.dll
+
+def startPipeline(speakModule, dll, player, indexCallback=None):
+	"""Sets up _H2R_Speak as its initialize does, but with C{dll} and C{player} in place of the real ones."""
+	speakModule.H2R_SpeakDLL = dll
+	speakModule.player = player
+	speakModule._sampleRate = player.samplesPerSec
+	speakModule.onIndexReached = indexCallback
+	# As for an engine with no voices installed; benchmarks which switch voices put in their own catalog.
+	speakModule.voiceCatalog = speakModule.VoiceCatalog(tempfile.mkdtemp())
+	speakModule.bgQueue = queue.Queue()
+	speakModule.feedQueue = queue.Queue()
+	speakModule._resetRing()
+	speakModule._glyphsToWarm = []
+	speakModule._glyphWarmupQueued = False
+	# As _startEngine does for a new engine.
+	speakModule._engineStarted.clear()
+	speakModule._engineParams.clear()
+	speakModule._prosody.clear()
+	speakModule._prosodyInEngine = False
+	speakModule.bgThread = speakModule.BgThread()
+	speakModule.bgThread.start()
+	speakModule.feederThread = speakModule.FeederThread()
+	speakModule.feederThread.start()
+	speakModule._execWhenDone(speakModule._readParameters)
+	# As _startEngine does once the parameters are read; getParameter waits for them until then.
+	speakModule._execWhenDone(speakModule._engineStarted.set)
+
+def stopPipeline(speakModule):
+	speakModule.terminate()
+
+class FakeAction(object):
+	"""Stands in for extensionPoints.Action, calling the registered handlers in the notifying thread."""
+
+	def __init__(self):
+		self._handlers = []
+
+	def register(self, handler):
+		self._handlers.append(handler)
+
+	def unregister(self, handler):
+		self._handlers.remove(handler)
+
+	def notify(self, **kwargs):
+		for handler in list(self._handlers):
+			handler(**kwargs)
+
+class FakeSynthDriver(object):
+	"""Stands in for synthDriverHandler.SynthDriver.
+	As with NVDA's auto properties, reading or setting C{x} calls C{_get_x} or C{_set_x} if the class has them.
+	"""
+
+	@staticmethod
+	def VoiceSetting():
+		return "voice"
+
+	@staticmethod
+	def RateSetting():
+		return "rate"
+
+	@staticmethod
+	def RateBoostSetting():
+		return "rateBoost"
+
+	@staticmethod
+	def VolumeSetting():
+		return "volume"
+
+	@property
+	def language(self):
+		# The language of the current voice, whose identifier is its language for this driver.
+		return self.voice
+
+	def __getattr__(self, name):
+		getter = getattr(type(self), "_get_" + name, None)
+		if getter is None:
+			raise AttributeError(name)
+		return getter(self)
+
+	def __setattr__(self, name, value):
+		setter = getattr(type(self), "_set_" + name, None)
+		if setter is not None:
+			setter(self, value)
+		else:
+			object.__setattr__(self, name, value)
+
+	@classmethod
+	def _paramToPercent(cls, current, min, max):
+		return round(float(current - min) / (max - min) * 100)
+
+	@classmethod
+	def _percentToParam(cls, percent, min, max):
+		return round(float(percent) / 100 * (max - min) + min)
+
+class FakeVoiceInfo(object):
+
+	def __init__(self, id, displayName, language=None):
+		self.id = id
+		self.displayName = displayName
+		self.language = language
+
+class _FakeCommand(object):
+
+	def __init__(self, *args, **kwargs):
+		for name, value in zip(self._args, args):
+			setattr(self, name, value)
+		for name, value in kwargs.items():
+			setattr(self, name, value)
+
+	def __repr__(self):
+		return "%s(%s)" % (type(self).__name__, ", ".join(repr(getattr(self, name, None)) for name in self._args))
+
+def _makeCommand(name, args, defaults=()):
+	return type(name, (_FakeCommand,), dict(defaults, _args=args))
+
+def install(language="en"):
+	"""Registers the stand-in modules.
+	@param language: the language languageHandler.getLanguage returns.
+	"""
+	if "nvwave" in sys.modules:
+		sys.modules["languageHandler"].getLanguage = lambda: language
+		return
+	nvwave = types.ModuleType("nvwave")
+	nvwave.WavePlayer = FakeWavePlayer
+	config = types.ModuleType("config")
+	config.conf = {"speech": {"outputDevice": None}}
+	logHandler = types.ModuleType("logHandler")
+	logHandler.log = FakeLog()
+	languageHandler = types.ModuleType("languageHandler")
+	languageHandler.getLanguage = lambda: language
+	synthDriverHandler = types.ModuleType("synthDriverHandler")
+	synthDriverHandler.SynthDriver = FakeSynthDriver
+	synthDriverHandler.VoiceInfo = FakeVoiceInfo
+	synthDriverHandler.synthIndexReached = FakeAction()
+	synthDriverHandler.synthDoneSpeaking = FakeAction()
+	speech = types.ModuleType("speech")
+	speech.__path__ = []
+	commands = types.ModuleType("speech.commands")
+	commands.IndexCommand = _makeCommand("IndexCommand", ("index",))
+	commands.CharacterModeCommand = _makeCommand("CharacterModeCommand", ("state",))
+	commands.LangChangeCommand = _makeCommand("LangChangeCommand", ("lang",))
+	commands.BreakCommand = _makeCommand("BreakCommand", ("time",))
+	for name in ("PitchCommand", "RateCommand", "VolumeCommand"):
+		setattr(commands, name, _makeCommand(name, ("offset", "multiplier"), {"offset": 0, "multiplier": 1}))
+	commands.PhonemeCommand = _makeCommand("PhonemeCommand", ("ipa", "text"), {"text": None})
+	speech.commands = commands
+	for module in (nvwave, config, logHandler, languageHandler, synthDriverHandler, speech, commands):
+		sys.modules[module.__name__] = module
+	builtins.pgettext = lambda context, message: message
+	builtins._ = lambda message: message
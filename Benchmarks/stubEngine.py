@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+#Benchmarks/stubEngine.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Builds and loads the stub engine library in stubEngine/H2R_stubEngine.c.
+Call L{install} before importing anything from synthDrivers,
+so that the add-on loads the stub wherever it would load Hear2Read_addon_engine.dll.
+"""
+
+import ctypes
+import os
+import subprocess
+import sys
+from ctypes import CDLL, Structure, POINTER, c_double, c_int, c_longlong
+
+STUB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubEngine")
+SOURCE_PATH = os.path.join(STUB_DIR, "H2R_stubEngine.c")
+LIBRARY_PATH = os.path.join(STUB_DIR, "H2R_stubEngine.dll" if sys.platform == "win32" else "H2R_stubEngine.so")
+#: The file name the add-on loads the engine from.
+ENGINE_DLL_NAME = "Hear2Read_addon_engine.dll"
+
+class StubStats(Structure):
+	_fields_ = [
+		("initCalls", c_longlong),
+		("synthesizeCalls", c_longlong),
+		("callbacks", c_longlong),
+		("abortedSyntheses", c_longlong),
+		("samplesProduced", c_longlong),
+		("marks", c_longlong),
+		("setParameterCalls", c_longlong),
+		("getParameterCalls", c_longlong),
+		("setVoiceCalls", c_longlong),
+		("addVoiceCalls", c_longlong),
+	]
+
+	def asDict(self):
+		return {name: getattr(self, name) for name, fieldType in self._fields_}
+
+def build(compiler=None):
+	"""Compiles the stub engine, unless the library is newer than its source.
+	@param compiler: the C compiler to run, by default $CC or cc.
+	@return: the path of the library.
+	@raise RuntimeError: if it does not compile.
+	"""
+	if os.path.exists(LIBRARY_PATH) and os.path.getmtime(LIBRARY_PATH) >= os.path.getmtime(SOURCE_PATH):
+		return LIBRARY_PATH
+	compiler = compiler or os.environ.get("CC", "cc")
+	command = [compiler, "-O2", "-shared", "-fPIC", "-o", LIBRARY_PATH, SOURCE_PATH, "-lm"]
+	try:
+		subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	except (OSError, subprocess.CalledProcessError) as e:
+		output = getattr(e, "stdout", b"") or b""
+		raise RuntimeError("Could not build the stub engine with %s: %s %s" % (" ".join(command), e, output.decode("utf-8", "replace")))
+	return LIBRARY_PATH
+
+class StubEngine(object):
+	"""Controls the stub engine loaded from C{path}.
+	Loading the same path again gives the same library, so this sees the engine the add-on is using.
+	"""
+
+	def __init__(self, path=LIBRARY_PATH):
+		self.lib = CDLL(path)
+		self.lib.H2R_Stub_configure.argtypes = (c_double, c_double, c_double, c_double, c_double, c_int)
+		self.lib.H2R_Stub_configure.restype = None
+		self.lib.H2R_Stub_getStats.argtypes = (POINTER(StubStats),)
+		self.lib.H2R_Stub_getStats.restype = None
+		self.lib.H2R_Stub_resetStats.restype = None
+
+	def configure(self, startDelay=0.01, msPerChar=60, realTimeFactor=20.0, initDelay=0, addVoiceDelay=0, readVoiceFiles=False):
+		"""Sets the simulated costs. Delays are in seconds."""
+		self.lib.H2R_Stub_configure(startDelay * 1000, msPerChar, realTimeFactor, initDelay * 1000, addVoiceDelay * 1000, int(readVoiceFiles))
+
+	def stats(self):
+		"""@return: the engine's call counts as a dict."""
+		stats = StubStats()
+		self.lib.H2R_Stub_getStats(stats)
+		return stats.asDict()
+
+	def resetStats(self):
+		self.lib.H2R_Stub_resetStats()
+
+class StubLoader(object):
+	"""Stands in for ctypes.cdll, loading the stub engine in place of the engine DLL and anything else as usual."""
+
+	def __init__(self, cdll, stubPath):
+		self._cdll = cdll
+		self.stubPath = stubPath
+
+	def LoadLibrary(self, path):
+		if os.path.basename(path).lower() == ENGINE_DLL_NAME.lower():
+			return CDLL(self.stubPath)
+		return self._cdll.LoadLibrary(path)
+
+	def __getattr__(self, name):
+		return getattr(self._cdll, name)
+
+def install(compiler=None):
+	"""Builds the stub engine and makes ctypes.cdll load it in place of the engine DLL.
+	@return: a L{StubEngine} for the loaded stub.
+	"""
+	path = build(compiler)
+	if not isinstance(ctypes.cdll, StubLoader):
+		ctypes.cdll = StubLoader(ctypes.cdll, path)
+	return StubEngine(path)
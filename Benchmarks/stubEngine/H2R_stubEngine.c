@@ -0,0 +1,355 @@
+/*
+ * Benchmarks/stubEngine/H2R_stubEngine.c
+ * A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+ * This file is covered by the GNU General Public License.
+ * See the file COPYING for more details.
+ *
+ * A stand-in for Hear2Read_addon_engine.dll which builds on Linux, so that _H2R_Speak can be benchmarked there.
+ * It exports the H2R_Speak_* functions the add-on calls, with the same arguments and return codes,
+ * and keeps the engine's callback contract:
+ *   H2R_Speak_synthesizeText calls the callback from the calling thread with 10 ms blocks of 16 bit mono audio,
+ *   each with an event array ended by an event of type H2R_SpeakEVENT_LIST_TERMINATED,
+ *   then once with no audio and an H2R_SpeakEVENT_MSG_TERMINATED event at the end of the text.
+ *   A non zero return from the callback stops synthesis, and no further callbacks are made.
+ * The event arrays hold an H2R_SpeakEVENT_WORD event for each word starting in the block
+ * and an H2R_SpeakEVENT_MARK event for each <mark name="..."/> in the text, with audio_position in ms
+ * since the start of the text, as the engine gives them.
+ * Synthesis is simulated: a tone of msPerChar ms per character, scaled by the rate parameter,
+ * produced realTimeFactor times faster than real time.
+ * SetVoice reads the sample rate from the .flitevox header, and optionally the whole file, as the engine loads it.
+ * H2R_Stub_configure sets the simulated costs and H2R_Stub_getStats reports what the add-on asked of the engine.
+ *
+ * Build: cc -O2 -shared -fPIC -o H2R_stubEngine.so H2R_stubEngine.c -lm
+ */
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef _WIN32
+#include <windows.h>
+#define EXPORT __declspec(dllexport)
+static void sleepMs(double ms) {
+	if (ms > 0) Sleep((DWORD)ms);
+}
+#else
+#include <time.h>
+#define EXPORT __attribute__((visibility("default")))
+static void sleepMs(double ms) {
+	struct timespec ts;
+	if (ms <= 0) return;
+	ts.tv_sec = (time_t)(ms / 1000);
+	ts.tv_nsec = (long)((ms - ts.tv_sec * 1000.0) * 1e6);
+	nanosleep(&ts, NULL);
+}
+#endif
+
+/* Error codes. */
+#define EE_OK 0
+#define EE_INTERNAL_ERROR -1
+#define EE_NOT_FOUND 2
+
+/* Event types. */
+#define H2R_SpeakEVENT_LIST_TERMINATED 0
+#define H2R_SpeakEVENT_WORD 1
+#define H2R_SpeakEVENT_MARK 3
+#define H2R_SpeakEVENT_MSG_TERMINATED 6
+
+/* Parameters. */
+#define H2R_SpeakRATE 1
+#define H2R_SpeakVOLUME 2
+#define H2R_SpeakPITCH 3
+#define H2R_SpeakRANGE 4
+#define NUM_PARAMETERS 12
+
+#define DEFAULT_SAMPLE_RATE 16000
+#define MAX_BLOCK_SAMPLES 480
+#define MAX_MARKS 256
+#define MAX_MARK_NAME 32
+#define MAX_BLOCK_EVENTS 64
+#define MAX_STRING_LENGTH 65536
+
+typedef struct {
+	int type;
+	unsigned int unique_identifier;
+	int text_position;
+	int length;
+	int audio_position;
+	int sample;
+	void *user_data;
+	union {
+		int number;
+		const char *name;
+		char string[8];
+	} id;
+} H2R_Speak_EVENT;
+
+typedef int (*t_H2R_Speak_callback)(short *wav, int numsamples, H2R_Speak_EVENT *events);
+
+typedef struct {
+	long long initCalls;
+	long long synthesizeCalls;
+	long long callbacks;
+	long long abortedSyntheses;
+	long long samplesProduced;
+	long long marks;
+	long long setParameterCalls;
+	long long getParameterCalls;
+	long long setVoiceCalls;
+	long long addVoiceCalls;
+} H2R_Stub_STATS;
+
+static t_H2R_Speak_callback synthCallback = NULL;
+static H2R_Stub_STATS stats;
+static int parameters[NUM_PARAMETERS] = {0, 50, 100, 50, 50, 0, 0, 0, 0, 0, 0, 0};
+static int sampleRate = DEFAULT_SAMPLE_RATE;
+static unsigned int synthesisId = 0;
+
+/* Simulated costs. */
+static double startDelayMs = 10;
+static double msPerChar = 60;
+static double realTimeFactor = 20;
+static double initDelayMs = 0;
+static double addVoiceDelayMs = 0;
+static int readVoiceFiles = 0;
+
+/* Marks and word starts found in the text being synthesized, by character position. */
+static char markNames[MAX_MARKS][MAX_MARK_NAME];
+static int markPositions[MAX_MARKS];
+static int numMarks;
+static int *wordPositions = NULL;
+static int wordCapacity = 0;
+static int numWords;
+
+static H2R_Speak_EVENT events[MAX_BLOCK_EVENTS + 1];
+static short block[MAX_BLOCK_SAMPLES];
+
+EXPORT void H2R_Stub_configure(double startDelay, double perChar, double rtf, double initDelay, double addVoiceDelay, int readFiles) {
+	startDelayMs = startDelay;
+	msPerChar = perChar;
+	realTimeFactor = rtf > 0 ? rtf : 1;
+	initDelayMs = initDelay;
+	addVoiceDelayMs = addVoiceDelay;
+	readVoiceFiles = readFiles;
+}
+
+EXPORT void H2R_Stub_getStats(H2R_Stub_STATS *out) {
+	*out = stats;
+}
+
+EXPORT void H2R_Stub_resetStats(void) {
+	memset(&stats, 0, sizeof(stats));
+}
+
+EXPORT int H2R_Speak_init(const char *path, t_H2R_Speak_callback callback) {
+	sleepMs(initDelayMs);
+	stats.initCalls++;
+	synthCallback = callback;
+	return EE_OK;
+}
+
+EXPORT const char *H2R_Speak_Info(void *unused) {
+	return "Hear2Read stub engine";
+}
+
+EXPORT int H2R_Speak_Add_Voice(const char *language) {
+	sleepMs(addVoiceDelayMs);
+	stats.addVoiceCalls++;
+	return EE_OK;
+}
+
+EXPORT int H2R_Speak_SetParameter(int param, int value, int relative) {
+	stats.setParameterCalls++;
+	if (param < 0 || param >= NUM_PARAMETERS) return EE_INTERNAL_ERROR;
+	parameters[param] = relative ? parameters[param] + value : value;
+	return EE_OK;
+}
+
+EXPORT int H2R_Speak_GetParameter(int param, int current) {
+	stats.getParameterCalls++;
+	if (param < 0 || param >= NUM_PARAMETERS) return 0;
+	return parameters[param];
+}
+
+static int readInt(FILE *f, int *value) {
+	return fread(value, sizeof(int), 1, f) == 1;
+}
+
+static int skipString(FILE *f, char *buf, size_t bufSize) {
+	int length;
+	if (!readInt(f, &length) || length < 0 || length > MAX_STRING_LENGTH) return 0;
+	if (buf && (size_t)length < bufSize) {
+		if (fread(buf, 1, length, f) != (size_t)length) return 0;
+		buf[length] = 0;
+		return 1;
+	}
+	return fseek(f, length, SEEK_CUR) == 0;
+}
+
+/* Reads the sample rate from the header of a .flitevox voice file written in this machine's byte order. */
+static int readSampleRate(FILE *f) {
+	char header[27];
+	char name[64];
+	int value, numTypes, i;
+	if (fread(header, 1, 26, f) != 26 || memcmp(header, "CMU_FLITE_CG_VOXDATA-v2.0", 25) != 0) return 0;
+	if (!readInt(f, &value) || value != 1) return 0;
+	for (;;) {
+		if (!skipString(f, name, sizeof(name))) return 0;
+		if (strcmp(name, "end_of_features") == 0) break;
+		if (!skipString(f, NULL, 0)) return 0;
+	}
+	if (!skipString(f, NULL, 0) || !readInt(f, &numTypes) || numTypes < 0) return 0;
+	for (i = 0; i < numTypes; i++) {
+		if (!skipString(f, NULL, 0)) return 0;
+	}
+	if (!readInt(f, &numTypes) || !readInt(f, &value)) return 0;
+	return value > 0 ? value : 0;
+}
+
+EXPORT int H2R_Speak_SetVoice(const char *language, const char *path) {
+	FILE *f;
+	int rate;
+	stats.setVoiceCalls++;
+	f = fopen(path, "rb");
+	if (!f) return EE_NOT_FOUND;
+	rate = readSampleRate(f);
+	sampleRate = rate ? rate : DEFAULT_SAMPLE_RATE;
+	if (sampleRate / 100 > MAX_BLOCK_SAMPLES) sampleRate = MAX_BLOCK_SAMPLES * 100;
+	if (readVoiceFiles) {
+		static char buf[1024 * 1024];
+		while (fread(buf, 1, sizeof(buf), f) == sizeof(buf)) {
+		}
+	}
+	fclose(f);
+	return EE_OK;
+}
+
+static void addWord(int position) {
+	if (numWords == wordCapacity) {
+		int capacity = wordCapacity ? wordCapacity * 2 : 256;
+		int *positions = realloc(wordPositions, capacity * sizeof(int));
+		if (!positions) return;
+		wordPositions = positions;
+		wordCapacity = capacity;
+	}
+	wordPositions[numWords++] = position;
+}
+
+/* Finds the marks and word starts in text.
+ * @return: the number of characters to speak, not counting marks.
+ */
+static int scanText(const char *text) {
+	static const char markStart[] = "<mark name=\"";
+	const unsigned char *p = (const unsigned char *)text;
+	int chars = 0;
+	int inWord = 0;
+	numMarks = 0;
+	numWords = 0;
+	while (*p) {
+		if (*p == '<' && strncmp((const char *)p, markStart, sizeof(markStart) - 1) == 0) {
+			const char *name = (const char *)p + sizeof(markStart) - 1;
+			const char *end = strchr(name, '"');
+			const char *close = end ? strchr(end, '>') : NULL;
+			if (close) {
+				if (numMarks < MAX_MARKS) {
+					size_t length = end - name;
+					if (length >= MAX_MARK_NAME) length = MAX_MARK_NAME - 1;
+					memcpy(markNames[numMarks], name, length);
+					markNames[numMarks][length] = 0;
+					markPositions[numMarks] = chars;
+					numMarks++;
+				}
+				p = (const unsigned char *)close + 1;
+				continue;
+			}
+		}
+		if ((*p & 0xC0) != 0x80) {
+			/* The first byte of a character. */
+			int space = *p == ' ' || *p == '\t' || *p == '\n' || *p == '\r';
+			if (!space && !inWord) addWord(chars);
+			inWord = !space;
+			chars++;
+		}
+		p++;
+	}
+	return chars;
+}
+
+EXPORT int H2R_Speak_synthesizeText(const char *text) {
+	double scale, msPerCharScaled, phase = 0, step, amplitude;
+	long long totalSamples, done = 0;
+	int blockSamples, chars, nextMark = 0, nextWord = 0;
+	if (!synthCallback) return EE_INTERNAL_ERROR;
+	stats.synthesizeCalls++;
+	synthesisId++;
+	sleepMs(startDelayMs);
+	chars = scanText(text);
+	/* Rate 0 is half speed and rate 100 full speed. */
+	scale = (150 - parameters[H2R_SpeakRATE]) / 100.0;
+	if (scale < 0.2) scale = 0.2;
+	msPerCharScaled = msPerChar * scale;
+	blockSamples = sampleRate / 100;
+	totalSamples = (long long)((chars > 0 ? chars : 1) * msPerCharScaled * sampleRate / 1000);
+	step = 2 * 3.14159265358979 * (110 + parameters[H2R_SpeakPITCH] * 2) / sampleRate;
+	amplitude = 80.0 * parameters[H2R_SpeakVOLUME];
+	while (done < totalSamples) {
+		int numSamples = (int)(totalSamples - done < blockSamples ? totalSamples - done : blockSamples);
+		int blockEndMs = (int)((done + numSamples) * 1000 / sampleRate);
+		int last = done + numSamples >= totalSamples;
+		int numEvents = 0, i;
+		while (nextWord < numWords && numEvents < MAX_BLOCK_EVENTS
+			&& (last || wordPositions[nextWord] * msPerCharScaled < blockEndMs)) {
+			H2R_Speak_EVENT *e = &events[numEvents++];
+			memset(e, 0, sizeof(*e));
+			e->type = H2R_SpeakEVENT_WORD;
+			e->unique_identifier = synthesisId;
+			e->text_position = wordPositions[nextWord];
+			e->audio_position = (int)(wordPositions[nextWord] * msPerCharScaled);
+			e->id.number = nextWord + 1;
+			nextWord++;
+		}
+		while (nextMark < numMarks && numEvents < MAX_BLOCK_EVENTS
+			&& (last || markPositions[nextMark] * msPerCharScaled < blockEndMs)) {
+			H2R_Speak_EVENT *e = &events[numEvents++];
+			memset(e, 0, sizeof(*e));
+			e->type = H2R_SpeakEVENT_MARK;
+			e->unique_identifier = synthesisId;
+			e->text_position = markPositions[nextMark];
+			e->audio_position = (int)(markPositions[nextMark] * msPerCharScaled);
+			e->id.name = markNames[nextMark];
+			nextMark++;
+			stats.marks++;
+		}
+		memset(&events[numEvents], 0, sizeof(H2R_Speak_EVENT));
+		events[numEvents].type = H2R_SpeakEVENT_LIST_TERMINATED;
+		for (i = 0; i < numSamples; i++) {
+			block[i] = (short)(amplitude * sin(phase));
+			phase += step;
+		}
+		if (phase > 1e6) phase = fmod(phase, 2 * 3.14159265358979);
+		sleepMs(numSamples * 1000.0 / sampleRate / realTimeFactor);
+		stats.callbacks++;
+		if (synthCallback(block, numSamples, events)) {
+			stats.abortedSyntheses++;
+			return EE_OK;
+		}
+		stats.samplesProduced += numSamples;
+		done += numSamples;
+	}
+	memset(events, 0, 2 * sizeof(H2R_Speak_EVENT));
+	events[0].type = H2R_SpeakEVENT_MSG_TERMINATED;
+	events[0].unique_identifier = synthesisId;
+	events[1].type = H2R_SpeakEVENT_LIST_TERMINATED;
+	stats.callbacks++;
+	synthCallback(NULL, 0, events);
+	return EE_OK;
+}
+
+EXPORT int H2R_Speak_Terminate(void) {
+	synthCallback = NULL;
+	free(wordPositions);
+	wordPositions = NULL;
+	wordCapacity = 0;
+	return EE_OK;
+}
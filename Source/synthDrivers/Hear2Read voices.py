@@ -6,8 +6,13 @@
 #See the file COPYING for more details.
 
 import os
+import time
 from collections import OrderedDict
+from functools import partial, wraps
 from . import _H2R_Speak
+from . import _H2R_trace
+from . import _H2R_plan
+from . import _H2R_metrics
 import threading
 import languageHandler
 from synthDriverHandler import SynthDriver, VoiceInfo, synthIndexReached, synthDoneSpeaking
@@ -32,6 +37,21 @@ EE_INTERNAL_ERROR=-1
 EE_BUFFER_FULL=1
 EE_NOT_FOUND=2
 
+def _callerTimed(func):
+	"""Records the time C{func}, an entry point NVDA calls, spends on NVDA's thread in the metrics."""
+	name = func.__name__
+
+	@wraps(func)
+	def wrapper(*args, **kwargs):
+		if not _H2R_metrics.enabled:
+			return func(*args, **kwargs)
+		start = time.perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			_H2R_metrics.record(_H2R_metrics.CALLER_TIME, _H2R_Speak._curLanguage, name, time.perf_counter() - start)
+	return wrapper
+
 class SynthDriver(SynthDriver):
 	name = "Hear2Read voices"
 	description = "Hear2Read voices"
@@ -40,17 +60,19 @@ class SynthDriver(SynthDriver):
 		SynthDriver.VoiceSetting(),
 #		SynthDriver.VariantSetting(),
 		SynthDriver.RateSetting(),
-#		SynthDriver.RateBoostSetting(),
 #		SynthDriver.PitchSetting(),
 #		SynthDriver.InflectionSetting(),
 		SynthDriver.VolumeSetting(),
 	)
+	if _H2R_Speak.postProcessingAvailable:
+		# Rate boost speeds speech up beyond the engine's fastest rate by time compression, which needs numpy.
+		supportedSettings += (SynthDriver.RateBoostSetting(),)
 	supportedCommands = {
 		IndexCommand,
 		CharacterModeCommand,
 		LangChangeCommand,
-#		BreakCommand,
-#		PitchCommand,
+		BreakCommand,
+		PitchCommand,
 		RateCommand,
 		VolumeCommand,
 #		PhonemeCommand,
@@ -61,26 +83,26 @@ class SynthDriver(SynthDriver):
 	def check(cls):
 		return True
 
+	@_callerTimed
 	def __init__(self):
 #		log.info("H2R: Init function called")
-		_H2R_Speak.initialize(self._onIndexReached)
-		_H2R_Speak.getAvailableLanguages()
 #		log.info("Using Hear2Read voices version %s" % _H2R_Speak.info())
 #		log.info("Calling languageHandler.getLanguage()")
 		lang=languageHandler.getLanguage()
-#		log.info("Calling _H2R_Speak.setVoiceByLanguage(" + lang + ")")
-		_H2R_Speak.setVoiceByLanguage(lang)
+		# The voices are registered and the voice for lang loaded in the background.
+		# Speech and settings from NVDA are queued behind them.
+		_H2R_Speak.initialize(self._onIndexReached, lang)
 		self._language=lang
+		#: The language of the voice in use at the end of the last speech sequence, which may be that of a script run.
+		self._voiceLanguage=lang
 #		self._variantDict=_H2R_Speak.getVariantDict()
 #		self.variant="max"
 		self.rate=30
 		self.pitch=40
 		self.inflection=75
-		if self.volume < 10: 
-			log.info("H2R Init volume equaled 0 setting to 50%")
-			self.volume = round(50*.8)
-			_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakVOLUME,self.volume,0)
+		# The engine's volume is not known until it has started, so a volume too low to hear is raised by _H2R_Speak then.
 
+	@_callerTimed
 	def _get_language(self):
 		return self._language
 
@@ -96,172 +118,152 @@ class SynthDriver(SynthDriver):
 		u"ˈ": u"'",
 	}
 
-	def _processText(self, text):
-		# We need to make several replacements.
-#		return text.translate({
-#			0x1: None, # used for embedded commands
-#			0x3C: u"&lt;", # <: because of XML
-#			0x3E: u"&gt;", # >: because of XML
-#			0x5B: u" [", # [: [[ indicates phonemes
-#		})
-		return(text)
-
-	def speak(self,speechSequence):
-		defaultLanguage=self._language
-		textList=[]
-		langChanged=False
-		prosody={}
-		# We output malformed XML, as we might close an outer tag after opening an inner one; e.g.
-		# <voice><prosody></voice></prosody>.
-		# However, H2R_Speak doesn't seem to mind.
-		log.info("[TRW] Hear2Read voices.speak: Entered speak routine. _language = %s", self._language)
+	def _processText(self, text, language=None):
+		# Control characters, numbers, abbreviations, URLs and runs the engine would spell out are normalized,
+		# and the result cached, as the same text is spoken over and over.
+		return _H2R_Speak.normalizationCache.normalize(text, language or self._language)
+
+	def _route(self, router, speechSequence):
+		"""@return: an iterator of the runs of each text item of C{speechSequence}, as split by C{router}.
+		The text between language changes is routed together, so that short runs are judged across the items.
+		"""
+		language = self._language
+		texts = []
+		for item in speechSequence:
+			if isinstance(item, str):
+				texts.append(item)
+			elif isinstance(item, LangChangeCommand):
+				yield from router.splitSequence(texts, language)
+				texts = []
+				language = item.lang.split('_')[0]
+		yield from router.splitSequence(texts, language)
+
+	def _compile(self, speechSequence):
+		"""Compiles a speech sequence into a L{_H2R_plan.SpeechPlan}, starting with the voice in use."""
+		builder=_H2R_plan.PlanBuilder(self._voiceLanguage)
+		trace = _H2R_trace.enabled
+		charMode = False
+		# Text in other scripts is spoken by the voice for its script, and text in the script of this language by its voice.
+		language = self._language
+		routes = self._route(_H2R_Speak.getScriptRouter(), speechSequence) if _H2R_Speak.routeScripts else None
 		for item in speechSequence:
-#			log.info("Hear2Read voices speak fetching Item from speechSequence")
+			# Text and indexes first, as they make up most of a sequence.
 			if isinstance(item,str):
-				log.info("\t[TRW] item is text = \"" + item + "\" calling _H2R_Speak.speak")
-				_H2R_Speak.speak(item)
-#				textList.append(self._processText(item))
+				for runLanguage, run in (next(routes) if routes else ((None, item),)):
+					if runLanguage is not None:
+						builder.switchLanguage(runLanguage)
+					# Characters are spoken as they are.
+					builder.text(run if charMode else self._processText(run, builder.language))
 			elif isinstance(item, IndexCommand):
-				log.info("\t[TRW] item is IndexCommand = %d. calling _H2R_SPeak.sendIndex", item.index)
-				_H2R_Speak.sendIndex(item.index)
-#				textList.append("<mark name=\"%d\" />"%item.index)
+				builder.index(item.index)
 			elif isinstance(item, CharacterModeCommand):
-				log.info("\t[TRW] item  is CharacterModeCommand = " + str(item.state))
-#				textList.append("<say-as interpret-as=\"characters\">" if item.state else "</say-as>")
+				if trace: _H2R_trace.record(_H2R_trace.SPEECH_COMMAND, item)
+				charMode = item.state
+				builder.characterMode(item.state)
 			elif isinstance(item, LangChangeCommand):
-				log.info("\t[TRW] item  is LangChangeCommand item.lang = %s", item.lang)
-				lang_array = (item.lang).split('_') # for now ignore variant
-				item.lang = lang_array[0]
-				if ( item.lang != self._language ):
-					log.info("\tLanguage is to be changed.  Calling _H2R_Speak.setVoiceAndVariant")
-					# queue up a language change to happen at the correct time
-					_H2R_Speak.setVoiceAndVariant(item.lang, None)
-					self._language = item.lang
+				if trace: _H2R_trace.record(_H2R_trace.SPEECH_COMMAND, item)
+				# for now ignore variant
+				language = item.lang.split('_')[0]
+				builder.switchLanguage(language)
 			elif isinstance(item, BreakCommand):
-				log.info("\titem  is BreakCommand")
-#				textList.append('<break time="%dms" />' % item.time)
+				if trace: _H2R_trace.record(_H2R_trace.SPEECH_COMMAND, item)
+				builder.pause(item.time)
 			elif type(item) in self.PROSODY_ATTRS:
-				log.info("\t[TRW] item  is in self.PROSODY_ATTRS %s", item)
-#				if prosody:
-#					# Close previous prosody tag.
-#					textList.append("</prosody>")
-#				attr=self.PROSODY_ATTRS[type(item)]
-#				if item.multiplier==1:
-#					# Returning to normal.
-#					try:
-#						del prosody[attr]
-#					except KeyError:
-#						pass
-#				else:
-#					prosody[attr]=int(item.multiplier* 100)
-#				if not prosody:
-#					continue
-#				textList.append("<prosody")
-#				for attr,val in prosody.items():
-#					textList.append(' %s="%d%%"'%(attr,val))
-#				textList.append(">")
+				if trace: _H2R_trace.record(_H2R_trace.SPEECH_COMMAND, item)
+				builder.prosody(self.PROSODY_ATTRS[type(item)], item.multiplier)
 			elif isinstance(item, PhonemeCommand):
-				log.info("\t[TRW] item  is PhonemeCommand")
-#				# We can't use str.translate because we want to reject unknown characters.
-#				try:
-#					phonemes="".join([self.IPA_TO_H2R_SPEAK[char] for char in item.ipa])
-#					# There needs to be a space after the phoneme command.
-#					# Otherwise, eSpeak will announce a subsequent SSML tag instead of processing it.
-#					textList.append(u"[[%s]] "%phonemes)
-#				except KeyError:
-#					log.debugWarning("Unknown character in IPA string: %s"%item.ipa)
-#					if item.text:
-#						textList.append(self._processText(item.text))
+				if trace: _H2R_trace.record(_H2R_trace.SPEECH_COMMAND, item)
 			else:
 				log.error("Unknown speech: %s"%item)
-		# Close any open tags.
-#		if langChanged:
-#			textList.append("</voice>")
-#		if prosody:
-#			textList.append("</prosody>")
-		text=u"".join(textList)
-		if (text != ""):
-			log.info("Hear2Read voices Speak: sending string to _H2R_Speak.speak(text): " + text)
-			_H2R_Speak.speak(text)
+		self._language=language
+		return builder.build()
 
+	@_callerTimed
+	def speak(self,speechSequence):
+		# The whole sequence goes to the synthesis thread as one plan, which a cancel stops as a whole.
+		plan=self._compile(speechSequence)
+		self._voiceLanguage=plan.language
+		_H2R_Speak.speakPlan(plan)
+
+	@_callerTimed
 	def cancel(self):
-		log.info("[TRW] Hear2Read voices cancel entered")
 		_H2R_Speak.stop()
 
+	@_callerTimed
 	def pause(self,switch):
-		log.info(" Hear2Read voices pause: switch = %d", switch)
 		_H2R_Speak.pause(switch)
 
-#	_rateBoost = False
-#	RATE_BOOST_MULTIPLIER = 3
+	_rateBoost = False
+	#: How many times faster than the engine speaks speech plays at the fastest rate with rate boost on.
+	RATE_BOOST_MULTIPLIER = 3
 
-#	def _get_rateBoost(self):
-#		return self._rateBoost
+	@_callerTimed
+	def _get_rateBoost(self):
+		return self._rateBoost
 
-#	def _set_rateBoost(self, enable):
-#		if enable == self._rateBoost:
-#			return
-#		rate = self.rate
-#		self._rateBoost = enable
-#		self.rate = rate
+	@_callerTimed
+	def _set_rateBoost(self, enable):
+		if enable == self._rateBoost:
+			return
+		rate = self.rate
+		self._rateBoost = enable
+		self.rate = rate
 
+	@_callerTimed
 	def _get_rate(self):
-		log.info("Hear2Read voices._get_rate called")
 		val=_H2R_Speak.getParameter(_H2R_Speak.H2R_SpeakRATE,1)
-#		if self._rateBoost:
-#			val=int(val/self.RATE_BOOST_MULTIPLIER)
 		return (val)
 
+	@_callerTimed
 	def _set_rate(self,rate):
 #		NVDA sends a rate between 0 and 100
-		log.info("Hear2Read voices._set_rate called.  Rate = %d", rate)
 #		val=self._percentToParam(rate, _H2R_Speak.minRate, _H2R_Speak.maxRate)
 		val = rate
-#		if self._rateBoost:
-#			val=int(val*self.RATE_BOOST_MULTIPLIER)
 #		log.info("Hear2Read voices._set_rate calling setParameter: val = %d", val)
 		_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakRATE,val,0)
+		# With rate boost, the engine's speech is also time compressed, from not at all at rate 0
+		# to RATE_BOOST_MULTIPLIER times faster at rate 100.
+		speed = 1 + (self.RATE_BOOST_MULTIPLIER - 1) * val / 100.0 if self._rateBoost else 1
+		_H2R_Speak.setPostProcessing(speed=speed)
 
+	@_callerTimed
 	def _get_pitch(self):
 		val=_H2R_Speak.getParameter(_H2R_Speak.H2R_SpeakPITCH,1)
 		return self._paramToPercent(val,_H2R_Speak.minPitch,_H2R_Speak.maxPitch)
 
+	@_callerTimed
 	def _set_pitch(self,pitch):
 		val=self._percentToParam(pitch, _H2R_Speak.minPitch, _H2R_Speak.maxPitch)
 		_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakPITCH,val,0)
 
+	@_callerTimed
 	def _get_inflection(self):
 		val=_H2R_Speak.getParameter(_H2R_Speak.H2R_SpeakRANGE,1)
 		return self._paramToPercent(val,_H2R_Speak.minPitch,_H2R_Speak.maxPitch)
 
+	@_callerTimed
 	def _set_inflection(self,val):
 		val=self._percentToParam(val, _H2R_Speak.minPitch, _H2R_Speak.maxPitch)
 		_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakRANGE,val,0)
 
+	@_callerTimed
 	def _get_volume(self):
 		volume = round(_H2R_Speak.getParameter(_H2R_Speak.H2R_SpeakVOLUME,1)/.8)
-		log.info("Hear2Read voices._get_volume called. volume = %d", volume)
 		return volume
 
+	@_callerTimed
 	def _set_volume(self,volume):
-		log.info("Hear2Read voices._set_volume called volume = %d", volume)
 		_H2R_Speak.setParameter( _H2R_Speak.H2R_SpeakVOLUME, round(volume*.8), 0 )
 
+	@_callerTimed
 	def _getAvailableVoices(self):
 		voices=OrderedDict()
-		pathName = os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read", "Languages")
-		#list all files in Language directory
-		list = os.listdir(pathName)
-		for flitevoxFileName in list:
-			list = flitevoxFileName.split("_")
-			if list[0] == "H2R" or list[0] == "H2Rplay":
-				temp = list[3].split('.')
-				list[3] = temp[0]
-#				log.info("Hear2Read voices _getAvailableVoices: flitevoxFilename = %s VoiceInfo = %s, %s, %s", flitevoxFileName, list[1], list[2], list[1])
-				voices[list[1]] = VoiceInfo(list[1], list[2] + ' ' + list[3], list[1])
-				log.info("Hear2Read voices _getAvailableVoices: Added voice " + list[1] + " " + list[2] + " " + list[1])
+		for record in _H2R_Speak.voiceCatalog.voices():
+#			log.info("Hear2Read voices _getAvailableVoices: flitevoxFilename = %s VoiceInfo = %s, %s, %s", record.fileName, record.language, record.name, record.language)
+			voices[record.language] = VoiceInfo(record.language, record.displayName, record.language)
 		return voices
 
+	@_callerTimed
 	def _get_voice(self):
 		curVoice=getattr(self,'_voice',None)
 #		log.info("Hear2Read voices: _get_voice called:curVoice = %s", curVoice)
@@ -270,13 +272,11 @@ class SynthDriver(SynthDriver):
 			return curVoice
 		curVoice = _H2R_Speak.getCurrentVoice()
 		if not curVoice:
-			log.info("Hear2Read voices _get_Voice: returning None")
 			return ""
-		log.info("Hear2Read voices _get_Voice: returning new voice identifier = " + _H2R_Speak.decodeH2RSpeakString(curVoice.identifier))
 		return _H2R_Speak.decodeH2RSpeakString(curVoice.identifier)
 
+	@_callerTimed
 	def _set_voice(self, identifier):
-		log.info("Hear2Read voices._set_voice: entered, identifier = %s", identifier)
 		if not identifier:
 			return
 #		log.info("Hear2Read voices _set_voice: identifier = " + identifier)
@@ -285,33 +285,41 @@ class SynthDriver(SynthDriver):
 #		log.info("Hear2Read voices _set_voice: setting self._voice to " + identifier)
 		self._voice = identifier
 		self._variant = 0
-		try:
-			res = _H2R_Speak.setVoiceAndVariant(voice=identifier,variant=self._variant)
-		except:
-			self._voice=None
-			raise
-		self._language=super(SynthDriver,self).language
+		# The voice is loaded on the synthesis thread, so the voice is only known to have failed to load later.
+		_H2R_Speak.setVoiceAndVariant(voice=identifier,variant=self._variant).add_done_callback(partial(self._onVoiceLoaded, identifier))
+		self._language=self._voiceLanguage=super(SynthDriver,self).language
 #		log.info("Hear2Read voices _set_voice: setting self._language to " + self._language)
 
+	def _onVoiceLoaded(self, identifier, future):
+		if self._voice == identifier and (future.exception() is not None or future.result() != EE_OK):
+			# The voice in use is reported instead.
+			self._voice=None
+
 	def _onIndexReached(self, index):
+		# Called by the player as playback reaches the index, so notify straight away
+		# rather than queuing the notification behind synthesis.
 		if index is not None:
-			log.info("Hear2Read voices._onIndexReached: Queueing synthIndexReached.notify, index = %d", index)
-			_H2R_Speak._execWhenDone(synthIndexReached.notify, synth=self, index=index)
+			if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.INDEX_FIRED, index)
+			synthIndexReached.notify(synth=self, index=index)
 		else:
-			log.info("Hear2Read voices._onIndexReached: Queueing synthDoneSpeaking.notify")
-			_H2R_Speak._execWhenDone( synthDoneSpeaking.notify, synth=self)
+			if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DONE_SPEAKING)
+			synthDoneSpeaking.notify(synth=self)
 
+	@_callerTimed
 	def terminate(self):
 		_H2R_Speak.terminate()
 
+	@_callerTimed
 	def _get_variant(self):
 		return self._variant
 
+	@_callerTimed
 	def _set_variant(self,val):
-		log.info("Hear2Read voices:_get_variant - variant val = %s doing nothing THIS SHOULD CHANGE", val)
+		# Variants are not supported yet.
 		return
 #		self._variant = val if val in self._variantDict else "max"
 #		_H2R_Speak.setVoiceAndVariant(variant=self._variant)
 
+	@_callerTimed
 	def _getAvailableVariants(self):
 		return OrderedDict((ID,VoiceInfo(ID, name)) for ID, name in self._variantDict.items())
@@ -15,17 +15,169 @@ import config
 from logHandler import log
 import os
 import codecs
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import Future
+from ._H2R_voiceCatalog import VoiceCatalog
+from ._H2R_flitevox import DEFAULT_SAMPLE_RATE
+from . import _H2R_segmenter
+from ._H2R_plan import OP_TEXT, OP_CHARACTER, OP_INDEX, OP_VOICE, OP_PROSODY, OP_BREAK
+from . import _H2R_trace
+from . import _H2R_metrics
+from . import _H2R_postProcess
+from ._H2R_pcmCache import PcmCache, CachedAudio, normalizeText, MAX_TEXT_LENGTH as MAX_CACHED_TEXT_LENGTH
+from ._H2R_glyphs import GlyphTables, getGlyphs, MAX_GLYPH_LENGTH
+from ._H2R_paramStore import ParameterStore
+from ._H2R_voicePrefetch import VoicePrefetcher
+from ._H2R_normalizer import NormalizationCache
+from ._H2R_ringBuffer import PcmRingBuffer
+from . import _H2R_scripts
 
 isSpeaking = False
 onIndexReached = None
 bgThread=None
 bgQueue = None
+feederThread = None
+#: Audio and index callbacks waiting to be fed to the player, in playback order.
+#: Items are (generation, kind, data, onDone) tuples, with kind one of the FEED_* constants.
+feedQueue = None
 player = None
 H2R_SpeakDLL=None
+#: Index of the installed voice files, created by L{initialize}.
+voiceCatalog = None
 #: Keeps count of the number of bytes pushed for the current utterance.
 #: This is necessary because index positions are given as ms since the start of the utterance.
 _numBytesPushed = 0
 
+#: Audio format of the player.
+BYTES_PER_SAMPLE = 2
+MS_PER_SEC = 1000
+#: The sample rate of the current voice, read from its voice file.
+#: Index positions are converted to byte offsets with it, so the player need not be touched.
+_sampleRate = DEFAULT_SAMPLE_RATE
+
+def _msToBytes(ms):
+	"""@return: the byte offset C{ms} ms into audio at the current voice's sample rate.
+	This goes through whole samples, as rates such as 22050 Hz have no whole number of bytes per ms.
+	"""
+	return int(ms) * _sampleRate // MS_PER_SEC * BYTES_PER_SAMPLE
+
+#: The number of sentences synthesis may run ahead of the sentence being fed to the player.
+lookAheadDepth = 2
+#: The number of synthesized sentences which have not been completely fed yet.
+_segmentsAhead = 0
+_lookAheadCondition = threading.Condition()
+#: Incremented by L{stop}. Feed items tagged with an older generation are discarded.
+_generation = 0
+#: The generation of the sentence being synthesized.
+_synthGeneration = 0
+#: The generation of audio queued since the player was last told the speech was done, or C{None}.
+_pendingDoneGeneration = None
+
+#: Kinds of items on L{feedQueue}.
+FEED_AUDIO = 0
+FEED_INDEX = 1
+FEED_SEGMENT_END = 2
+FEED_DONE = 3
+#: Queued by L{stop}, so the feeder can measure when the stopped audio stops reaching the player.
+FEED_CANCELLED = 4
+#: Queued when the sample rate changes, so the feeder reopens the player once the audio before it has played.
+FEED_FORMAT = 5
+#: Silence for a pause that was asked for, which is not trimmed.
+FEED_PAUSE = 6
+#: Audio written to L{ringBuffer} by the callback, with (end position, mark count) up to which it is read.
+FEED_RING = 7
+
+#: The audio the engine delivers is copied into this ring and read out by the feeder in blocks of L{feedBlockMs},
+#: rather than putting each buffer of about 10 ms on L{feedQueue}.
+ringBuffer = PcmRingBuffer()
+#: The ms of audio in each block fed to the player, and the most the callback writes to the ring before the feeder is told of it.
+feedBlockMs = 100
+#: The (write position, mark count) of L{ringBuffer} last put on L{feedQueue}.
+_ringPublished = (0, 0)
+#: The write position of L{ringBuffer} at the start of the sentence being synthesized.
+_ringSentenceStart = 0
+#: The write position of L{ringBuffer} at which the callback next tells the feeder of the audio written.
+_ringPublishAt = 1
+#: player.feed calls and bytes fed in the sentence being fed, for the feed call rate.
+_feedCalls = 0
+_fedBytes = 0
+
+#: Synthesized audio of short utterances, keyed by voice, engine parameters and text.
+pcmCache = PcmCache()
+#: Text normalized for the engine, keyed by language and text.
+normalizationCache = NormalizationCache()
+#: Whether text mixing scripts is split into runs by script, each spoken by the installed voice for its script.
+routeScripts = True
+#: The router returned by L{getScriptRouter}, and the catalog and rebuild count it was made for.
+_scriptRouter = None
+_scriptRouterKey = None
+#: Set once H2R_Speak_init has returned and the engine's parameters have been read, which initialize leaves to the synthesis thread.
+_engineStarted = threading.Event()
+#: Maps each start up phase to the time it took in seconds, in the order they ran.
+startupTimes = OrderedDict()
+_initializeStart = None
+#: Reads voice files likely to be switched to into the OS file cache, so that the engine reads them from memory.
+voicePrefetcher = VoicePrefetcher()
+#: Parameter changes waiting to be pushed to the engine before the next synthesis.
+paramStore = ParameterStore()
+#: The parameter values last set in the engine, as param: value. Part of the audio cache key.
+_engineParams = {}
+#: The parameter values set by the user, as param: value, which prosody multipliers apply to.
+_baseParams = {}
+#: The engine's default parameter values, as param: value, read once it has started.
+_defaultParams = {}
+#: The prosody multipliers in effect in the plan being spoken, as param: multiplier.
+_prosody = {}
+#: Whether the engine's parameters still have prosody applied, which is only undone at the next synthesis.
+_prosodyInEngine = False
+#: Incremented by relative parameter changes, as the resulting values are not known here.
+_paramEpoch = 0
+#: The path of the loaded voice file.
+_curVoicePath = None
+#: The voice catalog rebuild count when the cache was last cleared.
+_pcmCacheCatalogRebuilds = 0
+#: The languages whose voices have been registered with the engine by H2R_Speak_Add_Voice.
+_registeredLanguages = set()
+#: The voice catalog rebuild count when all its voices were last registered with the engine,
+#: or C{None} until the voices are first registered after the engine starts.
+_registeredCatalogRebuilds = None
+#: (data, indexNum) pieces of the sentence being synthesized, collected for the cache, or C{None}.
+_recording = None
+#: Whether the sentence being synthesized is only collected in L{_recording} rather than fed to the player.
+_renderOnly = False
+
+#: Pre-rendered audio for character mode, one table per voice and parameter state.
+glyphTables = GlyphTables()
+#: Whether the glyph table of a newly loaded voice is warmed in the background.
+warmGlyphs = True
+#: Characters still to be warmed for the current voice, rendered when the synthesis thread is idle.
+_glyphsToWarm = []
+_glyphWarmupQueued = False
+
+#: The speed and gain of the post-processing of audio on its way to the player, 1 for none. Set with L{setPostProcessing}.
+postSpeed = 1.0
+postGain = 1.0
+#: Whether post-processing can be used, which needs numpy.
+postProcessingAvailable = _H2R_postProcess.available
+#: Whether the silence at the start of speech is trimmed and silences between sentences cut to L{maxPauseMs}.
+#: This needs numpy too.
+trimSilence = True
+#: The longest silence kept between sentences, in ms.
+maxPauseMs = 250
+#: The feeder's L{_H2R_postProcess.PostProcessor}, created when post-processing is first used.
+_postProcessor = None
+#: The feeder's L{_H2R_postProcess.SilenceTrimmer}, created when silence is first trimmed.
+_silenceTrimmer = None
+#: The generation of the audio buffered in the post-processor and silence trimmer.
+_postGeneration = None
+
+#: The time the utterance waiting for its first audio was spoken, for the time to first audio metric.
+_utteranceStart = None
+#: The language and name of the loaded voice, which key the metrics.
+_curLanguage = None
+_curVoiceName = None
+
 #Parameter bounds
 minRate=80
 maxRate=450
@@ -77,6 +229,26 @@ H2R_SpeakINTONATION=9
 H2R_SpeakRESERVED1=10
 H2R_SpeakRESERVED2=11
 
+#: Prosody attributes of speech commands, mapped to the engine parameter they change and its bounds.
+PROSODY_PARAMS = {
+	"pitch": (H2R_SpeakPITCH, minPitch, maxPitch),
+	"rate": (H2R_SpeakRATE, 0, 100),
+	"volume": (H2R_SpeakVOLUME, 0, 100),
+}
+_PROSODY_BOUNDS = {param: (low, high) for param, low, high in PROSODY_PARAMS.values()}
+#: The parameters read from the engine once it has started, so that L{getParameter} never calls it.
+READ_PARAMS = (H2R_SpeakRATE, H2R_SpeakVOLUME, H2R_SpeakPITCH, H2R_SpeakRANGE)
+#: Engine volumes below this, under 10% in NVDA, are taken to be too quiet to hear when the engine starts with them.
+MIN_START_VOLUME = 8
+#: The engine volume set when the engine starts too quiet, 50% in NVDA.
+START_VOLUME = 40
+#: Placeholders, not read from the engine, which L{getParameter} answers
+#: if the engine has not started within L{PARAMETER_WAIT} or failed to start.
+#: Nothing should decide anything from them.
+PARAMETER_DEFAULTS = {H2R_SpeakRATE: 50, H2R_SpeakVOLUME: 100, H2R_SpeakPITCH: 50, H2R_SpeakRANGE: 50}
+#: How long L{getParameter} waits for the engine to start, in seconds, before answering from L{PARAMETER_DEFAULTS}.
+PARAMETER_WAIT = 0.5
+
 #error codes
 EE_OK=0
 EE_INTERNAL_ERROR=-1
@@ -140,194 +312,715 @@ def encodeH2RSpeakString(text):
 def decodeH2RSpeakString(data):
 	return data.decode('utf8')
 
-t_H2R_Speak_callback=CFUNCTYPE(c_int,POINTER(c_short), c_int, POINTER(H2R_Speak_EVENT))
+# The audio is declared as c_void_p rather than POINTER(c_short),
+# so that ctypes passes the callback its address as a plain int without creating a pointer object.
+t_H2R_Speak_callback=CFUNCTYPE(c_int, c_void_p, c_int, POINTER(H2R_Speak_EVENT))
 
 @t_H2R_Speak_callback
 def callback(wav, numsamples, event):
 #	log.info("_H2R_Speak callback: Entered.  numsamples = %d", numsamples)
 	try:
-		global player, isSpeaking, _numBytesPushed
-		if not isSpeaking:
+		global isSpeaking, _numBytesPushed
+		if not isSpeaking or _synthGeneration != _generation:
 #			log.info("_H2r_Speak callback: isSpeaking is False returning CALLBACK_ABORT_SYNTHESIS")
-			player.stop()
 			return CALLBACK_ABORT_SYNTHESIS
-#			isSpeaking = True
-		indexes = []
-#		log.info("_H2R_Speak callback looking at events")
-		for e in event:
-#			log.info("_H2R_Speak callback: event")
-			if e.type==H2R_SpeakEVENT_MARK:
-				log.info("H2R_SpeakEVENT_MARK found")
-				indexNum = int(decodeH2RSpeakString(e.id.name))
-				log.info("+_H2R_SpeakEVENT indexNum = %d", indexNum)
+		indexes = None
+		i = 0
+		while True:
+			e = event[i]
+			eventType = e.type
+			if eventType == H2R_SpeakEVENT_LIST_TERMINATED:
+				break
+			if eventType == H2R_SpeakEVENT_MARK:
 				# e.audio_position is ms since the start of this utterance.
-				# Convert to bytes since the start of the utterance.
-				BYTES_PER_SAMPLE = 2
-				MS_PER_SEC = 1000
-				bytesPerMS = player.samplesPerSec * BYTES_PER_SAMPLE // MS_PER_SEC
-				indexByte = e.audio_position * bytesPerMS
-				# Subtract bytes in the utterance that have already been handled
+				# Convert to bytes since the start of the utterance,
+				# then subtract bytes in the utterance that have already been handled
 				# to give us the byte offset into the samples for this callback.
-				indexByte -= _numBytesPushed
-				indexes.append((indexNum, indexByte))
-			elif e.type==H2R_SpeakEVENT_LIST_TERMINATED:
-#			log.info("H2R_SpeakEVENT_LIST_TERMINATED found")
-				break
+				# int() parses the mark name bytes directly, so it need not be decoded first.
+				if indexes is None:
+					indexes = []
+				indexes.append((int(e.id.name), e.audio_position * _sampleRate // MS_PER_SEC * BYTES_PER_SAMPLE - _numBytesPushed))
+			i += 1
 		if not wav:
-			log.info("_H2r_Speak.callback: no wav file isSpeaking = False (end of text to speak)")
+#			log.info("_H2r_Speak.callback: no wav file isSpeaking = False (end of text to speak)")
+			# The end of this sentence. _speak tells the feeder once the DLL call returns.
 			isSpeaking = False
-			player.idle()
-			onIndexReached(None)
 			return CALLBACK_ABORT_SYNTHESIS
-#		temp = numsamples * sizeof(c_short)
-#		if (temp != 320): log.info("_H2R_Speak callback: numSamples * sizeof(c_short) = %d", temp);
-		wav = string_at(wav, numsamples * sizeof(c_short)) if numsamples>0 else b""
-		prevByte = 0
-		for indexNum, indexByte in indexes:
-#			log.info("_H2r_Speak callback: feeding player indexNum = %d, indexByte = %d", indexNum, indexByte)
-			player.feed(wav[prevByte:indexByte],
-				onDone=lambda indexNum=indexNum: onIndexReached(indexNum))
-			prevByte = indexByte
-			if not isSpeaking:
-#				log.info("_H2R_Speak.callback: in loop not speaking CALLBACK_ABORT_SYNTHESIS")
-				return CALLBACK_ABORT_SYNTHESIS
-#		log.info("_H2r_Speak callback: FEEDING PLAYER")
-		player.feed(wav[prevByte:])
-		_numBytesPushed += len(wav)
+		numBytes = numsamples * BYTES_PER_SAMPLE if numsamples > 0 else 0
+		if indexes is not None:
+			prevByte = 0
+			for i, (indexNum, indexByte) in enumerate(indexes):
+				# Clamp, as a mark may fall just outside this buffer.
+				if indexByte < prevByte:
+					indexes[i] = (indexNum, prevByte)
+				elif indexByte > numBytes:
+					indexes[i] = (indexNum, numBytes)
+				prevByte = indexes[i][1]
+		if _recording is not None:
+			_recordPieces(wav, numBytes, indexes)
+		if not _renderOnly:
+			# Copied into the ring here rather than in a function, as this is done for every buffer.
+			start = ringBuffer.writePos
+			end = ringBuffer.write(wav, numBytes)
+			if end < 0:
+				end = _waitAndWriteRing(_synthGeneration, wav, numBytes)
+				if end < 0:
+					# Stopped while waiting for room in the ring.
+					return CALLBACK_ABORT_SYNTHESIS
+			if indexes is not None:
+				for indexNum, indexByte in indexes:
+					ringBuffer.mark(start + indexByte, indexNum)
+			if end >= _ringPublishAt:
+				_publishRing(_synthGeneration)
+		_numBytesPushed += numBytes
 #		log.info("_H2r_Speak callback: CALLBACK_CONTINUE_SYNTHESIS")
 		return CALLBACK_CONTINUE_SYNTHESIS
 	except:
 		log.error("callback FAILED", exc_info=True)
 
+def _recordPieces(wav, numBytes, indexes):
+	"""Copies the pieces of a buffer between its indexes straight out of the engine's buffer into L{_recording}."""
+	prevByte = 0
+	if indexes is not None:
+		for indexNum, indexByte in indexes:
+			_recording.append((string_at(wav + prevByte, indexByte - prevByte), indexNum))
+			prevByte = indexByte
+	_recording.append((string_at(wav + prevByte, numBytes - prevByte), None))
+
+def _waitAndWriteRing(generation, wav, numBytes):
+	"""Writes a buffer from the engine to L{ringBuffer} once the feeder has made room for it.
+	Only call this on the synthesis thread.
+	@return: the write position after the buffer, or -1 if speech was stopped while waiting for room.
+	"""
+	_publishRing(generation)
+	if not ringBuffer.waitForSpace(numBytes, lambda: generation != _generation):
+		return -1
+	return ringBuffer.write(wav, numBytes)
+
+def _startRingSentence():
+	"""Notes the start of a sentence in L{ringBuffer}, so that its first buffer is handed to the feeder at once."""
+	global _ringSentenceStart, _ringPublishAt
+	_ringSentenceStart = ringBuffer.writePos
+	_ringPublishAt = _ringSentenceStart + 1
+
+def _resetRing():
+	"""Empties L{ringBuffer}. Only call this while no thread is using it."""
+	global _ringPublished
+	ringBuffer.reset()
+	_ringPublished = (0, 0)
+	_startRingSentence()
+
+def _publishRing(generation):
+	"""Tells the feeder of the audio and marks written to L{ringBuffer} since it was last told."""
+	global _ringPublished, _ringPublishAt
+	writePos = ringBuffer.writePos
+	# After the first buffer of a sentence, each block is at least as long as the audio before it until it reaches feedBlockMs,
+	# so the player is not left waiting for a whole block while the sentence starts.
+	_ringPublishAt = writePos + max(BYTES_PER_SAMPLE, min(_msToBytes(feedBlockMs), writePos - _ringSentenceStart))
+	published = (writePos, ringBuffer.markCount)
+	if published == _ringPublished:
+		return
+	_ringPublished = published
+	feedQueue.put((generation, FEED_RING, published, None))
+	if _H2R_metrics.enabled:
+		_H2R_metrics.record(_H2R_metrics.RING_BUFFER_FILL, _curLanguage, _curVoiceName, ringBuffer.used / ringBuffer.capacity)
+
 class BgThread(threading.Thread):
+	"""Runs queued engine calls, synthesizing up to L{lookAheadDepth} sentences ahead of playback."""
+
 	def __init__(self):
 		super().__init__(name=f"{self.__class__.__module__}.{self.__class__.__qualname__}")
 		self.setDaemon(True)
 
 	def run(self):
-#		global isSpeaking
+		global _pendingDoneGeneration
 		while True:
-			func, args, kwargs = bgQueue.get()
+			if _glyphsToWarm:
+				# Warm the glyph table one character at a time while there is nothing else to do.
+				try:
+					item = bgQueue.get_nowait()
+				except queue.Empty:
+					try:
+						_warmGlyph()
+					except:
+						log.error("Error warming glyph table", exc_info=True)
+						del _glyphsToWarm[:]
+					continue
+			else:
+				item = bgQueue.get()
+			func, args, kwargs, enqueueTime, generation = item
 			if not func:
 				break
+			if generation is not None and generation != _generation:
+				# Speech queued before the last stop.
+				bgQueue.task_done()
+				continue
+			if _H2R_metrics.enabled:
+				_H2R_metrics.record(_H2R_metrics.QUEUE_WAIT, _curLanguage, _curVoiceName, time.perf_counter() - enqueueTime)
 			try:
-				log.info("[TRW] BgThread.run: calling function args = %s", args)
+				if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DEQUEUE, (func, args))
 				func(*args, **kwargs)
 			except:
 				log.error("Error running function from queue", exc_info=True)
 			bgQueue.task_done()
+			if _pendingDoneGeneration is not None and bgQueue.unfinished_tasks == 0:
+				# Nothing more to synthesize, so the feeder can let the player go idle once it has played what it has.
+				# This is tagged with the generation of the audio, so it is dropped if that audio was stopped.
+				feedQueue.put((_pendingDoneGeneration, FEED_DONE, None, None))
+				_pendingDoneGeneration = None
 
-def _execWhenDone(func, *args, mustBeAsync=False, **kwargs):
-	global bgQueue
-	if mustBeAsync or bgQueue.unfinished_tasks != 0:
-		# Either this operation must be asynchronous or There is still an operation in progress.
-		# Therefore, run this asynchronously in the background thread.
-		log.info("[TRW] _H2R_Speak:_execWhenDone  queueing function arg = %s", args)
-		bgQueue.put((func, args, kwargs))
-	else:
-		log.info("[TRW] _execWhenDone: calling function arg = %s", args)
-		func(*args, **kwargs)
+class FeederThread(threading.Thread):
+	"""Feeds synthesized audio to the player and runs index callbacks in playback order.
+	Feeding blocks while the player's buffers are full, which no longer holds up synthesis.
+	"""
+
+	def __init__(self):
+		super().__init__(name=f"{self.__class__.__module__}.{self.__class__.__qualname__}")
+		self.setDaemon(True)
+
+	def run(self):
+		global _segmentsAhead
+		while True:
+			generation, kind, data, onDone = feedQueue.get()
+			if kind is None:
+				break
+			if kind == FEED_CANCELLED:
+				# Everything queued before the stop has now been dropped or fed, so the stopped speech is silent.
+				latency = time.perf_counter() - data
+				if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SILENCE, latency)
+				if _H2R_metrics.enabled:
+					_H2R_metrics.record(_H2R_metrics.CANCEL_TO_SILENCE, _curLanguage, _curVoiceName, latency)
+				continue
+			if kind == FEED_FORMAT:
+				# Not dropped by a stop, as the voice has changed whether or not its audio was stopped.
+				try:
+					_endSpeech(_generation)
+					_reopenPlayer(data)
+				except:
+					log.error("Error reopening the player", exc_info=True)
+				continue
+			if generation != _generation:
+				# Queued before the last stop.
+				if kind == FEED_RING:
+					ringBuffer.discard(*data)
+				continue
+			try:
+				if kind == FEED_RING:
+					_feedRing(generation, *data)
+				elif kind == FEED_AUDIO or kind == FEED_PAUSE:
+					_feedAudio(generation, data, onDone, kind == FEED_PAUSE)
+					if generation != _generation:
+						# Stopped while this was being fed, after the player was stopped.
+						player.stop()
+				elif kind == FEED_INDEX:
+					# Fed as empty audio, so that the player calls back when playback reaches the end of the audio fed before it,
+					# rather than now, while that audio is still buffered.
+					_feedAudio(generation, b"", partial(onIndexReached, data))
+				elif kind == FEED_SEGMENT_END:
+					_recordFeedCallRate()
+					with _lookAheadCondition:
+						_segmentsAhead -= 1
+						_lookAheadCondition.notify_all()
+				elif kind == FEED_DONE:
+					_endSpeech(generation)
+					player.idle()
+					onIndexReached(None)
+			except:
+				log.error("Error feeding the player", exc_info=True)
+
+def setPostProcessing(speed=None, gain=None):
+	"""Sets the time compression speed and the gain of the audio fed to the player from now on.
+	Without numpy, audio is fed unchanged.
+	@param speed: how many times faster than synthesized the audio plays, at least 1.
+	@param gain: the factor the samples are multiplied by.
+	"""
+	global postSpeed, postGain
+	if speed is not None:
+		postSpeed = max(1.0, speed)
+	if gain is not None:
+		postGain = gain
+
+def _syncPostStages(generation):
+	"""Creates the post-processing stages for the player's sample rate, and empties them of audio from before a stop."""
+	global _postProcessor, _silenceTrimmer, _postGeneration
+	sampleRate = player.samplesPerSec
+	if _postProcessor is None or _postProcessor.sampleRate != sampleRate:
+		_postProcessor = _H2R_postProcess.PostProcessor(sampleRate, postSpeed, postGain)
+	if _silenceTrimmer is None or _silenceTrimmer.sampleRate != sampleRate:
+		_silenceTrimmer = _H2R_postProcess.SilenceTrimmer(sampleRate)
+	if generation != _postGeneration:
+		_postProcessor.reset()
+		_silenceTrimmer.reset()
+		_postGeneration = generation
+
+def _feedPieces(pieces):
+	global _utteranceStart, _feedCalls, _fedBytes
+	for data, onDone in pieces:
+		if data and _utteranceStart is not None:
+			if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.FIRST_FEED, len(data))
+			_H2R_metrics.record(_H2R_metrics.TIME_TO_FIRST_AUDIO, _curLanguage, _curVoiceName, time.perf_counter() - _utteranceStart)
+			_utteranceStart = None
+		player.feed(data, onDone=onDone)
+		_feedCalls += 1
+		_fedBytes += len(data)
+
+def _recordFeedCallRate():
+	"""Records the player.feed calls per second of audio in the sentence just fed."""
+	global _feedCalls, _fedBytes
+	if _H2R_metrics.enabled and _fedBytes:
+		audioSeconds = _fedBytes / (player.samplesPerSec * BYTES_PER_SAMPLE)
+		_H2R_metrics.record(_H2R_metrics.FEED_CALL_RATE, _curLanguage, _curVoiceName, _feedCalls / audioSeconds)
+	_feedCalls = 0
+	_fedBytes = 0
+
+def _feedRing(generation, end, markCount):
+	"""Feeds the audio in L{ringBuffer} up to C{end} to the player in blocks of L{feedBlockMs},
+	with an index callback at each mark. Only call this on the feeder thread.
+	"""
+	blockBytes = max(1, feedBlockMs * player.samplesPerSec // MS_PER_SEC) * BYTES_PER_SAMPLE
+	for data, indexNum in ringBuffer.read(end, markCount, blockBytes):
+		_feedAudio(generation, data, partial(onIndexReached, indexNum) if indexNum is not None else None)
+		if generation != _generation:
+			# Stopped while this was being fed, after the player was stopped.
+			ringBuffer.discard(end, markCount)
+			player.stop()
+			return
+
+def _feedAudio(generation, data, onDone, keep=False):
+	"""Feeds a piece of audio to the player through silence trimming and post-processing, when they are on.
+	Only call this on the feeder thread.
+	@param keep: whether the audio is a pause that was asked for, which is not trimmed.
+	"""
+	trimming = trimSilence or (_silenceTrimmer is not None and _silenceTrimmer.holding)
+	processing = postSpeed != 1 or postGain != 1 or (_postProcessor is not None and _postProcessor.active)
+	if not postProcessingAvailable or not (trimming or processing):
+		_feedPieces(((data, onDone),))
+		return
+	start = time.perf_counter()
+	_syncPostStages(generation)
+	pieces = [(data, onDone)]
+	if trimming:
+		_silenceTrimmer.maxGapMs = maxPauseMs
+		pieces = _silenceTrimmer.feed(data, onDone, keep)
+	if processing:
+		processed = []
+		if (_postProcessor.speed, _postProcessor.gain) != (postSpeed, postGain):
+			processed = _postProcessor.configure(postSpeed, postGain)
+		for data, onDone in pieces:
+			processed.extend(_postProcessor.feed(data, onDone))
+		pieces = processed
+	if _H2R_metrics.enabled:
+		_H2R_metrics.record(_H2R_metrics.POST_PROCESS_TIME, _curLanguage, _curVoiceName, time.perf_counter() - start)
+	_feedPieces(pieces)
+
+def _endSpeech(generation):
+	"""Feeds the player what the post-processing stages still hold, at the end of speech. Only call this on the feeder thread."""
+	if _postGeneration != generation:
+		return
+	pieces = _silenceTrimmer.flush()
+	if _postProcessor.active:
+		pieces = [piece for data, onDone in pieces for piece in _postProcessor.feed(data, onDone)]
+		pieces.extend(_postProcessor.flush())
+	_feedPieces(pieces)
+
+def _openPlayer(samplesPerSec):
+	return nvwave.WavePlayer(channels=1, samplesPerSec=samplesPerSec, bitsPerSample=16, outputDevice=config.conf["speech"]["outputDevice"], buffered=True)
+
+def _reopenPlayer(samplesPerSec):
+	"""Replaces the player with one at C{samplesPerSec}. Only call this on the feeder thread."""
+	global player
+	oldPlayer = player
+	if oldPlayer.samplesPerSec == samplesPerSec:
+		return
+	oldPlayer.idle()
+	player = _openPlayer(samplesPerSec)
+	oldPlayer.close()
+
+def _setSampleRate(sampleRate):
+	"""Switches to C{sampleRate} for the audio synthesized from now on. Only call this on the synthesis thread."""
+	global _sampleRate
+	_sampleRate = sampleRate
+	if feedQueue is not None:
+		feedQueue.put((None, FEED_FORMAT, sampleRate, None))
+
+def _callForFuture(future, func, *args, **kwargs):
+	if not future.set_running_or_notify_cancel():
+		return
+	try:
+		result = func(*args, **kwargs)
+	except BaseException as e:
+		future.set_exception(e)
+		# Raised again, so the synthesis thread logs it as before.
+		raise
+	future.set_result(result)
+
+def _execWhenDone(func, *args, **kwargs):
+	"""Queues a call of C{func} for the synthesis thread, which makes every call into the engine.
+	It is queued even when the synthesis thread is idle, as an engine call such as loading a voice
+	could otherwise block NVDA's thread for as long as it takes.
+	@return: a L{Future} for the result of the call.
+	"""
+	future = Future()
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.ENQUEUE, (func, args))
+	bgQueue.put((partial(_callForFuture, future, func), args, kwargs, time.perf_counter(), None))
+	return future
+
+def _queueSpeech(func, *args):
+	"""Queues speech for the synthesis thread, tagged with the current generation so that L{stop} cancels it."""
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.ENQUEUE, (func, args))
+	bgQueue.put((func, args, {}, time.perf_counter(), _generation))
+
+def setLookAheadDepth(depth):
+	"""Sets how many sentences synthesis may run ahead of the sentence being played."""
+	global lookAheadDepth
+	with _lookAheadCondition:
+		lookAheadDepth = max(1, depth)
+		_lookAheadCondition.notify_all()
+
+def _feedCached(generation, cached):
+	prevByte = 0
+	audio = cached.audio
+	for indexByte, indexNum in cached.indexes:
+		feedQueue.put((generation, FEED_AUDIO, audio[prevByte:indexByte], partial(onIndexReached, indexNum)))
+		prevByte = indexByte
+	feedQueue.put((generation, FEED_AUDIO, audio[prevByte:], None))
+
+def _piecesToCachedAudio(pieces):
+	indexes = []
+	offset = 0
+	for data, indexNum in pieces:
+		offset += len(data)
+		if indexNum is not None:
+			indexes.append((offset, indexNum))
+	return CachedAudio(b"".join(data for data, indexNum in pieces), indexes)
+
+def _voiceStateKey():
+	"""@return: a key for the voice and parameters that determine the engine's output."""
+	return (_curVoicePath, tuple(sorted(_engineParams.items())), _paramEpoch)
+
+def _render(text):
+	"""Synthesizes C{text} without feeding it to the player. Only call this on the synthesis thread.
+	@return: the audio as L{CachedAudio}, or C{None} if it was cut short by a stop.
+	"""
+	global isSpeaking, _numBytesPushed, _synthGeneration, _recording, _renderOnly
+	generation = _generation
+	_synthGeneration = generation
+	_recording = []
+	_renderOnly = True
+	isSpeaking = True
+	_numBytesPushed = 0
+	try:
+		H2R_SpeakDLL.H2R_Speak_synthesizeText(text.encode('utf8', errors='ignore'))
+	finally:
+		pieces = _recording
+		_recording = None
+		_renderOnly = False
+	if generation != _generation:
+		return None
+	return _piecesToCachedAudio(pieces)
+
+def _warmGlyph():
+	if paramStore.hasPending:
+		# The glyphs would be rendered with parameters that are about to change.
+		# Warm-up starts again once the changes are pushed.
+		del _glyphsToWarm[:]
+		return
+	char = _glyphsToWarm.pop()
+	table = glyphTables.getTable(_voiceStateKey())
+	if char not in table:
+		audio = _render(char)
+		if audio is not None:
+			table[char] = audio
+
+def _startGlyphWarmup():
+	global _glyphsToWarm, _glyphWarmupQueued
+	_glyphWarmupQueued = False
+	# Reversed, as characters are popped from the end.
+	_glyphsToWarm = list(reversed(getGlyphs(_curLanguage)))
+
+def _scheduleGlyphWarmup():
+	global _glyphWarmupQueued
+	if warmGlyphs and not _glyphWarmupQueued and bgQueue is not None:
+		# Always queued, as the synthesis thread only checks for warm-up work when it wakes up.
+		# One queued warm-up is enough, as it warms whatever voice is current when it runs.
+		_glyphWarmupQueued = True
+		bgQueue.put((_startGlyphWarmup, (), {}, time.perf_counter(), None))
 
 def _speak(text):
-	global isSpeaking, _numBytesPushed
-	# if H2RSpeak was interupted while speaking ssml that changed parameters such as pitch,
-	# It may not reset those runtime values back to the user-configured values.
-	# Therefore forcefully cause eSpeak to reset its parameters each time beginning to speak again after not speaking. 
-#	if not isSpeaking:
-#		log.info("_Speak isSpeaking = false -- calling player.Stop()")
-#		player.stop()
-#		H2R_SpeakDLL.H2R_Speak_stop()
-#	log.info("_Speak: isSpeaking = True sending text string = %s", text)
+	global isSpeaking, _numBytesPushed, _segmentsAhead, _synthGeneration, _pendingDoneGeneration, _recording
+	generation = _generation
+	# Wait until the feeder has room for another sentence, unless speech is stopped meanwhile.
+	with _lookAheadCondition:
+		while _segmentsAhead >= lookAheadDepth and generation == _generation:
+			_lookAheadCondition.wait()
+		if generation != _generation:
+			return EE_OK
+		_segmentsAhead += 1
+	_synthGeneration = generation
+	_pendingDoneGeneration = generation
+	_applyParameters()
+	cacheKey = None
+	if len(text) <= MAX_CACHED_TEXT_LENGTH:
+		cacheKey = (_voiceStateKey(), normalizeText(text))
+		cached = pcmCache.get(cacheKey)
+		if cached is not None:
+			if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.CACHE_HIT, len(cached.audio))
+			_feedCached(generation, cached)
+			feedQueue.put((generation, FEED_SEGMENT_END, None, None))
+			return EE_OK
+		_recording = []
 	isSpeaking = True
 	_numBytesPushed = 0
+	_startRingSentence()
 	# eSpeak can only process compound emojis when using a UTF8 encoding
 	text2=text.encode('utf8',errors='ignore')
 #	log.info("_speak calling H2R_SpeakDLL.H2R_Speak_synthesizeText(%s)", text)
-	returncode = H2R_SpeakDLL.H2R_Speak_synthesizeText(text2)
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DLL_CALL_START, ("H2R_Speak_synthesizeText", len(text2)))
+	start = time.perf_counter()
+	try:
+		returncode = H2R_SpeakDLL.H2R_Speak_synthesizeText(text2)
+	finally:
+		# Always end the segment, so the look ahead count stays right even if the DLL call fails.
+		_publishRing(generation)
+		feedQueue.put((generation, FEED_SEGMENT_END, None, None))
+		pieces = _recording
+		_recording = None
+	elapsed = time.perf_counter() - start
+	if cacheKey is not None and generation == _generation:
+		# Only complete audio is cached, not audio cut short by a stop.
+		pcmCache.put(cacheKey, _piecesToCachedAudio(pieces))
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DLL_CALL_END, ("H2R_Speak_synthesizeText", returncode))
+	if _H2R_metrics.enabled:
+		_H2R_metrics.record(_H2R_metrics.SYNTHESIS_TIME, _curLanguage, _curVoiceName, elapsed)
+		if elapsed > 0 and _numBytesPushed:
+			audioSeconds = _numBytesPushed / (_sampleRate * BYTES_PER_SAMPLE)
+			_H2R_metrics.record(_H2R_metrics.REAL_TIME_FACTOR, _curLanguage, _curVoiceName, audioSeconds / elapsed)
 	return returncode
 
-def findNextTerminator(string, start):
-	index = start
-#	danda = hex(2404).encode()
-	length = len(string)
-#	log.info("_H2R_Speak.findNextTerminator: string length = %s", length)
-	whitespace = { " ", "\r", "\t", "\n"  }
-	while (index < len(string)) :
-#		log.info("_H2R_Speak.findNextTerminator: char = %s", string[index])
-		if (string[index] == "." or 
-		    string[index] == "!" or
-		    string[index] == "?" or
-		    string[index] == "," or
-		    string[index] == ";" or
-		    ord(string[index]) == 0x0964) :
-#			log.info("_H2R_Speak.findNextTerminator: found terminating char = %s", string[index])
-			if (string[index + 1] in whitespace) : break
-		index += 1
-
-	if start == index : return 0
-	return index
-
-def speak(text):
-	global bgQueue
-#	log.info("_H2R_Speak speak() text = %s", text)
-	# break text info individual sentences if necessary and send only 1 sentence at a time to DLL
-	# end of sentence is period or denda
-#	text=text.encode('utf8',errors='ignore')
-	startIndex = 0
-	index = findNextTerminator(text, startIndex)
-#	log.info("_H2R_Speak.speak index = %d", index)
-	i = 0
-	while ( index != 0 and index <= len(text) ):
-		sentence = text[startIndex : index + 1].strip()
-		if sentence != "" :
-#			log.info ("[TRW] _H2R_Speak.speak queueing %s", sentence)
-			_execWhenDone(_speak, sentence, mustBeAsync=True)
-		startIndex = index + 1#		log.info("_H2R_Speak.speak finding next sentence starting at index %s", startIndex)
-		index = findNextTerminator(text, startIndex)
-#		log.info("[TRW]_H2R_Speak.speak index = %d", index)
-	if startIndex < len(text) :
-		sentence = text[startIndex : ].strip()
-		if sentence != "" :
-#			log.info ("[TRW] _H2R_Speak.speak queueing %s", sentence)
-			_execWhenDone(_speak, sentence, mustBeAsync=True)
+def _speakCharacter(text):
+	global _pendingDoneGeneration
+	_applyParameters()
+	generation = _generation
+	if len(text) > MAX_GLYPH_LENGTH:
+		# Longer character mode runs, as a plan may hold, are rendered but not kept, so they cannot grow the glyph table.
+		audio = _render(text)
+		if audio is None:
+			return
+	else:
+		stateKey = _voiceStateKey()
+		audio = glyphTables.lookup(stateKey, text)
+		if audio is None:
+			audio = _render(text)
+			if audio is None:
+				return
+			glyphTables.getTable(stateKey)[text] = audio
+	_pendingDoneGeneration = generation
+	_feedCached(generation, audio)
+
+def _queueIndex(index):
+	# Runs on the synthesis thread, after the preceding text has been synthesized,
+	# so the index follows that text's audio through the feeder to the player.
+	feedQueue.put((_generation, FEED_INDEX, index, None))
+
+def speak(text, language=None, first=True):
+	"""Queues C{text} for synthesis in chunks chosen by the chunking policy for C{language}.
+	@param first: whether this text starts an utterance, in which case the first chunk is kept short.
+	"""
+	global bgQueue, _utteranceStart
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SPEAK, (len(text), language, first))
+	if first and _utteranceStart is None and _H2R_metrics.enabled:
+		_utteranceStart = time.perf_counter()
+	# Break the text into sentences and clauses and send them to the DLL in chunks.
+	# Short clauses are merged to save DLL calls, but the first chunk is short so that audio starts quickly.
+	for chunk in _H2R_segmenter.iterChunks(text, language, first):
+#		log.info ("[TRW] _H2R_Speak.speak queueing %s", chunk)
+		_queueSpeech(_speak, chunk)
 	
+def speakCharacter(text, language=None):
+	"""Speaks C{text} in character mode from the glyph table of the current voice.
+	When nothing is queued ahead of it and the glyph has been rendered,
+	it is fed straight from the calling thread without waking the synthesis thread.
+	"""
+	global _utteranceStart
+	if len(text) > MAX_GLYPH_LENGTH:
+		speak(text, language)
+		return
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SPEAK, (len(text), language, "character"))
+	if _utteranceStart is None and _H2R_metrics.enabled:
+		_utteranceStart = time.perf_counter()
+	if bgQueue.unfinished_tasks == 0 and not paramStore.hasPending and not _prosodyInEngine:
+		audio = glyphTables.getTable(_voiceStateKey()).get(text)
+		if audio is not None:
+			glyphTables.hits += 1
+			generation = _generation
+			_feedCached(generation, audio)
+			feedQueue.put((generation, FEED_DONE, None, None))
+			return
+	_queueSpeech(_speakCharacter, text)
+
+def _setProsody(attr, multiplier):
+	"""Applies C{multiplier} to the user's value of the parameter for prosody attribute C{attr} from the next synthesis on."""
+	param = PROSODY_PARAMS[attr][0]
+	if multiplier == 1:
+		_prosody.pop(param, None)
+	else:
+		_prosody[param] = multiplier
+
+def _queueSilence(ms):
+	"""Queues C{ms} ms of silence for the player, generated here rather than synthesized by the engine."""
+	global _pendingDoneGeneration
+	numBytes = _msToBytes(ms)
+	if numBytes <= 0:
+		return
+	generation = _generation
+	_pendingDoneGeneration = generation
+	feedQueue.put((generation, FEED_PAUSE, bytes(numBytes), None))
+
+def _runPlan(plan):
+	generation = _generation
+	# Checks for voices added or removed by the Voice Manager here, off NVDA's thread,
+	# so that getScriptRouter picks them up for the speech after this.
+	voiceCatalog.languages()
+	for op, arg in plan.steps:
+		if generation != _generation:
+			# Stopped, which cancels the rest of the plan.
+			break
+		try:
+			if op == OP_TEXT:
+				_speak(arg)
+			elif op == OP_INDEX:
+				_queueIndex(arg)
+			elif op == OP_CHARACTER:
+				_speakCharacter(arg)
+			elif op == OP_VOICE:
+				setVoiceByLanguage(arg)
+			elif op == OP_PROSODY:
+				_setProsody(*arg)
+			elif op == OP_BREAK:
+				_queueSilence(arg)
+		except:
+			# As when each step was queued separately, a failed step does not stop the rest.
+			log.error("Error running speech plan step %r", (op, arg), exc_info=True)
+	# Prosody only lasts for its plan. The engine is only told once something is synthesized
+	# with parameters that differ from those it has.
+	_prosody.clear()
+
+def speakPlan(plan):
+	"""Queues a L{_H2R_plan.SpeechPlan} for the synthesis thread as a single item."""
+	global _utteranceStart
+	steps = plan.steps
+	if not steps:
+		return
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SPEAK, (len(steps), plan.language, "plan"))
+	if len(steps) == 1 and steps[0][0] == OP_CHARACTER:
+		# A typed character, which may be spoken straight from the glyph table.
+		speakCharacter(steps[0][1], plan.language)
+		return
+	if _utteranceStart is None and _H2R_metrics.enabled:
+		_utteranceStart = time.perf_counter()
+	_queueSpeech(_runPlan, plan)
+
 def sendIndex(index):
-	log.info("[TRW] _H2R_Speak.sendIndex entered. index = %d", index)
-	_execWhenDone( onIndexReached, index, mustBeAsync=True)
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.INDEX_QUEUED, index)
+	_queueSpeech(_queueIndex, index)
 
 def stop():
-	global isSpeaking, bgQueue
+	global isSpeaking, _utteranceStart, _generation, _segmentsAhead
 #	log.info("_H2R_Speak stop entered")
 	# Kill all speech from now.
-	# We still want parameter changes to occur, so requeue them.
-	params = []
-	try:
-		while True:
-			item = bgQueue.get_nowait()
-			if item[0] != _speak:
-				params.append(item)
-			bgQueue.task_done()
-	except queue.Empty:
-		# Let the exception break us out of this loop, as queue.empty() is not reliable anyway.
-		pass
-	for item in params:
-		bgQueue.put(item)
-#	log.info("_H2R_Speak.stop Removed all text from bgQueue, setting isSpeaking = False and calling player.stop()")
+	# This takes the same time however much is queued: bumping the generation makes the synthesis thread
+	# drop queued speech and the feeder drop audio as they reach it,
+	# aborts the synthesis in progress at its next callback and releases a synthesis waiting for look ahead room.
+	# Parameter changes are not tagged with a generation, so they still occur.
+	stopTime = time.perf_counter()
+	with _lookAheadCondition:
+		_generation += 1
+		_segmentsAhead = 0
+		_lookAheadCondition.notify_all()
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.STOP, _generation)
 	isSpeaking = False
+	_utteranceStart = None
+	# Release a synthesis waiting for room in the ring.
+	ringBuffer.wake()
 #	H2R_SpeakDLL.H2R_Speak_stop();
 	player.stop()
+	feedQueue.put((_generation, FEED_CANCELLED, stopTime, None))
 
 def pause(switch):
 	global player
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.PAUSE, switch)
 	player.pause(switch)
 
+def _setParameter(param, value, relative):
+	global _paramEpoch
+	H2R_SpeakDLL.H2R_Speak_SetParameter(param, value, relative)
+	# Track the engine's state for the audio cache key.
+	if relative:
+		_engineParams.pop(param, None)
+		_paramEpoch += 1
+	else:
+		_engineParams[param] = value
+
+def _effectiveValue(param, base):
+	multiplier = _prosody.get(param)
+	if multiplier is None:
+		return base
+	low, high = _PROSODY_BOUNDS[param]
+	return max(low, min(high, int(round(base * multiplier))))
+
+def _applyParameters():
+	"""Brings the engine's parameters up to date for the next synthesis:
+	the user's pending changes, with the prosody multipliers in effect applied to them.
+	Only parameters whose value differs from that the engine has are sent. Only call this on the synthesis thread.
+	"""
+	global _prosodyInEngine
+	changes = paramStore.takePending()
+	for param, value, relative in changes:
+		if relative:
+			# The resulting value is not known here, so it is read back for getParameter and for prosody.
+			_setParameter(param, value, relative)
+			_baseParams.pop(param, None)
+			if param in READ_PARAMS:
+				paramStore.remember(param, H2R_SpeakDLL.H2R_Speak_GetParameter(param, 1))
+		else:
+			_baseParams[param] = value
+	for param in _prosody:
+		if param not in _baseParams:
+			_baseParams[param] = H2R_SpeakDLL.H2R_Speak_GetParameter(param, 1)
+	for param, base in _baseParams.items():
+		value = _effectiveValue(param, base)
+		if _engineParams.get(param) != value:
+			_setParameter(param, value, 0)
+	_prosodyInEngine = bool(_prosody)
+	if changes:
+		_scheduleGlyphWarmup()
+
 def setParameter(param,value,relative):
-	log.info("[TRW] _H2R_Speak.setParameter called param = %d value = %d  relative = %d", param, value, relative)
-	_execWhenDone(H2R_SpeakDLL.H2R_Speak_SetParameter,param,value,relative)
+	# Only the latest value of each parameter is pushed to the engine, just before the next synthesis.
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SET_PARAMETER, (param, value, relative))
+	paramStore.set(param, value, relative)
+
+def _knownParameter(param, current):
+	"""@return: the value of C{param} known without calling the engine, or C{None}."""
+	if current:
+		value = paramStore.get(param)
+		if value is not None:
+			return value
+	return _defaultParams.get(param)
 
 def getParameter(param,current):
-	log.info("_H2R_Speak.getParameter called. Param = %s current = %d", param, current)
-	return H2R_SpeakDLL.H2R_Speak_GetParameter(param,current)
+	"""Answers from the values read from the engine when it started and those set since, without calling the engine,
+	so it never blocks on the synthesis thread.
+	Until the engine has started, it waits up to L{PARAMETER_WAIT} for the values to be read,
+	so that NVDA is not given placeholders for the engine's settings.
+	"""
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.GET_PARAMETER, (param, current))
+	value = _knownParameter(param, current)
+	if value is None and _engineStarted.wait(PARAMETER_WAIT):
+		value = _knownParameter(param, current)
+	if value is None:
+		value = PARAMETER_DEFAULTS.get(param, 0)
+	return value
 
 def getVoiceList():
 	voices=H2R_SpeakDLL.H2R_Speak_ListVoices(None)
@@ -361,7 +1054,6 @@ def _setVoiceAndVariant(voice=None, variant=None):
 	v=getCurrentVoice()
 	if (v == None): return EE_NOT_FOUND
 	res = decodeH2RSpeakString(v.identifier).split("+")
-	log.info("_H2R_Speak - setVoiceAndVariant: currentVoice = %s", res[0])
 	if not voice:
 		voice = res[0]
 	if not variant:
@@ -369,24 +1061,36 @@ def _setVoiceAndVariant(voice=None, variant=None):
 			variant = res[1]
 		else:
 			variant = ""
-	log.info("_H2R _setVoiceAndVariant: entered  voice = " + voice + " variant = " + variant)
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SET_VOICE, (res[0], voice, variant))
 	return(setVoiceByLanguage(voice))
 
 
 def setVoiceAndVariant(voice=None, variant=None):
-	log.info("[TRW] _H2R setVoiceAndVariant: entered")
-	_execWhenDone(_setVoiceAndVariant, voice=voice, variant=variant)
+	"""@return: a L{Future} for the engine's error code once the voice is loaded on the synthesis thread."""
+	return _execWhenDone(_setVoiceAndVariant, voice=voice, variant=variant)
+
+def _addVoice(lang):
+	H2R_SpeakDLL.H2R_Speak_Add_Voice(encodeH2RSpeakString(lang))
+	_registeredLanguages.add(lang)
 
-def getAvailableLanguages():
+def getAvailableLanguages(exclude=()):
 #	log.info("_H2R_Speak_getAvailableLanguages entered")
-	pathName = os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read", "Languages")
-	#list all files in Language directory
-	list = os.listdir(pathName)
-	for file in list:
-		parts = file.split("_")
-		if parts[0] == "H2R" or parts[0] == "H2Rplay":
-#			log.info("_H2R_Speak:getAvailableLanguages - found %s \n\tCalling H2R_SpeakDLL.H2R_Speak_Add_Voice",file)
-			H2R_SpeakDLL.H2R_Speak_Add_Voice(encodeH2RSpeakString(parts[1]))
+	global _registeredCatalogRebuilds
+	# Read before the listing, so that a rebuild during it is registered by the next _registerNewVoices.
+	rebuildCount = voiceCatalog.rebuildCount
+	for lang in voiceCatalog.languages():
+		if lang in exclude or lang in _registeredLanguages:
+			continue
+#		log.info("_H2R_Speak:getAvailableLanguages - found %s \n\tCalling H2R_SpeakDLL.H2R_Speak_Add_Voice",lang)
+		_addVoice(lang)
+	_registeredCatalogRebuilds = rebuildCount
+
+def _registerNewVoices():
+	"""Registers the voices installed since the engine started, such as by the Voice Manager, with the engine,
+	once the catalog has listed them. Only call this on the synthesis thread.
+	"""
+	if _registeredCatalogRebuilds is not None and voiceCatalog.rebuildCount != _registeredCatalogRebuilds:
+		getAvailableLanguages()
 #	f = open (fileName)
 #	for each line, see if the corresponding voice exists in the Hear2Read directory
 #	for line in f:
@@ -398,77 +1102,78 @@ def getAvailableLanguages():
 #			log.info("calling H2R_Speak_DLL.H2R_Speak_Add_VOice languageFile = %s", languageFile)
 #			H2R_SpeakDLL.H2R_Speak_Add_Voice(encodeH2RSpeakString(list[0]))
 
+def _setVoice(record):
+	global _curLanguage, _curVoiceName, _curVoicePath, _pcmCacheCatalogRebuilds
+	if record.path == _curVoicePath and voiceCatalog.rebuildCount == _pcmCacheCatalogRebuilds:
+		# The engine already has this voice, e.g. when switching between languages that both fall back to English.
+		if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SET_VOICE, (record.language, "current"))
+		return EE_OK
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DLL_CALL_START, ("H2R_Speak_SetVoice", record.path))
+	hr = H2R_SpeakDLL.H2R_Speak_SetVoice(encodeH2RSpeakString(record.language), encodeH2RSpeakString(record.path))
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.DLL_CALL_END, ("H2R_Speak_SetVoice", hr))
+	if (hr != EE_OK):
+		return hr
+	_curLanguage = record.language
+	_curVoiceName = record.name
+	_curVoicePath = record.path
+	if record.sampleRate != _sampleRate:
+		_setSampleRate(record.sampleRate)
+	if voiceCatalog.rebuildCount != _pcmCacheCatalogRebuilds:
+		# Voice files may have been replaced under the same names, so audio cached for them is stale.
+		_pcmCacheCatalogRebuilds = voiceCatalog.rebuildCount
+		pcmCache.clear()
+		glyphTables.clear()
+	_scheduleGlyphWarmup()
+	# first fill in the H2R_curVoice Structure
+	H2R_curVoice.name = encodeH2RSpeakString(record.displayName)
+	H2R_curVoice.languages = encodeH2RSpeakString(record.language)
+	H2R_curVoice.identifier = encodeH2RSpeakString(record.language)
+	H2R_curVoice.age = 0
+	if record.gender == "Male":
+		H2R_curVoice.gender = 1
+		H2R_curVoice.variant = 1
+	elif record.gender == "Female":
+		H2R_curVoice.gender = 2
+		H2R_curVoice.variant = 2
+	else:
+		H2R_curVoice.gender = 0
+		H2R_curVoice.variant = 0
+	return hr
+
 def setVoiceByLanguage(lang):
 #	log.info("_H2R_Speak_setVoiceByLanguage: entered. lang = " + lang)
-	pathName = os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read", "Languages")
-	#Get all files in the Language Directory
-	list = os.listdir(pathName)
-	for fileName in list:
-		parts = fileName.split("_")
-		if parts[0] == "H2R" or parts[0] == "H2Rplay":
-		# Found one of the NVDA Addon voice file
-#			log.info("_H2R_Speak setVoiceByLanguage: parts = %s %s %s %s", parts[0], parts[1], parts[2], parts[3])
-			if parts[1] == lang:
-				fullPath = os.path.join(os.environ['ALLUSERSPROFILE'], "hear2read", "Languages", fileName)
-				log.info("_H2R_Speak:setVoiceByLanguage - found %s for lang %s",fullPath, lang)
-				hr = H2R_SpeakDLL.H2R_Speak_SetVoice(encodeH2RSpeakString(lang), encodeH2RSpeakString(fullPath))
-				if (hr == EE_OK):
-					# first fill in the H2R_curVoice Structure
-					temp =  parts[3].split('.')
-					parts[3] = temp[0]
-					H2R_curVoice.name = encodeH2RSpeakString(parts[2] + " " +parts[3])
-					H2R_curVoice.languages = encodeH2RSpeakString(parts[1])
-					H2R_curVoice.identifier = encodeH2RSpeakString(parts[1])
-					H2R_curVoice.age = 0
-					if parts[3] == "Male":
-						H2R_curVoice.gender = 1
-						H2R_curVoice.variant = 1
-					elif parts[3] == "Female":
-						H2R_curVoice.gender = 2
-						H2R_curVoice.varient = 2
-					else:
-						H2R_CurVoice.gender = 0
-						H2R_curVoice.variant = 0
-					log.info("_H2R_Speak setVoiceByLanguage: H2R_curVoice Set languages = " + decodeH2RSpeakString(H2R_curVoice.languages) + " name = " + decodeH2RSpeakString(H2R_curVoice.name) + " identifier = " + decodeH2RSpeakString(H2R_curVoice.identifier))
-					return hr
-				else:
-					log.info("_H2R_Speak setVoiceByLanguage: returning %s", hr)
-					return hr
-	log.info("_H2R_Speak setVoiceByLanguage: Language " + lang + " not found.  Reverting to English")
-	lang = "en"
-	for fileName in list:
-		parts = fileName.split("_")
-		if parts[0] == "H2R" or parts[0] == "H2Rplay":
-		# Found one of the NVDA Addon voice file
-#			log.info("_H2R_Speak setVoiceByLanguage: parts = %s %s %s %s", parts[0], parts[1], parts[2], parts[3])
-			if parts[1] == lang:
-				fullPath = os.path.join(os.environ['ALLUSERSPROFILE'], "hear2read", "Languages", fileName)
-				log.info("_H2R_Speak:setVoiceByLanguage - found %s for lang %s",fullPath, lang)
-				hr = H2R_SpeakDLL.H2R_Speak_SetVoice(encodeH2RSpeakString(lang), encodeH2RSpeakString(fullPath))
-				if (hr == EE_OK):
-					# first fill in the H2R_curVoice Structure
-					temp =  parts[3].split('.')
-					parts[3] = temp[0]
-					H2R_curVoice.name = encodeH2RSpeakString(parts[2] + " " +parts[3])
-					H2R_curVoice.languages = encodeH2RSpeakString(parts[1])
-					H2R_curVoice.identifier = encodeH2RSpeakString(parts[1])
-					H2R_curVoice.age = 0
-					if parts[3] == "Male":
-						H2R_curVoice.gender = 1
-						H2R_curVoice.variant = 1
-					elif parts[3] == "Female":
-						H2R_curVoice.gender = 2
-						H2R_curVoice.varient = 2
-					else:
-						H2R_CurVoice.gender = 0
-						H2R_curVoice.variant = 0
-					log.info("_H2R_Speak setVoiceByLanguage: H2R_curVoice Set languages = " + decodeH2RSpeakString(H2R_curVoice.languages) + " name = " + decodeH2RSpeakString(H2R_curVoice.name) + " identifier = " + decodeH2RSpeakString(H2R_curVoice.identifier))
-					return hr
-				else:
-					log.info("_H2R_Speak setVoiceByLanguage: returning %s", hr)
-					return hr
-	H2R_curVoice.name = None
-	return EE_INTERNAL_ERROR
+	record = voiceCatalog.get(lang)
+	_registerNewVoices()
+	if record is None:
+		# Language not found, so revert to English.
+		if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.SET_VOICE, (lang, "en"))
+		record = voiceCatalog.get("en")
+	if record is None:
+		H2R_curVoice.name = None
+		return EE_INTERNAL_ERROR
+	return _setVoice(record)
+
+def getScriptRouter():
+	"""@return: the L{_H2R_scripts.ScriptRouter} for the installed voices.
+	This does no IO, so that it can be called on NVDA's thread for every speak:
+	the router is rebuilt when the catalog has listed the voices again,
+	which lookups on the synthesis thread, such as voice changes, keep up to date.
+	"""
+	global _scriptRouter, _scriptRouterKey
+	key = (voiceCatalog, voiceCatalog.rebuildCount)
+	if _scriptRouter is None or key != _scriptRouterKey:
+		_scriptRouter = _H2R_scripts.getRouter(voiceCatalog.languages(check=False))
+		_scriptRouterKey = key
+	return _scriptRouter
+
+def prefetchVoices(languages):
+	"""Reads the voice files for C{languages}, most likely to be used first, into the OS file cache in the background."""
+	paths = []
+	for lang in languages:
+		record = voiceCatalog.get(lang.split("_")[0])
+		if record is not None and record.path not in paths:
+			paths.append(record.path)
+	voicePrefetcher.prefetch(paths)
 				
 				
 #	log.info("_H2R_Speak_setVoiceByLanguage: filename = " + fileName)
@@ -526,18 +1231,82 @@ def H2R_Speak_errcheck(res, func, args):
 		raise RuntimeError("%s: code %d" % (func.__name__, res))
 	return res
 
-def initialize(indexCallback=None):
+def _recordStartupPhase(phase, start):
+	"""Records the time since C{start} as the duration of C{phase}.
+	@return: the current time, the start of the next phase.
 	"""
-	@param indexCallback: A function which is called when eSpeak reaches an index.
-		It is called with one argument:
-		the number of the index or C{None} when speech stops.
+	now = time.perf_counter()
+	startupTimes[phase] = now - start
+	return now
+
+def formatStartupTimes():
+	return "\n".join("%-16s %8.1fms" % (phase, seconds * 1000) for phase, seconds in startupTimes.items())
+
+def _startEngine(H2R_SpeakPath):
+	global _prosodyInEngine, _registeredCatalogRebuilds
+	start = time.perf_counter()
+	# A new engine has no voices registered.
+	_registeredLanguages.clear()
+	_registeredCatalogRebuilds = None
+	# A new engine has its default parameters, so the user's values are sent again before it synthesizes.
+	_engineParams.clear()
+	_prosody.clear()
+	_prosodyInEngine = False
+	try:
+		H2R_SpeakDLL.H2R_Speak_init(encodeH2RSpeakString(H2R_SpeakPath), callback)
+		_readParameters()
+		_raiseLowVolume()
+	finally:
+		# Set even if it failed, so that nothing waits for it forever.
+		_engineStarted.set()
+	_recordStartupPhase("engineInit", start)
+
+def _readParameters():
+	"""Reads the engine's parameters, so that L{getParameter} can answer without calling it."""
+	for param in READ_PARAMS:
+		_defaultParams[param] = H2R_SpeakDLL.H2R_Speak_GetParameter(param, 0)
+		paramStore.remember(param, H2R_SpeakDLL.H2R_Speak_GetParameter(param, 1))
+
+def _raiseLowVolume():
+	"""Raises the volume to L{START_VOLUME} through L{paramStore} if the engine has started with it too low to hear,
+	unless NVDA has set the volume meanwhile.
 	"""
-	log.info("_H2R_Speak initialize: entered")
-	if (indexCallback != None): log.info("_H2R_Speak indexCallback not None")
-	global H2R_SpeakDLL, bgThread, bgQueue, player, onIndexReached
-	log.info("_H2R_Speak initialize:  H2R_SpeakDLL = " + os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read",  "Hear2Read_addon_engine.dll"))
-	H2R_SpeakDLL = cdll.LoadLibrary(os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read",  "Hear2Read_addon_engine.dll"))
-	H2R_SpeakDLL = cdll.LoadLibrary(os.path.join("C:/ProgramData",              "Hear2Read",  "Hear2Read_addon_engine.dll"))
+	volume = H2R_SpeakDLL.H2R_Speak_GetParameter(H2R_SpeakVOLUME, 1)
+	if volume < MIN_START_VOLUME and paramStore.setUnlessPending(H2R_SpeakVOLUME, START_VOLUME):
+		log.info("H2R engine started with volume %d, setting it to %d", volume, START_VOLUME)
+
+def _registerVoices(exclude):
+	start = time.perf_counter()
+	getAvailableLanguages(exclude)
+	_recordStartupPhase("registerVoices", start)
+
+def _startVoices(language):
+	start = time.perf_counter()
+	record = voiceCatalog.get(language) or voiceCatalog.get("en")
+	registered = ()
+	if record is not None:
+		# Only the voice to load is registered now.
+		# The others are registered behind any speech queued meanwhile.
+		_addVoice(record.language)
+		registered = (record.language,)
+	start = _recordStartupPhase("registerVoice", start)
+	setVoiceByLanguage(language)
+	_recordStartupPhase("loadVoice", start)
+	_recordStartupPhase("ready", _initializeStart)
+	_execWhenDone(_registerVoices, registered)
+	# English is the fallback for languages without a voice, so it is switched to often in mixed text.
+	prefetchVoices((language, "en"))
+
+def _loadEngine(programData):
+	"""Loads the engine DLL from the Hear2Read directory under C{programData} and declares its functions.
+	@return: the path of the Languages directory holding the voices.
+	"""
+	global H2R_SpeakDLL
+	start = time.perf_counter()
+	dllPath = os.path.join(programData, "Hear2Read", "Hear2Read_addon_engine.dll")
+	log.info("_H2R_Speak _loadEngine:  H2R_SpeakDLL = " + dllPath)
+	H2R_SpeakDLL = cdll.LoadLibrary(dllPath)
+	start = _recordStartupPhase("loadLibrary", start)
 	H2R_SpeakDLL.H2R_Speak_init.argtypes=(c_char_p,)
 	H2R_SpeakDLL.H2R_Speak_init.errcheck=H2R_Speak_errcheck
 	H2R_SpeakDLL.H2R_Speak_SetVoice.argtypes=(c_char_p, c_char_p,)
@@ -563,32 +1332,105 @@ def initialize(indexCallback=None):
 #	H2R_SpeakDLL.H2R_Speak_ListVoices.restype=POINTER(POINTER(H2R_Speak_VOICE))
 	
 #	H2R_SpeakDLL.H2R_Speak_GetCurrentVoice.restype=POINTER(H2R_Speak_VOICE)
-	H2R_SpeakPath = os.path.join(os.environ['ALLUSERSPROFILE'], "Hear2Read", "Languages")
-		
-	log.info("_H2R_Speak: H2R_SpeakPath = " + H2R_SpeakPath + " calling H2R_SpeakDLL.H2R_Speak_init")
-	H2R_SpeakDLL.H2R_Speak_init(encodeH2RSpeakString(H2R_SpeakPath), callback)
+	_recordStartupPhase("prototypes", start)
+	return os.path.join(programData, "Hear2Read", "Languages")
+
+def initialize(indexCallback=None, language=None):
+	"""
+	Loads the engine and returns without waiting for it to start.
+	Starting the engine, and registering the voices and loading the voice for C{language} if given,
+	are queued for the synthesis thread, so speech queued meanwhile is spoken once they are done.
+	@param indexCallback: A function which is called when eSpeak reaches an index.
+		It is called with one argument:
+		the number of the index or C{None} when speech stops.
+	@param language: the language of the voice to load.
+	"""
+	log.info("_H2R_Speak initialize: entered")
+	if (indexCallback != None): log.info("_H2R_Speak indexCallback not None")
+	global H2R_SpeakDLL, bgThread, bgQueue, player, onIndexReached, voiceCatalog, feederThread, feedQueue, _initializeStart, _glyphWarmupQueued, _glyphsToWarm
+	startupTimes.clear()
+	_engineStarted.clear()
+	_initializeStart = start = time.perf_counter()
+	programData = os.environ.get('ALLUSERSPROFILE', "C:/ProgramData")
+	# Loaded here rather than in the background, so that NVDA falls back to another synthesizer if it is missing.
+	H2R_SpeakPath = _loadEngine(programData)
+	start = time.perf_counter()
+	voiceCatalog = VoiceCatalog(H2R_SpeakPath)
 	
-	player = nvwave.WavePlayer(channels=1, samplesPerSec=16000, bitsPerSample=16, outputDevice=config.conf["speech"]["outputDevice"], buffered=True)
+	# Opened at the rate of the last voice, usually that of the voice about to be loaded.
+	player = _openPlayer(_sampleRate)
+	start = _recordStartupPhase("player", start)
 	onIndexReached = indexCallback
 #	H2R_SpeakDLL.H2R_Speak_SetSynthCallback(callback)
 	bgQueue = queue.Queue()
+	feedQueue = queue.Queue()
+	_resetRing()
+	# Warm-up left over from before a terminate must not run before the engine is started again.
+	_glyphsToWarm = []
+	_glyphWarmupQueued = False
 	bgThread=BgThread()
 	bgThread.start()
+	feederThread = FeederThread()
+	feederThread.start()
+	log.info("_H2R_Speak: H2R_SpeakPath = " + H2R_SpeakPath + " queuing H2R_SpeakDLL.H2R_Speak_init")
+	_execWhenDone(_startEngine, H2R_SpeakPath)
+	if language:
+		_execWhenDone(_startVoices, language)
+	_recordStartupPhase("threads", start)
+	_recordStartupPhase("initialize", _initializeStart)
+
 
+def initializeHeadless(programData=None):
+	"""
+	Loads and starts the engine for rendering audio without a player, as the batch renderer does.
+	No player is opened and no threads are started, so L{setVoiceByLanguage}, L{setParameter} and L{render}
+	run on the calling thread, which must be the only one using this module.
+	@param programData: the directory holding the Hear2Read directory, by default that in ALLUSERSPROFILE.
+	"""
+	global voiceCatalog, _initializeStart
+	startupTimes.clear()
+	_engineStarted.clear()
+	_initializeStart = time.perf_counter()
+	if programData is None:
+		programData = os.environ.get('ALLUSERSPROFILE', "C:/ProgramData")
+	H2R_SpeakPath = _loadEngine(programData)
+	voiceCatalog = VoiceCatalog(H2R_SpeakPath)
+	_startEngine(H2R_SpeakPath)
+	_registerVoices(())
+	_recordStartupPhase("ready", _initializeStart)
+
+def render(text):
+	"""Synthesizes C{text} with the current voice and parameters, after L{initializeHeadless}.
+	@return: the audio as L{CachedAudio}, 16 bit mono at the voice's sample rate.
+	"""
+	_applyParameters()
+	return _render(text)
 
 def terminate():
-	global bgThread, bgQueue, player, H2R_SpeakDLL , onIndexReached
+	global bgThread, bgQueue, player, H2R_SpeakDLL , onIndexReached, voiceCatalog, feederThread, feedQueue, _glyphsToWarm, _glyphWarmupQueued
 	log.info("_H2R_Speak terminate entered")
-	stop()
-	bgQueue.put((None, None, None))
-	bgThread.join()
+	if bgThread is not None:
+		stop()
+		# No more glyphs are warmed, so the synthesis thread goes straight on to the end of its queue.
+		_glyphsToWarm = []
+		_glyphWarmupQueued = False
+		bgQueue.put((None, None, None, None, None))
+		bgThread.join()
+		feedQueue.put((None, None, None, None))
+		feederThread.join()
+	# Only terminated once the synthesis thread has exited, so that nothing it runs afterwards,
+	# such as warming a glyph left over from a queued warm-up, can call into a terminated engine.
 	H2R_SpeakDLL.H2R_Speak_Terminate()
 	bgThread=None
 	bgQueue=None
-	player.close()
+	feederThread = None
+	feedQueue = None
+	if player is not None:
+		player.close()
 	player=None
 	H2R_SpeakDLL=None
 	onIndexReached = None
+	voiceCatalog = None
 
 def info():
 	# Python 3.8: a path string must be specified, a NULL is fine when what we need is version string.
@@ -0,0 +1,346 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_batch.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Renders text files to WAV or raw PCM files without NVDA, for turning books and papers into audio.
+Each worker process loads its own engine through L{_H2R_Speak.initializeHeadless}, so every core renders at once.
+Text is split with the add-on's sentence segmenter and rendered without a player.
+A batch is described by a JSON manifest of its jobs, one per input file, which is saved as each job finishes,
+so running the same manifest again resumes an interrupted batch.
+Output is written to a .part file and renamed once complete, so a file is either whole or rendered again.
+
+Usage, from the Source directory:
+	python -m synthDrivers._H2R_batch --manifest book.json --language hi --output-dir audio chapter1.txt chapter2.txt
+	python -m synthDrivers._H2R_batch --manifest book.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import types
+import wave
+
+from . import _H2R_normalizer
+from . import _H2R_segmenter
+
+MANIFEST_VERSION = 1
+
+#: Job states.
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+#: Output formats: WAV files, or headerless 16 bit mono little endian PCM at the voice's sample rate.
+FORMATS = ("wav", "pcm")
+
+#: Settings of a batch and their defaults. Rate and volume are percentages, as in NVDA's voice settings.
+DEFAULT_SETTINGS = {
+	"language": "en",
+	"format": "wav",
+	"rate": 30,
+	"volume": 50,
+}
+
+class ManifestError(ValueError):
+	"""The manifest cannot be used for the batch asked for."""
+
+def _installHeadlessModules():
+	"""Outside NVDA, registers stand-ins for the NVDA modules _H2R_Speak imports.
+	The player is never opened when rendering, so nvwave and config need not do anything.
+	"""
+	if "logHandler" not in sys.modules:
+		logHandler = types.ModuleType("logHandler")
+		logHandler.log = logging.getLogger("H2R_batch")
+		sys.modules["logHandler"] = logHandler
+	if "nvwave" not in sys.modules:
+		sys.modules["nvwave"] = types.ModuleType("nvwave")
+	if "config" not in sys.modules:
+		config = types.ModuleType("config")
+		config.conf = {"speech": {"outputDevice": None}}
+		sys.modules["config"] = config
+
+def _fingerprint(path):
+	"""@return: the size and modification time of C{path}, which tell whether it changed since it was rendered."""
+	st = os.stat(path)
+	return [st.st_size, st.st_mtime_ns]
+
+class Manifest(object):
+	"""The settings and jobs of a batch, saved as JSON at L{path}.
+	Each job is a dict of input, output, fingerprint, chars and state, and once rendered, the results of L{_renderJob}.
+	"""
+
+	def __init__(self, path, settings, jobs=None):
+		self.path = path
+		self.settings = settings
+		self.jobs = jobs or []
+		#: The report of the last run, as a dict.
+		self.report = None
+
+	@classmethod
+	def load(cls, path):
+		with open(path, encoding="utf-8") as f:
+			data = json.load(f)
+		if data.get("version") != MANIFEST_VERSION:
+			raise ManifestError("%s: unknown manifest version %r" % (path, data.get("version")))
+		manifest = cls(path, data["settings"], data["jobs"])
+		manifest.report = data.get("report")
+		return manifest
+
+	@classmethod
+	def open(cls, path, settings):
+		"""Loads the manifest at C{path}, or starts a new one if there is none.
+		@param settings: settings given for this run, which must match those of an existing manifest.
+			Settings which are C{None} are taken from the manifest or the defaults.
+		"""
+		if os.path.exists(path):
+			manifest = cls.load(path)
+			for name, value in settings.items():
+				if value is not None and manifest.settings.get(name) != value:
+					raise ManifestError("%s was made with %s %r, not %r" % (path, name, manifest.settings.get(name), value))
+			return manifest
+		merged = dict(DEFAULT_SETTINGS)
+		merged.update((name, value) for name, value in settings.items() if value is not None)
+		if merged["format"] not in FORMATS:
+			raise ManifestError("Unknown format %r" % merged["format"])
+		return cls(path, merged)
+
+	def addInputs(self, inputs, outputDir):
+		"""Adds a job for each input file not already in the batch, writing to C{outputDir}."""
+		known = set(job["input"] for job in self.jobs)
+		outputs = set(job["output"] for job in self.jobs)
+		for path in inputs:
+			path = os.path.abspath(path)
+			if path in known:
+				continue
+			base = os.path.splitext(os.path.basename(path))[0]
+			output = os.path.join(os.path.abspath(outputDir), "%s.%s" % (base, self.settings["format"]))
+			count = 1
+			while output in outputs:
+				# Inputs from different directories may share a name.
+				count += 1
+				output = os.path.join(os.path.abspath(outputDir), "%s_%d.%s" % (base, count, self.settings["format"]))
+			self.jobs.append({"input": path, "output": output, "state": PENDING, "fingerprint": None})
+			known.add(path)
+			outputs.add(output)
+
+	def pendingJobs(self):
+		"""@return: the jobs still to render: those not done, and those done whose input has changed or output gone."""
+		pending = []
+		for job in self.jobs:
+			if job["state"] == DONE:
+				try:
+					if job["fingerprint"] == _fingerprint(job["input"]) and os.path.exists(job["output"]):
+						continue
+				except OSError:
+					pass
+			pending.append(job)
+		# Largest first, so a long file does not start last and leave the other workers idle.
+		pending.sort(key=lambda job: -(os.path.getsize(job["input"]) if os.path.exists(job["input"]) else 0))
+		return pending
+
+	def update(self, result):
+		"""Records the result of a job returned by L{_renderJob}."""
+		for job in self.jobs:
+			if job["input"] == result["input"]:
+				job.update(result)
+				return
+
+	def save(self):
+		"""Saves the manifest, replacing the old one only once the new one is written."""
+		data = {"version": MANIFEST_VERSION, "settings": self.settings, "jobs": self.jobs, "report": self.report}
+		tempPath = self.path + ".tmp"
+		with open(tempPath, "w", encoding="utf-8") as f:
+			json.dump(data, f, indent="\t", ensure_ascii=False)
+		os.replace(tempPath, self.path)
+
+class BatchReport(object):
+	"""Throughput of one run of a batch.
+	@ivar workerSeconds: the time the workers spent rendering, which gives the rate of one busy core.
+	"""
+
+	def __init__(self, workers):
+		self.workers = workers
+		self.files = 0
+		self.failed = 0
+		self.chars = 0
+		self.audioSeconds = 0.0
+		self.workerSeconds = 0.0
+		self.wallSeconds = 0.0
+
+	def add(self, result):
+		if result["state"] != DONE:
+			self.failed += 1
+			return
+		self.files += 1
+		self.chars += result["chars"]
+		self.audioSeconds += result["audioSeconds"]
+		self.workerSeconds += result["seconds"]
+
+	@property
+	def charsPerSecond(self):
+		return self.chars / self.wallSeconds if self.wallSeconds else 0.0
+
+	@property
+	def charsPerSecondPerCore(self):
+		return self.charsPerSecond / self.workers
+
+	@property
+	def charsPerBusyCoreSecond(self):
+		return self.chars / self.workerSeconds if self.workerSeconds else 0.0
+
+	def asDict(self):
+		return {
+			"workers": self.workers, "files": self.files, "failed": self.failed, "chars": self.chars,
+			"audioSeconds": self.audioSeconds, "wallSeconds": self.wallSeconds, "workerSeconds": self.workerSeconds,
+			"charsPerSecond": self.charsPerSecond, "charsPerSecondPerCore": self.charsPerSecondPerCore,
+		}
+
+	def format(self):
+		lines = [
+			"%d files rendered, %d failed, %d characters, %.1f s of audio" % (self.files, self.failed, self.chars, self.audioSeconds),
+			"%.1f s with %d workers: %.0f chars/s, %.0f chars/s per core (%.0f chars/s per busy core)" % (
+				self.wallSeconds, self.workers, self.charsPerSecond, self.charsPerSecondPerCore, self.charsPerBusyCoreSecond),
+		]
+		if self.wallSeconds:
+			lines.append("%.1f times faster than real time" % (self.audioSeconds / self.wallSeconds))
+		return "\n".join(lines)
+
+#: The settings of the batch a worker process renders, set by L{_initWorker}.
+_workerSettings = None
+#: Why the engine of a worker process could not be started, or C{None}.
+_workerError = None
+
+def _initWorker(programData, settings):
+	"""Starts the engine of a worker process and loads the voice and parameters of the batch."""
+	global _workerSettings, _workerError
+	_workerSettings = settings
+	try:
+		_installHeadlessModules()
+		from . import _H2R_Speak
+		_H2R_Speak.initializeHeadless(programData)
+		# setVoiceByLanguage falls back to English, which would render the whole batch in the wrong voice.
+		if _H2R_Speak.voiceCatalog.get(settings["language"]) is None:
+			raise LookupError("No voice is installed for language %r" % settings["language"])
+		if _H2R_Speak.setVoiceByLanguage(settings["language"]) != _H2R_Speak.EE_OK:
+			raise RuntimeError("No voice for %s" % settings["language"])
+		# As SynthDriver sets them.
+		_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakRATE, settings["rate"], 0)
+		_H2R_Speak.setParameter(_H2R_Speak.H2R_SpeakVOLUME, round(settings["volume"] * .8), 0)
+	except Exception as e:
+		# Raising here would make the pool start replacement workers for ever,
+		# so the error fails each job given to this worker instead.
+		_workerError = "%s: %s" % (type(e).__name__, e)
+
+def _renderJob(job):
+	"""Renders one input file in a worker process.
+	@return: the updated job, with state L{DONE} or L{FAILED}.
+	"""
+	result = {"input": job["input"], "output": job["output"]}
+	if _workerError is not None:
+		result.update(state=FAILED, error=_workerError)
+		return result
+	from . import _H2R_Speak
+	start = time.perf_counter()
+	partPath = job["output"] + ".part"
+	try:
+		fingerprint = _fingerprint(job["input"])
+		with open(job["input"], encoding="utf-8-sig") as f:
+			text = f.read()
+		sampleRate = _H2R_Speak._sampleRate
+		numBytes = 0
+		with open(partPath, "wb") as f:
+			writer = None
+			if _workerSettings["format"] == "wav":
+				writer = wave.open(f, "wb")
+				writer.setnchannels(1)
+				writer.setsampwidth(_H2R_Speak.BYTES_PER_SAMPLE)
+				writer.setframerate(sampleRate)
+				write = writer.writeframesraw
+			else:
+				write = f.write
+			# Not the first chunk of an utterance, as time to first audio does not matter here,
+			# so the chunks are as long as the chunking policy allows.
+			normalized = _H2R_normalizer.getNormalizer(_workerSettings["language"]).normalize(text)
+			for chunk in _H2R_segmenter.iterChunks(normalized, _workerSettings["language"], False):
+				audio = _H2R_Speak.render(chunk)
+				write(audio.audio)
+				numBytes += len(audio.audio)
+			if writer is not None:
+				# Fills in the lengths in the header.
+				writer.close()
+		os.replace(partPath, job["output"])
+	except Exception as e:
+		if os.path.exists(partPath):
+			os.remove(partPath)
+		result.update(state=FAILED, error="%s: %s" % (type(e).__name__, e))
+		return result
+	result.update(
+		state=DONE, fingerprint=fingerprint, error=None, chars=len(text),
+		audioSeconds=numBytes / float(_H2R_Speak.BYTES_PER_SAMPLE * sampleRate),
+		seconds=time.perf_counter() - start,
+	)
+	return result
+
+def renderBatch(manifest, workers=None, programData=None, progress=None):
+	"""Renders the pending jobs of C{manifest} with a pool of C{workers} processes, saving it after each job.
+	@param workers: the number of worker processes, by default one per core.
+	@param programData: the directory holding the Hear2Read directory, by default that in ALLUSERSPROFILE.
+	@param progress: called with each job's result as it finishes.
+	@return: a L{BatchReport}.
+	"""
+	jobs = manifest.pendingJobs()
+	workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+	report = BatchReport(workers)
+	start = time.perf_counter()
+	if jobs:
+		with multiprocessing.Pool(workers, _initWorker, (programData, manifest.settings)) as pool:
+			for result in pool.imap_unordered(_renderJob, jobs):
+				manifest.update(result)
+				manifest.save()
+				report.add(result)
+				if progress:
+					progress(result)
+	report.wallSeconds = time.perf_counter() - start
+	manifest.report = report.asDict()
+	manifest.save()
+	return report
+
+def main(args=None):
+	parser = argparse.ArgumentParser(prog="python -m synthDrivers._H2R_batch",
+		description="Renders text files to audio with the Hear2Read voices.")
+	parser.add_argument("inputs", nargs="*", help="UTF-8 text files to add to the batch")
+	parser.add_argument("--manifest", required=True, help="the batch's manifest, which is created if it does not exist")
+	parser.add_argument("--output-dir", default=".", help="where the audio files of added inputs are written")
+	parser.add_argument("--language", help="the language of the voice to use")
+	parser.add_argument("--format", choices=FORMATS)
+	parser.add_argument("--rate", type=int, help="speech rate, 0 to 100")
+	parser.add_argument("--volume", type=int, help="volume, 0 to 100")
+	parser.add_argument("--workers", type=int, help="worker processes, by default one per core")
+	parser.add_argument("--program-data", help="the directory holding the Hear2Read directory, by default that in ALLUSERSPROFILE")
+	args = parser.parse_args(args)
+	logging.basicConfig(level=logging.WARNING)
+	settings = {"language": args.language, "format": args.format, "rate": args.rate, "volume": args.volume}
+	try:
+		manifest = Manifest.open(args.manifest, settings)
+	except ManifestError as e:
+		parser.error(str(e))
+	if args.inputs:
+		os.makedirs(args.output_dir, exist_ok=True)
+		manifest.addInputs(args.inputs, args.output_dir)
+	def progress(result):
+		if result["state"] == DONE:
+			print("%s: %d chars in %.1f s" % (result["output"], result["chars"], result["seconds"]))
+		else:
+			print("%s: failed, %s" % (result["input"], result["error"]))
+	report = renderBatch(manifest, args.workers, args.program_data, progress)
+	print(report.format())
+	return 1 if report.failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_flitevox.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Reads the header of a Flite clustergen voice file (.flitevox) without loading the voice.
+The file is memory mapped, so only the pages holding the header are read from disk.
+The layout, as written by Flite's cst_cg_dump_voice:
+	the header string "CMU_FLITE_CG_VOXDATA-v2.0" and a NUL,
+	an int of 1 in the byte order of the machine that wrote the file,
+	feature name and value pairs ended by the name "end_of_features",
+	then the database name, the types, the number of types and the sample rate.
+Ints are 32 bit, and strings are an int length followed by that many bytes including a trailing NUL.
+"""
+
+import mmap
+import struct
+
+HEADER_STRING = b"CMU_FLITE_CG_VOXDATA-v2.0\0"
+END_OF_FEATURES = "end_of_features"
+#: The sample rate of voices whose header does not give one.
+DEFAULT_SAMPLE_RATE = 16000
+#: Strings longer than this are taken as a sign of a corrupt file.
+MAX_STRING_LENGTH = 64 * 1024
+#: The most types read. Voices have a few hundred.
+MAX_TYPES = 100000
+
+class VoiceHeaderError(ValueError):
+	"""The file is not a Flite clustergen voice this reader understands."""
+
+class VoiceHeader(object):
+	"""Metadata from the header of a voice file.
+	@ivar version: the header string without the trailing NUL.
+	@ivar features: a dict of the voice's features, such as language, gender and build_date.
+	@ivar dbName: the name of the clustergen database.
+	@ivar numTypes: the number of unit types.
+	@ivar sampleRate: the rate of the audio the voice produces, in samples per second.
+	@ivar size: the size of the file in bytes.
+	"""
+
+	__slots__ = ("version", "features", "dbName", "numTypes", "sampleRate", "size")
+
+	def __init__(self, version, features, dbName, numTypes, sampleRate, size):
+		self.version = version
+		self.features = features
+		self.dbName = dbName
+		self.numTypes = numTypes
+		self.sampleRate = sampleRate
+		self.size = size
+
+	def __repr__(self):
+		return "VoiceHeader(%r, sampleRate=%d, size=%d, features=%d)" % (
+			self.dbName, self.sampleRate, self.size, len(self.features))
+
+class _Reader(object):
+
+	def __init__(self, data):
+		self._data = data
+		self._pos = 0
+		self._intFormat = "<i"
+
+	def read(self, length):
+		end = self._pos + length
+		if end > len(self._data):
+			raise VoiceHeaderError("truncated at byte %d" % self._pos)
+		data = self._data[self._pos:end]
+		self._pos = end
+		return data
+
+	def readInt(self):
+		return struct.unpack(self._intFormat, self.read(4))[0]
+
+	def readString(self):
+		length = self.readInt()
+		if length < 0 or length > MAX_STRING_LENGTH:
+			raise VoiceHeaderError("bad string length %d at byte %d" % (length, self._pos - 4))
+		return self.read(length).rstrip(b"\0").decode("utf-8", "replace")
+
+	def readByteOrder(self):
+		data = self.read(4)
+		if struct.unpack("<i", data)[0] == 1:
+			self._intFormat = "<i"
+		elif struct.unpack(">i", data)[0] == 1:
+			self._intFormat = ">i"
+		else:
+			raise VoiceHeaderError("bad byte order marker")
+
+def parseVoiceHeader(data):
+	"""Parses the header at the start of C{data}, a bytes like object holding a voice file.
+	@return: a L{VoiceHeader}
+	@raise VoiceHeaderError: if C{data} does not hold a voice header.
+	"""
+	reader = _Reader(data)
+	if reader.read(len(HEADER_STRING)) != HEADER_STRING:
+		raise VoiceHeaderError("not a Flite clustergen voice")
+	reader.readByteOrder()
+	features = {}
+	while True:
+		name = reader.readString()
+		if name == END_OF_FEATURES:
+			break
+		features[name] = reader.readString()
+	dbName = reader.readString()
+	numTypes = reader.readInt()
+	if numTypes < 0 or numTypes > MAX_TYPES:
+		raise VoiceHeaderError("bad type count %d" % numTypes)
+	for i in range(numTypes):
+		reader.readString()
+	numTypes = reader.readInt()
+	sampleRate = reader.readInt()
+	if sampleRate <= 0:
+		sampleRate = DEFAULT_SAMPLE_RATE
+	return VoiceHeader(HEADER_STRING[:-1].decode("ascii"), features, dbName, numTypes, sampleRate, len(data))
+
+def readVoiceHeader(path):
+	"""Reads the header of the voice file at C{path}.
+	@return: a L{VoiceHeader}
+	@raise VoiceHeaderError: if the file does not hold a voice header.
+	@raise OSError: if the file cannot be read.
+	"""
+	with open(path, "rb") as f:
+		try:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			# Empty files cannot be mapped.
+			raise VoiceHeaderError("empty file")
+		try:
+			return parseVoiceHeader(data)
+		finally:
+			data.close()
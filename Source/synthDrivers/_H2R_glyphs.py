@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_glyphs.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Pre-rendered audio for single characters, used in character mode
+for spelling, typed character echo and moving by character.
+Each voice and parameter state has its own table, filled lazily and warmed in the background.
+"""
+
+import threading
+import unicodedata
+from collections import OrderedDict
+
+#: Character mode text up to this many code points is looked up in the glyph table,
+#: so that an akshara made of a consonant and vowel sign is rendered once too.
+MAX_GLYPH_LENGTH = 4
+#: The number of glyph tables kept, one per voice and parameter state.
+MAX_TABLES = 4
+
+#: Unicode blocks of the script used by each language.
+SCRIPT_BLOCKS = {
+	"hi": (0x0900, 0x097F),
+	"mr": (0x0900, 0x097F),
+	"ne": (0x0900, 0x097F),
+	"sa": (0x0900, 0x097F),
+	"bn": (0x0980, 0x09FF),
+	"as": (0x0980, 0x09FF),
+	"pa": (0x0A00, 0x0A7F),
+	"gu": (0x0A80, 0x0AFF),
+	"or": (0x0B00, 0x0B7F),
+	"ta": (0x0B80, 0x0BFF),
+	"te": (0x0C00, 0x0C7F),
+	"kn": (0x0C80, 0x0CFF),
+	"ml": (0x0D00, 0x0D7F),
+}
+#: Letters, vowel signs, digits and punctuation.
+_GLYPH_CATEGORIES = frozenset(("Lo", "Lu", "Ll", "Mn", "Mc", "Nd", "Po"))
+#: Warmed for every language, as digits and punctuation are typed in every script.
+COMMON_GLYPHS = u"0123456789.,;:!?-'\"()@/"
+LATIN_GLYPHS = u"abcdefghijklmnopqrstuvwxyz"
+
+_glyphsByLanguage = {}
+
+def getGlyphs(language):
+	"""@return: the characters to warm for C{language}: its script's letters, vowel signs, digits and punctuation."""
+	language = (language or "").split("_")[0].lower()
+	glyphs = _glyphsByLanguage.get(language)
+	if glyphs is None:
+		block = SCRIPT_BLOCKS.get(language)
+		if block is None:
+			glyphs = LATIN_GLYPHS + COMMON_GLYPHS
+		else:
+			glyphs = u"".join(
+				c for c in map(chr, range(block[0], block[1] + 1))
+				if unicodedata.category(c) in _GLYPH_CATEGORIES
+			) + COMMON_GLYPHS
+		_glyphsByLanguage[language] = glyphs
+	return glyphs
+
+class GlyphTables(object):
+	"""Glyph tables keyed by voice and parameter state, least recently used dropped first.
+	A table maps character text to L{_H2R_pcmCache.CachedAudio}.
+	"""
+
+	def __init__(self, maxTables=MAX_TABLES):
+		self.maxTables = maxTables
+		self._tables = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def getTable(self, stateKey):
+		with self._lock:
+			table = self._tables.get(stateKey)
+			if table is None:
+				table = self._tables[stateKey] = {}
+				while len(self._tables) > self.maxTables:
+					self._tables.popitem(last=False)
+			else:
+				self._tables.move_to_end(stateKey)
+			return table
+
+	def lookup(self, stateKey, text):
+		"""@return: the audio for C{text} in the table for C{stateKey} or C{None}."""
+		entry = self.getTable(stateKey).get(text)
+		if entry is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+		return entry
+
+	def clear(self):
+		with self._lock:
+			self._tables.clear()
+
+	def __repr__(self):
+		return "GlyphTables(tables=%d, glyphs=%d, hits=%d, misses=%d)" % (
+			len(self._tables), sum(len(t) for t in self._tables.values()), self.hits, self.misses)
@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_metrics.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Rolling latency metrics for the synthesizer, keyed by stage, language and voice.
+Each histogram keeps the most recent samples and computes percentiles when queried,
+so recording a sample is only an append.
+From the NVDA Python console:
+	import synthDrivers._H2R_metrics as m; print(m.formatSummary())
+"""
+
+import threading
+from collections import deque
+
+#: Stages, all in seconds except the real time factor, the feed call rate and the ring buffer fill.
+#: Time from SynthDriver.speak to the first audio fed to the player.
+TIME_TO_FIRST_AUDIO = "timeToFirstAudio"
+#: Time one synthesizeText call blocks the synthesis thread.
+SYNTHESIS_TIME = "synthesisTime"
+#: Time an item waits in the queue before the synthesis thread runs it.
+QUEUE_WAIT = "queueWait"
+#: Seconds of audio produced per second of synthesis.
+REAL_TIME_FACTOR = "realTimeFactor"
+#: Time from a stop to the last of the stopped audio reaching the player.
+CANCEL_TO_SILENCE = "cancelToSilence"
+#: Time the feeder spends post-processing one piece of audio.
+POST_PROCESS_TIME = "postProcessTime"
+#: Time a public SynthDriver entry point spends on NVDA's thread, recorded with the name of the entry point in place of the voice.
+CALLER_TIME = "callerTime"
+#: Calls to the player's feed per second of audio, for each sentence.
+FEED_CALL_RATE = "feedCallRate"
+#: The fraction of the PCM ring buffer in use each time audio in it is handed to the feeder.
+RING_BUFFER_FILL = "ringBufferFill"
+
+STAGES = (TIME_TO_FIRST_AUDIO, SYNTHESIS_TIME, QUEUE_WAIT, REAL_TIME_FACTOR, CANCEL_TO_SILENCE, POST_PROCESS_TIME, CALLER_TIME, FEED_CALL_RATE, RING_BUFFER_FILL)
+
+#: The number of samples each histogram keeps.
+DEFAULT_WINDOW = 1024
+
+#: Whether samples are being recorded.
+enabled = True
+
+class RollingHistogram(object):
+	"""Keeps the last C{window} samples of one measurement."""
+
+	def __init__(self, window=DEFAULT_WINDOW):
+		self._samples = deque(maxlen=window)
+		#: The number of samples ever recorded, including those that have rolled out of the window.
+		self.count = 0
+
+	def add(self, value):
+		self._samples.append(value)
+		self.count += 1
+
+	def percentile(self, pct, samples=None):
+		"""@return: the nearest rank C{pct} percentile of the samples in the window, or C{None} if there are none."""
+		if samples is None:
+			samples = sorted(self._samples.copy())
+		if not samples:
+			return None
+		rank = int(round(pct / 100.0 * (len(samples) - 1)))
+		return samples[rank]
+
+	def summary(self):
+		# deque.copy() is atomic, whereas iterating the deque fails if the synthesis thread adds a sample meanwhile.
+		samples = sorted(self._samples.copy())
+		if not samples:
+			return {"count": self.count}
+		return {
+			"count": self.count,
+			"mean": sum(samples) / len(samples),
+			"min": samples[0],
+			"p50": self.percentile(50, samples),
+			"p95": self.percentile(95, samples),
+			"p99": self.percentile(99, samples),
+			"max": samples[-1],
+		}
+
+_lock = threading.Lock()
+_histograms = {}
+
+def record(stage, language, voice, value):
+	"""Adds a sample. Callers check L{enabled} first."""
+	key = (stage, language, voice)
+	histogram = _histograms.get(key)
+	if histogram is None:
+		with _lock:
+			histogram = _histograms.setdefault(key, RollingHistogram())
+	histogram.add(value)
+
+def getHistogram(stage, language, voice):
+	return _histograms.get((stage, language, voice))
+
+def _sortKey(item):
+	# The language and voice are None before a voice has been loaded.
+	return tuple(part or "" for part in item[0])
+
+def summary(stage=None, language=None, voice=None):
+	"""@return: a dict mapping (stage, language, voice) to a dict of count, mean, min, p50, p95, p99 and max.
+	Any of C{stage}, C{language} and C{voice} narrows the result.
+	"""
+	with _lock:
+		items = list(_histograms.items())
+	return {
+		key: histogram.summary()
+		for key, histogram in sorted(items, key=_sortKey)
+		if (stage is None or key[0] == stage)
+		and (language is None or key[1] == language)
+		and (voice is None or key[2] == voice)
+	}
+
+def formatSummary(**kwargs):
+	lines = ["%-18s %-6s %-24s %7s %9s %9s %9s" % ("stage", "lang", "voice", "count", "p50", "p95", "p99")]
+	for (stage, language, voice), values in summary(**kwargs).items():
+		if "p50" not in values:
+			continue
+		if stage == REAL_TIME_FACTOR:
+			fmt = "%-18s %-6s %-24s %7d %8.2fx %8.2fx %8.2fx"
+			scale = 1
+		elif stage == FEED_CALL_RATE:
+			fmt = "%-18s %-6s %-24s %7d %7.1f/s %7.1f/s %7.1f/s"
+			scale = 1
+		elif stage == RING_BUFFER_FILL:
+			fmt = "%-18s %-6s %-24s %7d %8.1f%% %8.1f%% %8.1f%%"
+			scale = 100
+		else:
+			fmt = "%-18s %-6s %-24s %7d %7.1fms %7.1fms %7.1fms"
+			scale = 1000
+		lines.append(fmt % (stage, language, voice, values["count"], values["p50"] * scale, values["p95"] * scale, values["p99"] * scale))
+	return "\n".join(lines)
+
+def reset():
+	with _lock:
+		_histograms.clear()
@@ -0,0 +1,202 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_normalizer.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Normalizes text before it is segmented and sent to the engine.
+Control and invisible characters are removed with one translate table. Numbers, currency, percentages,
+abbreviations and URLs are rewritten as the language reads them. Runs the engine would otherwise spell out
+or spend a long time on, such as numbers hundreds of digits long and lines of repeated punctuation, are broken up.
+Results are kept in a bounded least recently used cache keyed by language and text,
+as screen readers speak the same text over and over.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+#: The default number of texts whose normalized form is cached.
+DEFAULT_MAX_ENTRIES = 2048
+#: Text longer than this is normalized but not cached.
+MAX_CACHED_LENGTH = 1024
+#: Digit runs longer than this are read in groups of L{DIGIT_GROUP} digits rather than as one number.
+MAX_NUMBER_DIGITS = 15
+DIGIT_GROUP = 3
+#: A run of more than this many of the same symbol is cut to one.
+MAX_SYMBOL_REPEAT = 3
+
+def _buildTranslateTable():
+	table = {}
+	# Control characters, including 0x1, which NVDA uses for embedded commands.
+	for cp in range(0x00, 0x20):
+		table[cp] = None
+	for cp in range(0x7F, 0xA0):
+		table[cp] = None
+	# Line breaks and unusual spaces.
+	for cp in (0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x85, 0xA0, 0x1680, 0x2028, 0x2029, 0x202F, 0x205F, 0x3000):
+		table[cp] = u" "
+	for cp in range(0x2000, 0x200B):
+		table[cp] = u" "
+	# Soft hyphen, zero width space, word joiner, byte order mark and the replacement character.
+	# Zero width joiners and non-joiners are kept, as they change how Indic text is written.
+	for cp in (0xAD, 0x200B, 0x2060, 0xFEFF, 0xFFFD):
+		table[cp] = None
+	# Variation selectors and emoji skin tone modifiers.
+	for cp in range(0xFE00, 0xFE10):
+		table[cp] = None
+	for cp in range(0x1F3FB, 0x1F400):
+		table[cp] = None
+	# Lone surrogates, which cannot be encoded for the engine.
+	for cp in range(0xD800, 0xE000):
+		table[cp] = None
+	return table
+
+_TRANSLATE_TABLE = _buildTranslateTable()
+
+#: Zero width joiners after emoji, which join emoji into sequences such as family emoji.
+_EMOJI_JOINER_RE = re.compile(u"(?<=[\u2600-\u27bf\U0001F000-\U0001FAFF])\u200d")
+_URL_RE = re.compile(r"\b(?:(?:https?|ftp)://|www\.)[^\s<>\"']+", re.IGNORECASE)
+_URL_SCHEME_RE = re.compile(r"^(?:https?|ftp)://", re.IGNORECASE)
+_URL_SEPARATOR_RE = re.compile(r"[/:?=&_#%~+.-]+")
+_REPEATED_SYMBOL_RE = re.compile(r"([^\w\s])\1{%d,}" % MAX_SYMBOL_REPEAT)
+#: Numbers grouped with commas, in the Indian (1,00,000) or Western (100,000) way.
+_GROUPED_NUMBER_RE = re.compile(r"(?<![\d,.])\d{1,3}(?:(?:,\d\d)*,\d{3}|(?:,\d{3})+)(?![\d]|,\d)")
+_DIGIT_RE = re.compile(r"\d")
+_LONG_NUMBER_RE = re.compile(r"\d{%d,}" % (MAX_NUMBER_DIGITS + 1))
+_CURRENCY_RE = re.compile(r"(?:₹|\bRs\.?|\bINR)\s?(\d+(?:\.\d+)?)")
+_PERCENT_RE = re.compile(r"(\d)\s?%")
+
+def _groupDigits(match):
+	digits = match.group()
+	return u" ".join(digits[i:i + DIGIT_GROUP] for i in range(0, len(digits), DIGIT_GROUP))
+
+def _urlWords(url):
+	return u" ".join(word for word in _URL_SEPARATOR_RE.split(url) if word)
+
+class LanguageRules(object):
+	"""Normalization rules for one language.
+	@ivar abbreviations: maps lower case abbreviations, without their full stop, to what is said for them.
+	@ivar rupees: the word for rupees, said after the amount.
+	@ivar percent: the word for per cent.
+	@ivar dot: the word said for a full stop in a URL, or C{None} to pause there.
+	"""
+
+	def __init__(self, abbreviations=None, rupees=u"rupees", percent=u"percent", dot=None):
+		self.abbreviations = abbreviations or {}
+		self.rupees = rupees
+		self.percent = percent
+		self.dot = dot
+
+#: Rules by language code. Languages without an entry use the default rules.
+LANGUAGE_RULES = {
+	"en": LanguageRules({
+		"dr": u"doctor", "mr": u"mister", "mrs": u"missus", "prof": u"professor", "e.g": u"for example", "i.e": u"that is",
+		"etc": u"et cetera", "vs": u"versus", "approx": u"approximately", "govt": u"government", "dept": u"department",
+	}, dot=u"dot"),
+	"hi": LanguageRules({u"डॉ": u"डॉक्टर", u"प्रो": u"प्रोफ़ेसर", u"रु": u"रुपये"}, u"रुपये", u"प्रतिशत"),
+	"mr": LanguageRules({u"डॉ": u"डॉक्टर", u"प्रा": u"प्राध्यापक", u"रु": u"रुपये"}, u"रुपये", u"टक्के"),
+	"ne": LanguageRules({u"डा": u"डाक्टर", u"रु": u"रुपैयाँ"}, u"रुपैयाँ", u"प्रतिशत"),
+	"bn": LanguageRules({}, u"টাকা", u"শতাংশ"),
+	"ta": LanguageRules({u"ரூ": u"ரூபாய்"}, u"ரூபாய்", u"சதவீதம்"),
+	"te": LanguageRules({u"డా": u"డాక్టర్", u"రూ": u"రూపాయలు"}, u"రూపాయలు", u"శాతం"),
+	"kn": LanguageRules({u"ಡಾ": u"ಡಾಕ್ಟರ್", u"ರೂ": u"ರೂಪಾಯಿ"}, u"ರೂಪಾಯಿ", u"ಶೇಕಡಾ"),
+	"ml": LanguageRules({u"ഡോ": u"ഡോക്ടർ", u"രൂ": u"രൂപ"}, u"രൂപ", u"ശതമാനം"),
+	"gu": LanguageRules({u"ડૉ": u"ડૉક્ટર", u"રૂ": u"રૂપિયા"}, u"રૂપિયા", u"ટકા"),
+	"pa": LanguageRules({u"ਡਾ": u"ਡਾਕਟਰ"}, u"ਰੁਪਏ", u"ਪ੍ਰਤੀਸ਼ਤ"),
+	"or": LanguageRules({}, u"ଟଙ୍କା", u"ପ୍ରତିଶତ"),
+}
+DEFAULT_RULES = LanguageRules()
+
+class Normalizer(object):
+	"""Normalizes text according to a set of L{LanguageRules}."""
+
+	def __init__(self, rules=DEFAULT_RULES):
+		self.rules = rules
+		self._abbreviationRe = None
+		if rules.abbreviations:
+			# Longest first, so that e.g. "mrs" is not taken for "mr".
+			names = sorted(rules.abbreviations, key=len, reverse=True)
+			self._abbreviationRe = re.compile(
+				u"(?<![\\w.])(%s)\\.(?=\\s|\\Z)" % u"|".join(re.escape(name) for name in names), re.IGNORECASE
+			)
+
+	def _url(self, match):
+		url = _URL_SCHEME_RE.sub(u"", match.group())
+		if self.rules.dot:
+			# Dots are said. Other separators are pauses.
+			return (u" %s " % self.rules.dot).join(_urlWords(part) for part in url.split(u".") if part)
+		return _urlWords(url)
+
+	def _abbreviation(self, match):
+		return self.rules.abbreviations[match.group(1).lower()]
+
+	def normalize(self, text):
+		text = text.translate(_TRANSLATE_TABLE)
+		# Each rewrite is only tried when the text could need it, as a substring test is much faster than a regular expression scan.
+		if u"\u200d" in text:
+			text = _EMOJI_JOINER_RE.sub(u"", text)
+		if u"://" in text or u"www." in text or u"WWW." in text:
+			text = _URL_RE.sub(self._url, text)
+		text = _REPEATED_SYMBOL_RE.sub(r"\1", text)
+		if _DIGIT_RE.search(text):
+			if u"," in text:
+				text = _GROUPED_NUMBER_RE.sub(lambda match: match.group().replace(u",", u""), text)
+			if u"₹" in text or u"Rs" in text or u"INR" in text:
+				# Said after the amount, as it is read.
+				text = _CURRENCY_RE.sub(u"\\1 %s" % self.rules.rupees, text)
+			if u"%" in text:
+				text = _PERCENT_RE.sub(u"\\1 %s" % self.rules.percent, text)
+			text = _LONG_NUMBER_RE.sub(_groupDigits, text)
+		if self._abbreviationRe is not None and u"." in text:
+			text = self._abbreviationRe.sub(self._abbreviation, text)
+		return text
+
+_normalizers = {}
+
+def getNormalizer(language=None):
+	"""@return: the cached L{Normalizer} for C{language}, which may include a region such as hi_IN."""
+	language = (language or "").split("_")[0].lower()
+	normalizer = _normalizers.get(language)
+	if normalizer is None:
+		normalizer = _normalizers[language] = Normalizer(LANGUAGE_RULES.get(language, DEFAULT_RULES))
+	return normalizer
+
+class NormalizationCache(object):
+	"""Normalizes text, keeping the results for the most recently used texts."""
+
+	def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES):
+		self.maxEntries = maxEntries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def normalize(self, text, language=None):
+		"""@return: C{text} normalized for C{language}."""
+		if len(text) > MAX_CACHED_LENGTH:
+			return getNormalizer(language).normalize(text)
+		key = (language, text)
+		with self._lock:
+			result = self._entries.get(key)
+			if result is not None:
+				self._entries.move_to_end(key)
+				self.hits += 1
+				return result
+			self.misses += 1
+		result = getNormalizer(language).normalize(text)
+		with self._lock:
+			self._entries[key] = result
+			while len(self._entries) > self.maxEntries:
+				self._entries.popitem(last=False)
+		return result
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __repr__(self):
+		return "NormalizationCache(entries=%d, hits=%d, misses=%d)" % (len(self._entries), self.hits, self.misses)
@@ -0,0 +1,95 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_paramStore.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""The engine's speech parameters as last set from NVDA.
+Settings are held until the next synthesis, so dragging a slider through many steps
+costs one engine call per parameter rather than one per step, and reads are answered without calling the engine.
+"""
+
+import threading
+
+class ParameterStore(object):
+	"""Collects parameter changes and the values they leave the engine with.
+	A change made relative to a known value is stored as an absolute one.
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		#: Maps parameters to the values the engine has or will have once pending changes are pushed.
+		self._values = {}
+		#: Maps parameters to the (value, relative) change not yet pushed to the engine.
+		self._pending = {}
+		#: The number of changes made.
+		self.sets = 0
+		#: The number of changes pushed to the engine.
+		self.pushes = 0
+		self.reads = 0
+		#: The number of reads answered from the store.
+		self.cachedReads = 0
+
+	def set(self, param, value, relative=0):
+		with self._lock:
+			self.sets += 1
+			if relative:
+				if param in self._values:
+					value += self._values[param]
+					relative = 0
+				else:
+					pending = self._pending.get(param)
+					if pending is not None:
+						# The value is unknown, so the pending change is relative too.
+						value += pending[0]
+			self._pending[param] = (value, relative)
+			if not relative:
+				self._values[param] = value
+
+	def get(self, param):
+		"""@return: the current value of C{param}, or C{None} if it is not known without asking the engine."""
+		with self._lock:
+			self.reads += 1
+			value = self._values.get(param)
+			if value is not None:
+				self.cachedReads += 1
+			return value
+
+	def remember(self, param, value):
+		"""Stores C{value} read from the engine, unless a change to C{param} is pending."""
+		with self._lock:
+			if param not in self._pending:
+				self._values[param] = value
+
+	def setUnlessPending(self, param, value):
+		"""Sets C{param} to C{value}, unless a change to it is already pending.
+		@return: whether it was set.
+		"""
+		with self._lock:
+			if param in self._pending:
+				return False
+			self.sets += 1
+			self._pending[param] = (value, 0)
+			self._values[param] = value
+			return True
+
+	@property
+	def hasPending(self):
+		return bool(self._pending)
+
+	def takePending(self):
+		"""@return: the pending changes as a list of (param, value, relative) tuples, which the caller pushes to the engine."""
+		with self._lock:
+			pending = self._pending
+			self._pending = {}
+			self.pushes += len(pending)
+		return [(param, value, relative) for param, (value, relative) in pending.items()]
+
+	@property
+	def savedCalls(self):
+		"""The number of engine calls avoided by coalescing changes and answering reads from the store."""
+		return (self.sets - self.pushes - len(self._pending)) + self.cachedReads
+
+	def __repr__(self):
+		return "ParameterStore(sets=%d, pushes=%d, reads=%d, cachedReads=%d, savedCalls=%d)" % (
+			self.sets, self.pushes, self.reads, self.cachedReads, self.savedCalls)
@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_pcmCache.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""A least recently used cache of synthesized audio for short, often repeated utterances,
+such as control roles, menu names and typed characters.
+"""
+
+import threading
+from collections import OrderedDict
+
+#: The default total size of the cached audio.
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+#: Text longer than this is not cached. Long text is rarely repeated word for word.
+MAX_TEXT_LENGTH = 64
+
+class CachedAudio(object):
+	"""Synthesized audio for one utterance.
+	@ivar audio: the PCM data.
+	@ivar indexes: (byteOffset, indexNum) tuples for the engine index marks in the audio, in order.
+	"""
+
+	__slots__ = ("audio", "indexes")
+
+	def __init__(self, audio, indexes=()):
+		self.audio = audio
+		self.indexes = tuple(indexes)
+
+def normalizeText(text):
+	"""@return: C{text} with runs of white space collapsed, as they do not change the audio."""
+	return " ".join(text.split())
+
+class PcmCache(object):
+	"""Maps keys to L{CachedAudio}, evicting the least recently used entries to stay within a byte budget."""
+
+	def __init__(self, maxBytes=DEFAULT_MAX_BYTES):
+		self.maxBytes = maxBytes
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		#: The total size of the cached audio.
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key):
+		"""@return: the L{CachedAudio} for C{key} or C{None}."""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry
+
+	def put(self, key, entry):
+		size = len(entry.audio)
+		if size > self.maxBytes:
+			return
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self.bytes -= len(old.audio)
+			self._entries[key] = entry
+			self.bytes += size
+			while self.bytes > self.maxBytes:
+				evictedKey, evicted = self._entries.popitem(last=False)
+				self.bytes -= len(evicted.audio)
+				self.evictions += 1
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.bytes = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def __repr__(self):
+		return "PcmCache(entries=%d, bytes=%d, hits=%d, misses=%d, evictions=%d)" % (
+			len(self._entries), self.bytes, self.hits, self.misses, self.evictions)
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_plan.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Speech sequences compiled into plans.
+A plan is the whole of one speech sequence as an immutable list of steps:
+text chunks to synthesize, characters to spell, index marks, voice switches, prosody changes and pauses.
+It is queued for the synthesis thread as a single item, so a say all sequence costs one queue operation
+rather than one per chunk and index, and a stop cancels all of it at once.
+"""
+
+from . import _H2R_segmenter
+
+#: Step operations. Each step is an (op, argument) tuple.
+#: Synthesize a text chunk. The argument is the text.
+OP_TEXT = 0
+#: Speak text in character mode. The argument is the text.
+OP_CHARACTER = 1
+#: Report an index once playback reaches it. The argument is the index.
+OP_INDEX = 2
+#: Switch to the voice for a language. The argument is the language.
+OP_VOICE = 3
+#: Change prosody until the end of the plan. The argument is an (attribute, multiplier) tuple,
+#: with attribute one of pitch, rate and volume, applied to the user's setting for it.
+OP_PROSODY = 4
+#: Pause. The argument is the length of the pause in ms.
+OP_BREAK = 5
+
+OP_NAMES = {
+	OP_TEXT: "text",
+	OP_CHARACTER: "character",
+	OP_INDEX: "index",
+	OP_VOICE: "voice",
+	OP_PROSODY: "prosody",
+	OP_BREAK: "break",
+}
+
+class SpeechPlan(object):
+	"""An immutable plan for one speech sequence.
+	@ivar steps: a tuple of (op, argument) tuples.
+	@ivar language: the language in effect at the end of the plan.
+	"""
+
+	__slots__ = ("steps", "language")
+
+	def __init__(self, steps, language):
+		object.__setattr__(self, "steps", tuple(steps))
+		object.__setattr__(self, "language", language)
+
+	def __setattr__(self, name, value):
+		raise AttributeError("SpeechPlan is immutable")
+
+	def __len__(self):
+		return len(self.steps)
+
+	def __repr__(self):
+		return "SpeechPlan(%s)" % ", ".join("%s %r" % (OP_NAMES[op], arg) for op, arg in self.steps)
+
+class PlanBuilder(object):
+	"""Builds a L{SpeechPlan} from the items of a speech sequence, in order.
+	Text is split into chunks by the chunking policy of the language in effect when it is added.
+	"""
+
+	def __init__(self, language):
+		self.language = language
+		self._steps = []
+		self._first = True
+		self._charMode = False
+
+	def text(self, text):
+		if self._charMode:
+			self._steps.append((OP_CHARACTER, text))
+		else:
+			for chunk in _H2R_segmenter.iterChunks(text, self.language, self._first):
+				self._steps.append((OP_TEXT, chunk))
+		self._first = False
+
+	def characterMode(self, state):
+		self._charMode = state
+
+	def index(self, index):
+		self._steps.append((OP_INDEX, index))
+
+	def switchLanguage(self, language):
+		"""Switches to the voice for C{language}, unless it is already in effect."""
+		if language != self.language:
+			self._steps.append((OP_VOICE, language))
+			self.language = language
+
+	def prosody(self, attr, multiplier):
+		self._steps.append((OP_PROSODY, (attr, multiplier)))
+
+	def pause(self, ms):
+		if ms > 0:
+			self._steps.append((OP_BREAK, ms))
+
+	def build(self):
+		return SpeechPlan(self._steps, self.language)
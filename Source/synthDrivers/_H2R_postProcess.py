@@ -0,0 +1,345 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_postProcess.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Post-processing of synthesized audio on its way to the player:
+silence trimming, pitch preserving time compression for speeds beyond the engine's fastest rate, and gain.
+All work on the 16 bit mono audio as it streams, with numpy array operations.
+numpy is optional. Without it, L{available} is C{False} and audio is fed unchanged.
+"""
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+#: Whether post-processing can be used, which needs numpy.
+available = numpy is not None
+
+class TimeCompressor(object):
+	"""Speeds up streamed audio without changing its pitch, by waveform similarity overlap-add (WSOLA).
+	Each step copies a sequence of input to the output, starting where it best matches the end of the previous sequence
+	within a seek window, crossfading the two over an overlap. The input then moves on by the sequence length times the speed.
+	The output lags the input by up to one sequence and seek window.
+	@ivar produced: the samples output since the last reset.
+	"""
+
+	SEQUENCE_MS = 40
+	OVERLAP_MS = 8
+	SEEK_MS = 12
+
+	def __init__(self, sampleRate, speed=1.0):
+		self.sampleRate = sampleRate
+		self.speed = speed
+		self._seqLen = sampleRate * self.SEQUENCE_MS // 1000
+		self._overlap = sampleRate * self.OVERLAP_MS // 1000
+		self._seek = sampleRate * self.SEEK_MS // 1000
+		self._hop = self._seqLen - self._overlap
+		self._fadeIn = numpy.linspace(0.0, 1.0, self._overlap, endpoint=False, dtype=numpy.float32)
+		self._fadeOut = 1.0 - self._fadeIn
+		self.reset()
+
+	def reset(self):
+		self._input = numpy.zeros(0, numpy.float32)
+		#: The end of the last sequence, crossfaded with the start of the next one before it is output.
+		self._tail = None
+		self._skipFraction = 0.0
+		#: Input samples still to be skipped that have not arrived yet.
+		self._skipAhead = 0
+		self.produced = 0
+
+	@property
+	def pending(self):
+		"""The samples of output to come before the end of the input buffered so far.
+		The tail is not counted, as the output from it is crossfaded with the input that follows it.
+		"""
+		return max(0, int((len(self._input) - self._skipAhead) / self.speed))
+
+	def _bestOffset(self, window):
+		"""@return: the offset into C{window} at which it best matches the tail, by normalized cross correlation."""
+		overlap = self._overlap
+		corr = numpy.correlate(window, self._tail, "valid")
+		energy = numpy.cumsum(numpy.square(window))
+		energy = energy[overlap - 1:] - numpy.concatenate(((0.0,), energy[:-overlap]))
+		return int(numpy.argmax(corr / numpy.sqrt(energy + 1.0)))
+
+	def process(self, samples):
+		"""@param samples: float32 samples to append to the input.
+		@return: the float32 samples output.
+		"""
+		if self._skipAhead:
+			skipped = min(self._skipAhead, len(samples))
+			samples = samples[skipped:]
+			self._skipAhead -= skipped
+		buf = numpy.concatenate((self._input, samples)) if len(self._input) else samples
+		seqLen, overlap, hop = self._seqLen, self._overlap, self._hop
+		need = seqLen + self._seek
+		out = []
+		pos = 0
+		while len(buf) - pos >= need:
+			if self._tail is None:
+				start = pos
+				out.append(buf[start:start + hop])
+			else:
+				start = pos + self._bestOffset(buf[pos:pos + self._seek + overlap - 1])
+				out.append(self._tail * self._fadeOut + buf[start:start + overlap] * self._fadeIn)
+				out.append(buf[start + overlap:start + hop])
+			self._tail = buf[start + hop:start + seqLen]
+			skip = hop * self.speed + self._skipFraction
+			pos += int(skip)
+			self._skipFraction = skip - int(skip)
+		# Copied, so that the tail and input do not keep the whole buffer alive.
+		if self._tail is not None:
+			self._tail = self._tail.copy()
+		if pos > len(buf):
+			self._skipAhead = pos - len(buf)
+		self._input = buf[pos:].copy()
+		if not out:
+			return numpy.zeros(0, numpy.float32)
+		result = numpy.concatenate(out)
+		self.produced += len(result)
+		return result
+
+	def flush(self):
+		"""@return: the rest of the output, with the remaining input shortened by the speed. The state is then reset."""
+		rest = self._input[:int(len(self._input) / self.speed)]
+		tail = self._tail
+		if tail is None:
+			result = rest
+		elif len(rest) >= self._overlap:
+			result = numpy.concatenate((tail, rest[self._overlap:]))
+			result[:self._overlap] = tail * self._fadeOut + rest[:self._overlap] * self._fadeIn
+		else:
+			result = numpy.concatenate((tail, rest))
+		self.reset()
+		return result
+
+class PostProcessor(object):
+	"""Applies time compression and gain to the pieces of audio fed to the player,
+	moving the index callback at the end of each piece to the point in the output that matches it.
+	Pieces go in and come out as (data, onDone) tuples, as for L{nvwave.WavePlayer.feed}.
+	With a speed of 1, audio is passed through with only the gain applied, so there is no added latency.
+	"""
+
+	def __init__(self, sampleRate, speed=1.0, gain=1.0):
+		self.sampleRate = sampleRate
+		self.speed = speed
+		self.gain = gain
+		self._compressor = None
+		#: (output sample, onDone) for the index callbacks waiting for their output.
+		self._pendingCallbacks = []
+
+	@property
+	def active(self):
+		return self.speed != 1 or self.gain != 1
+
+	def configure(self, speed, gain):
+		"""Changes the speed and gain. Returns the pieces flushed by turning off time compression."""
+		pieces = []
+		if speed == 1 and self._compressor is not None:
+			pieces = self.flush()
+			self._compressor = None
+		elif self._compressor is not None:
+			self._compressor.speed = speed
+		self.speed = speed
+		self.gain = gain
+		return pieces
+
+	def reset(self):
+		"""Drops the buffered audio and callbacks, for a stop."""
+		if self._compressor is not None:
+			self._compressor.reset()
+		self._pendingCallbacks = []
+
+	def _toBytes(self, samples):
+		if self.gain != 1:
+			samples = samples * self.gain
+		return numpy.clip(samples, -32768, 32767).astype("<i2").tobytes()
+
+	def _split(self, samples):
+		"""Splits the output at the positions of the pending callbacks it reaches."""
+		pieces = []
+		end = self._compressor.produced
+		start = end - len(samples)
+		prev = 0
+		while self._pendingCallbacks and self._pendingCallbacks[0][0] <= end:
+			at, onDone = self._pendingCallbacks.pop(0)
+			at = max(at - start, prev)
+			pieces.append((self._toBytes(samples[prev:at]), onDone))
+			prev = at
+		if prev < len(samples):
+			pieces.append((self._toBytes(samples[prev:]), None))
+		return pieces
+
+	def feed(self, data, onDone=None):
+		"""@return: the (data, onDone) pieces to feed to the player for C{data} and C{onDone}, which may be none yet."""
+		if self.speed == 1:
+			if self.gain != 1 and data:
+				data = self._toBytes(numpy.frombuffer(data, "<i2").astype(numpy.float32))
+			return [(data, onDone)]
+		if self._compressor is None:
+			self._compressor = TimeCompressor(self.sampleRate, self.speed)
+		samples = self._compressor.process(numpy.frombuffer(data, "<i2").astype(numpy.float32))
+		if onDone is not None:
+			self._pendingCallbacks.append((self._compressor.produced + self._compressor.pending, onDone))
+		return self._split(samples)
+
+	def flush(self):
+		"""@return: the pieces for all the audio and callbacks still buffered, at the end of speech."""
+		if self._compressor is None:
+			return []
+		produced = self._compressor.produced
+		samples = self._compressor.flush()
+		self._compressor.produced = produced + len(samples)
+		pieces = self._split(samples)
+		# Any callbacks beyond the end of the audio, as its length was estimated.
+		pieces.extend((b"", onDone) for at, onDone in self._pendingCallbacks)
+		self._pendingCallbacks = []
+		self._compressor.produced = 0
+		return pieces
+
+class SilenceTrimmer(object):
+	"""Trims the silence the engine puts at the start and end of each synthesized text.
+	Silence is found by the energy of short frames, relative to the loudest frame of the speech so far,
+	as the engine applies the volume before the audio gets here and quiet speech must not be taken for silence.
+	Silence at the start of speech is dropped
+	and longer silences, such as the end of one sentence and start of the next, are cut to L{maxGapMs}.
+	Silent audio is held until the audio after it shows how long the silence is,
+	so index callbacks in it keep their order and land in the silence that is kept.
+	When sound comes, the held audio just before it is measured again against the level the speech has reached,
+	so that a quiet onset, such as an unvoiced consonant at the start of speech, is kept.
+	Pieces go in and come out as (data, onDone) tuples, as for L{PostProcessor}.
+	@ivar inputBytes: the bytes of audio fed in.
+	@ivar trimmedBytes: the bytes of silence dropped.
+	"""
+
+	#: The length of the frames whose energy is measured.
+	FRAME_MS = 2
+	#: Frames with a root mean square amplitude this many dB below the loudest frame so far are silent.
+	#: At full volume this is about -50 dB full scale.
+	RELATIVE_THRESHOLD_DB = -40
+	#: Frames with a root mean square amplitude below this are always silent, about -84 dB full scale.
+	FLOOR = 2
+
+	def __init__(self, sampleRate, maxGapMs=250, leadMs=0):
+		self.sampleRate = sampleRate
+		self.maxGapMs = maxGapMs
+		self.leadMs = leadMs
+		self._frameSamples = max(1, sampleRate * self.FRAME_MS // 1000)
+		self._floorEnergy = float(self.FLOOR * self.FLOOR * self._frameSamples)
+		self._relativeEnergy = 10.0 ** (self.RELATIVE_THRESHOLD_DB / 10.0)
+		self.inputBytes = 0
+		self.trimmedBytes = 0
+		self.reset()
+
+	def reset(self):
+		"""Drops the held silence and starts again, for a stop."""
+		#: The silent pieces held back.
+		self._held = []
+		#: Whether there has been sound since the start of speech.
+		self._sounded = False
+		#: The energy of the loudest frame since the start of speech.
+		self._peakEnergy = 0.0
+
+	@property
+	def holding(self):
+		"""Whether silence or index callbacks are held back."""
+		return bool(self._held)
+
+	def _frameEnergies(self, data):
+		frame = self._frameSamples
+		samples = numpy.frombuffer(data, "<i2")
+		numFrames = -(-len(samples) // frame)
+		padded = numpy.zeros(numFrames * frame, numpy.float32)
+		padded[:len(samples)] = samples
+		return numpy.einsum("ij,ij->i", padded.reshape(numFrames, frame), padded.reshape(numFrames, frame))
+
+	def _soundBounds(self, data):
+		"""@return: the byte offsets of the start of the first and end of the last frame with sound in C{data}, or C{None} if it is silent."""
+		frame = self._frameSamples
+		energy = self._frameEnergies(data)
+		# Each frame is measured against the loudest frame before it, including those in earlier audio.
+		peak = numpy.maximum(numpy.maximum.accumulate(energy), self._peakEnergy)
+		self._peakEnergy = float(peak[-1])
+		sounded = numpy.flatnonzero(energy >= numpy.maximum(peak * self._relativeEnergy, self._floorEnergy))
+		if not len(sounded):
+			return None
+		return int(sounded[0]) * frame * 2, min(len(data), (int(sounded[-1]) + 1) * frame * 2)
+
+	def _onsetBytes(self):
+		"""@return: the bytes at the end of the held audio which are sound at the level the speech has now reached."""
+		threshold = max(self._peakEnergy * self._relativeEnergy, self._floorEnergy)
+		frameBytes = self._frameSamples * 2
+		onset = 0
+		for data, onDone in reversed(self._held):
+			if not data:
+				continue
+			silent = numpy.flatnonzero(self._frameEnergies(data) < threshold)
+			if len(silent):
+				onset += len(data) - min(len(data), (int(silent[-1]) + 1) * frameBytes)
+				break
+			onset += len(data)
+		return onset
+
+	def _release(self, pieces, extra=b"", onset=False):
+		"""Adds the held silence and the silence C{extra} after it to C{pieces}, cut to the gap allowed, and clears it.
+		@param onset: whether sound follows, in which case any quiet onset at the end of the silence is kept too.
+		"""
+		allowed = (self.maxGapMs if self._sounded else self.leadMs) * self.sampleRate // 1000 * 2
+		held = self._held
+		if extra:
+			held.append((extra, None))
+		total = sum(len(data) for data, onDone in held)
+		# The kept audio is that in the gap allowed at the start and the onset at the end.
+		tailStart = total - self._onsetBytes() if onset else total
+		pos = 0
+		for data, onDone in held:
+			length = len(data)
+			head = min(length, max(0, allowed - pos))
+			tail = min(length, max(0, tailStart - pos))
+			kept = data if head >= tail else data[:head] + data[tail:]
+			self.trimmedBytes += length - len(kept)
+			if kept or onDone:
+				pieces.append((kept, onDone))
+			pos += length
+		self._held = []
+
+	def feed(self, data, onDone=None, keep=False):
+		"""@param keep: whether C{data} is kept whole, as for a pause that was asked for.
+		@return: the (data, onDone) pieces to feed to the player for C{data} and C{onDone}, which may be none yet.
+		"""
+		self.inputBytes += len(data)
+		if not data:
+			if self._held:
+				self._held.append((data, onDone))
+				return []
+			return [(data, onDone)]
+		if keep:
+			bounds = (0, len(data))
+		else:
+			bounds = self._soundBounds(data)
+			if bounds is None:
+				self._held.append((data, onDone))
+				return []
+		start, end = bounds
+		pieces = []
+		self._release(pieces, data[:start], not keep)
+		self._sounded = True
+		if end == len(data):
+			pieces.append((data[start:], onDone))
+		else:
+			pieces.append((data[start:end], None))
+			self._held.append((data[end:], onDone))
+		return pieces
+
+	def flush(self):
+		"""@return: the index callbacks held in the silence at the end of speech, which is dropped."""
+		pieces = []
+		for data, onDone in self._held:
+			self.trimmedBytes += len(data)
+			if onDone:
+				pieces.append((b"", onDone))
+		self.reset()
+		return pieces
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_ringBuffer.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""A preallocated ring buffer of PCM audio between the engine callback and the feeder.
+The callback copies each buffer the engine delivers straight from the engine's memory into the ring,
+so the roughly 10 ms buffers cost no Python objects, and the feeder reads the audio out in larger blocks.
+Marks, such as indexes, are kept at the byte position they fall at, and reads end at them.
+"""
+
+import threading
+from collections import deque
+from ctypes import addressof, c_char, memmove
+
+#: The default size of the ring, about 30 seconds of audio at 16 kHz.
+DEFAULT_CAPACITY = 1024 * 1024
+
+class PcmRingBuffer(object):
+	"""A ring of audio written by one thread and read by another.
+	Positions count the bytes written since the last reset, so they only grow,
+	and the byte at a position is at that position modulo the capacity in the ring.
+	@ivar writePos: the position the next write goes to.
+	@ivar readPos: the position the next read starts at.
+	@ivar maxUsed: the most bytes the ring has held, for diagnostics.
+	@ivar markCount: the number of marks added since the last reset.
+	Marks are also read up to a count, as a mark at the end of the audio read may have been added
+	with the audio after it rather than with that before it.
+	"""
+
+	__slots__ = ("capacity", "writePos", "readPos", "maxUsed", "markCount", "_marksRead", "_buffer", "_address", "_view", "_marks", "_condition")
+
+	def __init__(self, capacity=DEFAULT_CAPACITY):
+		self.capacity = capacity
+		self._buffer = bytearray(capacity)
+		self._address = addressof((c_char * capacity).from_buffer(self._buffer))
+		self._view = memoryview(self._buffer)
+		# (position, mark) for the marks not yet read past.
+		self._marks = deque()
+		self._condition = threading.Condition()
+		self.reset()
+
+	def reset(self):
+		"""Empties the ring. Only call this while neither thread is using it."""
+		self.writePos = 0
+		self.readPos = 0
+		self.maxUsed = 0
+		self.markCount = 0
+		self._marksRead = 0
+		self._marks.clear()
+
+	@property
+	def used(self):
+		return self.writePos - self.readPos
+
+	@property
+	def free(self):
+		return self.capacity - (self.writePos - self.readPos)
+
+	def waitForSpace(self, numBytes, isCancelled):
+		"""Waits until the ring has room for C{numBytes}, which is no more than its capacity.
+		@param isCancelled: called while waiting, and when it returns C{True} waiting stops.
+		@return: whether there is room.
+		"""
+		with self._condition:
+			while self.free < numBytes:
+				if isCancelled():
+					return False
+				self._condition.wait()
+		return True
+
+	def wake(self):
+		"""Wakes a writer waiting for room, so that it checks whether it has been cancelled."""
+		with self._condition:
+			self._condition.notify_all()
+
+	def write(self, address, numBytes):
+		"""Copies C{numBytes} at C{address} into the ring, if it has room for them.
+		@return: the write position after them, or -1 if there is no room.
+		"""
+		writePos = self.writePos
+		capacity = self.capacity
+		used = writePos - self.readPos + numBytes
+		if used > capacity:
+			return -1
+		offset = writePos % capacity
+		if offset + numBytes <= capacity:
+			memmove(self._address + offset, address, numBytes)
+		else:
+			first = capacity - offset
+			memmove(self._address + offset, address, first)
+			memmove(self._address, address + first, numBytes - first)
+		self.writePos = writePos = writePos + numBytes
+		if used > self.maxUsed:
+			self.maxUsed = used
+		return writePos
+
+	def mark(self, position, mark):
+		"""Adds C{mark} at C{position}, at or after the position of the last mark."""
+		self._marks.append((position, mark))
+		self.markCount += 1
+
+	def _advance(self, position):
+		with self._condition:
+			self.readPos = position
+			self._condition.notify_all()
+
+	def _popMark(self):
+		self._marksRead += 1
+		return self._marks.popleft()
+
+	def read(self, end, markCount, blockBytes):
+		"""Reads the audio up to position C{end} and the marks up to C{markCount} in blocks of up to C{blockBytes},
+		ending blocks at marks. The room each block took is freed once it has been copied out.
+		@return: an iterator of (data, mark) tuples, with mark C{None} for a block not ending at a mark.
+		A mark with no audio before it comes with empty data.
+		"""
+		marks = self._marks
+		capacity = self.capacity
+		view = self._view
+		while True:
+			pos = self.readPos
+			mark = None
+			stop = min(end, pos + blockBytes)
+			if self._marksRead < markCount and marks[0][0] <= stop:
+				stop, mark = self._popMark()
+				stop = max(stop, pos)
+			if stop == pos and mark is None:
+				return
+			offset = pos % capacity
+			if offset + stop - pos <= capacity:
+				data = view[offset:offset + stop - pos].tobytes()
+			else:
+				data = b"".join((view[offset:], view[:offset + stop - pos - capacity]))
+			self._advance(stop)
+			yield data, mark
+
+	def discard(self, end, markCount):
+		"""Drops the audio up to position C{end} and the marks up to C{markCount} unread."""
+		while self._marksRead < markCount:
+			self._popMark()
+		if end > self.readPos:
+			self._advance(end)
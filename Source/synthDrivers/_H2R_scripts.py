@@ -0,0 +1,288 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_scripts.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Splits text into runs by Unicode script, so that text mixing scripts, as Indian web pages do,
+can be spoken by the installed voice for each script without a language change command.
+Each script is given by a precomputed table of code point ranges, from which one regular expression
+with a character class for each script is compiled, so runs are found in C rather than in a Python loop over every character.
+Spaces, punctuation, ASCII digits and combining marks belong to no script and stay with the run around them.
+"""
+
+import re
+
+#: Scripts. Characters not in the table, such as spaces, punctuation and ASCII digits, are COMMON.
+COMMON = 0
+LATIN = 1
+DEVANAGARI = 2
+BENGALI = 3
+GURMUKHI = 4
+GUJARATI = 5
+ORIYA = 6
+TAMIL = 7
+TELUGU = 8
+KANNADA = 9
+MALAYALAM = 10
+SINHALA = 11
+ARABIC = 12
+
+SCRIPT_NAMES = {
+	COMMON: "common",
+	LATIN: "Latin",
+	DEVANAGARI: "Devanagari",
+	BENGALI: "Bengali",
+	GURMUKHI: "Gurmukhi",
+	GUJARATI: "Gujarati",
+	ORIYA: "Oriya",
+	TAMIL: "Tamil",
+	TELUGU: "Telugu",
+	KANNADA: "Kannada",
+	MALAYALAM: "Malayalam",
+	SINHALA: "Sinhala",
+	ARABIC: "Arabic",
+}
+
+#: Inclusive code point ranges of the letters, signs and native digits of each script.
+SCRIPT_RANGES = {
+	LATIN: ((0x41, 0x5A), (0x61, 0x7A), (0xAA, 0xAA), (0xBA, 0xBA), (0xC0, 0xD6), (0xD8, 0xF6), (0xF8, 0x24F), (0x1E00, 0x1EFF)),
+	# The danda and double danda are used by other Indian scripts, so are common.
+	DEVANAGARI: ((0x900, 0x963), (0x966, 0x97F), (0xA8E0, 0xA8FF)),
+	BENGALI: ((0x980, 0x9FF),),
+	GURMUKHI: ((0xA00, 0xA7F),),
+	GUJARATI: ((0xA80, 0xAFF),),
+	ORIYA: ((0xB00, 0xB7F),),
+	TAMIL: ((0xB80, 0xBFF),),
+	TELUGU: ((0xC00, 0xC7F),),
+	KANNADA: ((0xC80, 0xCFF),),
+	MALAYALAM: ((0xD00, 0xD7F),),
+	SINHALA: ((0xD80, 0xDFF),),
+	# Arabic letters, leaving its punctuation, tatweel and vowel marks common.
+	ARABIC: ((0x620, 0x63F), (0x641, 0x64A), (0x660, 0x669), (0x66E, 0x6D3), (0x6D5, 0x6D5), (0x6F0, 0x6FF), (0x750, 0x77F)),
+}
+
+#: The languages written in each script, in the order their voices are preferred.
+SCRIPT_LANGUAGES = {
+	LATIN: ("en",),
+	DEVANAGARI: ("hi", "mr", "ne", "sa", "kok"),
+	BENGALI: ("bn", "as"),
+	GURMUKHI: ("pa",),
+	GUJARATI: ("gu",),
+	ORIYA: ("or",),
+	TAMIL: ("ta",),
+	TELUGU: ("te",),
+	KANNADA: ("kn",),
+	MALAYALAM: ("ml",),
+	SINHALA: ("si",),
+	ARABIC: ("ur", "sd", "ks", "ar"),
+}
+#: The script each language is written in.
+LANGUAGE_SCRIPTS = dict((language, script) for script, languages in SCRIPT_LANGUAGES.items() for language in languages)
+
+#: Runs with fewer letters than this, such as an acronym in the middle of a sentence,
+#: are spoken by the voice of the text around them rather than switching voices for them.
+MIN_RUN_CHARS = 5
+
+def _buildScriptTable():
+	table = bytearray(0x10000)
+	for script, ranges in SCRIPT_RANGES.items():
+		for first, last in ranges:
+			table[first:last + 1] = bytes((script,)) * (last - first + 1)
+	return table
+
+#: The script of each code point in the basic multilingual plane. Those beyond it are common.
+_SCRIPT_TABLE = _buildScriptTable()
+
+def scriptOf(ch):
+	"""@return: the script of the character C{ch}."""
+	cp = ord(ch)
+	return _SCRIPT_TABLE[cp] if cp < 0x10000 else COMMON
+
+def _charClass(ranges):
+	return u"".join(u"\\u%04x-\\u%04x" % (first, last) for first, last in ranges)
+
+#: The scripts in the order of the groups of L{_RUN_RE}.
+_RUN_SCRIPTS = tuple(sorted(SCRIPT_RANGES))
+#: A run starts at a character of a script and takes in the characters after it that are in no other script.
+#: Each script has a group, so the script of a run is the index of the group that matched.
+_RUN_RE = re.compile(u"|".join(
+	u"([%s][^%s]*)" % (
+		_charClass(SCRIPT_RANGES[script]),
+		u"".join(_charClass(SCRIPT_RANGES[other]) for other in _RUN_SCRIPTS if other != script),
+	)
+	for script in _RUN_SCRIPTS
+))
+
+def iterScriptRuns(text):
+	"""Splits C{text} into runs of one script.
+	Common characters before the first run are in it and those after a run are in it, so the runs cover the whole text.
+	@return: an iterator of (script, start, end) tuples.
+	"""
+	first = True
+	for match in _RUN_RE.finditer(text):
+		start, end = match.span()
+		yield _RUN_SCRIPTS[match.lastindex - 1], 0 if first else start, end
+		first = False
+
+class ScriptRouter(object):
+	"""Routes the script runs of text to the installed voices for their scripts.
+	The text items of a speech sequence are routed together, so that a run is judged short or long
+	by its letters across the items, and a short item, such as an acronym on a button, does not switch voices.
+	Runs with fewer than L{minRunChars} letters, and runs in scripts with no voice installed,
+	are spoken by the voice of the run before them, or of the run after them at the start of the sequence.
+	When every run is short, the voice in use speaks Latin text, as it does acronyms,
+	and the voice for the longest run in another script speaks the rest.
+	"""
+
+	def __init__(self, languages, minRunChars=MIN_RUN_CHARS):
+		"""@param languages: the languages with a voice installed."""
+		self.languages = tuple(languages)
+		self.minRunChars = minRunChars
+		#: The language whose voice is used for each script with a voice installed.
+		self._scriptLanguages = {}
+		for script, scriptLanguages in SCRIPT_LANGUAGES.items():
+			for language in scriptLanguages:
+				if language in self.languages:
+					self._scriptLanguages[script] = language
+					break
+		#: L{_scriptLanguages} with each preferred language for its script, by preferred language.
+		self._preferredLanguages = {}
+		#: Matches the start of a run with at least L{minRunChars} letters, for each script.
+		self._longRunRes = dict(
+			(script, re.compile(u"(?:[^%s]*[%s]){%d}" % (_charClass(ranges), _charClass(ranges), minRunChars)))
+			for script, ranges in SCRIPT_RANGES.items()
+		)
+		#: Matches a letter, for each script.
+		self._letterRes = dict((script, re.compile(u"[%s]" % _charClass(ranges))) for script, ranges in SCRIPT_RANGES.items())
+
+	def languageFor(self, script, preferred=None):
+		"""@return: the language to speak C{script} in, which is C{preferred} if that is written in it and installed,
+		or C{None} if no voice for it is installed.
+		"""
+		return self._languagesFor(preferred).get(script)
+
+	def _languagesFor(self, preferred):
+		"""@return: a dict giving the language to speak each script with a voice in, with C{preferred} for its script."""
+		languages = self._preferredLanguages.get(preferred)
+		if languages is None:
+			languages = dict(self._scriptLanguages)
+			if preferred in LANGUAGE_SCRIPTS and preferred in self.languages:
+				languages[LANGUAGE_SCRIPTS[preferred]] = preferred
+			self._preferredLanguages[preferred] = languages
+		return languages
+
+	def _letters(self, text, start, end, script):
+		"""@return: the letters of C{script} in C{text} from C{start} to C{end}, counted up to L{minRunChars}."""
+		if end - start >= self.minRunChars and self._longRunRes[script].match(text, start, end):
+			return self.minRunChars
+		return len(self._letterRes[script].findall(text, start, end))
+
+	def _runs(self, text, languages):
+		"""@return: a list of [language, start, end, letters] for the runs of C{text}, with runs for the same language joined."""
+		if text.isascii():
+			# Most text is, so it is routed without a scan for runs.
+			letters = self._letters(text, 0, len(text), LATIN)
+			return [[languages.get(LATIN), 0, len(text), letters]] if letters else []
+		runs = []
+		for match in _RUN_RE.finditer(text):
+			script = _RUN_SCRIPTS[match.lastindex - 1]
+			language = languages.get(script)
+			if runs and runs[-1][0] == language:
+				runs[-1][2] = match.end()
+			else:
+				runs.append([language, match.start() if runs else 0, match.end(), script])
+		# Runs joined for a language are in its script. Runs with no voice are never long, so their letters do not matter.
+		for run in runs:
+			run[3] = 0 if run[0] is None else self._letters(text, run[1], run[2], run[3])
+		return runs
+
+	def splitSequence(self, texts, preferred=None):
+		"""Splits the text items of a speech sequence into the runs to be spoken by each voice.
+		@param preferred: the language asked for, whose voice speaks the text in its script.
+		@return: a list with a list of (language, text) tuples covering each of C{texts},
+		with language C{None} for text to be spoken by the voice already in use.
+		"""
+		languages = self._languagesFor(preferred)
+		if len(texts) == 1:
+			# Most sequences are one text in one script, which needs no grouping.
+			text = texts[0]
+			if text.isascii():
+				return [[(languages.get(LATIN) if self._longRunRes[LATIN].match(text) else None, text)]]
+			runsByText = [self._runs(text, languages)]
+			if len(runsByText[0]) <= 1:
+				if not runsByText[0]:
+					return [[(None, text)]]
+				language, start, end, letters = runsByText[0][0]
+				if letters < self.minRunChars and language == languages.get(LATIN):
+					language = None
+				return [[(language, text)]]
+		elif all(text.isascii() for text in texts):
+			# Most sequences are, and all their runs are Latin, so they make one run across the texts.
+			latin = languages.get(LATIN)
+			if latin is not None and not any(self._longRunRes[LATIN].match(text) for text in texts):
+				if sum(self._letters(text, 0, len(text), LATIN) for text in texts) < self.minRunChars:
+					latin = None
+			return [[(latin, text)] for text in texts]
+		else:
+			runsByText = [self._runs(text, languages) for text in texts]
+		#: [language, start, end, letters] for each run of the texts, in order.
+		#: Its language is replaced by that of the voice to speak it.
+		runs = [run for textRuns in runsByText for run in textRuns]
+		if len(texts) > 1:
+			# Runs for the same language on either side of the end of a text are one run, with the letters of both.
+			i = 0
+			while i < len(runs):
+				j = i + 1
+				while j < len(runs) and runs[j][0] == runs[i][0]:
+					j += 1
+				if j > i + 1:
+					letters = sum(run[3] for run in runs[i:j])
+					for run in runs[i:j]:
+						run[3] = letters
+				i = j
+		minRunChars = self.minRunChars
+		current = next((run[0] for run in runs if run[0] is not None and run[3] >= minRunChars), None)
+		if current is None:
+			# Every run is short, so Latin text stays with the voice in use and the longest other run picks the voice.
+			latin = languages.get(LATIN)
+			others = [run for run in runs if run[0] is not None and run[0] != latin]
+			fallback = max(others, key=lambda run: run[3])[0] if others else None
+			for run in runs:
+				run[0] = fallback
+		else:
+			# Short runs go with the long run before them, or the first long run at the start.
+			for run in runs:
+				if run[0] is not None and run[3] >= minRunChars:
+					current = run[0]
+				else:
+					run[0] = current
+		routed = []
+		for text, textRuns in zip(texts, runsByText):
+			if not textRuns:
+				routed.append([(None, text)])
+				continue
+			merged = []
+			for language, start, end, letters in textRuns:
+				if merged and merged[-1][0] == language:
+					merged[-1][2] = end
+				else:
+					merged.append([language, start, end])
+			routed.append([(language, text[start:end]) for language, start, end in merged])
+		return routed
+
+	def split(self, text, preferred=None):
+		"""Splits C{text}, as a speech sequence of its own, into the runs to be spoken by each voice.
+		@see: L{splitSequence}
+		"""
+		return self.splitSequence((text,), preferred)[0]
+
+_routers = {}
+
+def getRouter(languages):
+	"""@return: the cached L{ScriptRouter} for the installed C{languages}."""
+	languages = tuple(languages)
+	router = _routers.get(languages)
+	if router is None:
+		router = _routers[languages] = ScriptRouter(languages)
+	return router
@@ -0,0 +1,287 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_segmenter.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Splits text into the sentences and clauses that are sent to the engine one at a time,
+and merges them into chunks sized for the engine.
+Boundaries are found with one precompiled regular expression per language,
+so the scan runs in the regular expression engine instead of a Python loop over every character.
+A terminator only ends a segment when it is followed by white space or the end of the text,
+which keeps decimal numbers such as 3.14 and 1,000 together.
+"""
+
+import re
+
+#: Kinds of segment boundaries.
+SENTENCE_END = 0
+CLAUSE_END = 1
+TEXT_END = 2
+
+#: Full stop, exclamation and question marks, horizontal ellipsis, danda, double danda,
+#: Arabic question mark and Urdu full stop.
+SENTENCE_TERMINATORS = u".!?…।॥؟۔"
+#: Comma, semicolon, Arabic comma and Arabic semicolon.
+CLAUSE_TERMINATORS = u",;،؛"
+#: Closing quotes and brackets which stay with the segment they follow.
+CLOSERS = u"\"')]}’”»"
+OPENERS = u"\"'([{‘“«"
+
+#: Abbreviations are not looked for in words longer than this.
+MAX_ABBREVIATION_LENGTH = 10
+
+_LAST_WORD_RE = re.compile(r"\S+$")
+
+class LanguageRules(object):
+	"""Segmentation rules for one language.
+	@ivar abbreviations: lower case words which do not end a sentence when followed by a full stop.
+	@ivar sentenceTerminators: extra characters ending a sentence in this language.
+	@ivar clauseTerminators: extra characters ending a clause in this language.
+	"""
+
+	def __init__(self, abbreviations=(), sentenceTerminators=u"", clauseTerminators=u""):
+		self.abbreviations = frozenset(abbreviations)
+		self.sentenceTerminators = sentenceTerminators
+		self.clauseTerminators = clauseTerminators
+
+#: Abbreviations which are common in every language, as English text is mixed into most documents.
+_COMMON_ABBREVIATIONS = (
+	"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "e.g", "i.e", "rs", "govt", "dept", "approx", "fig",
+)
+
+#: Rules by language code. Languages without an entry use the default rules.
+LANGUAGE_RULES = {
+	"en": LanguageRules(_COMMON_ABBREVIATIONS + ("mt", "inc", "ltd", "jan", "feb", "aug", "sept", "oct", "nov", "dec")),
+	"hi": LanguageRules(_COMMON_ABBREVIATIONS + (u"डॉ", u"प्रो", u"रु", u"सं", u"श्री", u"श्रीमती")),
+	"mr": LanguageRules(_COMMON_ABBREVIATIONS + (u"डॉ", u"प्रा", u"रु", u"श्री", u"सौ")),
+	"ne": LanguageRules(_COMMON_ABBREVIATIONS + (u"डा", u"प्रा", u"रु", u"श्री")),
+	"bn": LanguageRules(_COMMON_ABBREVIATIONS + (u"ড", u"মো", u"মোঃ", u"শ্রী", u"শ্রীমতী")),
+	"ta": LanguageRules(_COMMON_ABBREVIATIONS + (u"திரு", u"திருமதி", u"செல்வி", u"டாக்டர்", u"ரூ")),
+	"te": LanguageRules(_COMMON_ABBREVIATIONS + (u"శ్రీ", u"డా", u"రూ")),
+	"kn": LanguageRules(_COMMON_ABBREVIATIONS + (u"ಶ್ರೀ", u"ಡಾ", u"ರೂ")),
+	"ml": LanguageRules(_COMMON_ABBREVIATIONS + (u"ശ്രീ", u"ഡോ", u"രൂ")),
+	"gu": LanguageRules(_COMMON_ABBREVIATIONS + (u"શ્રી", u"ડૉ", u"રૂ")),
+	"pa": LanguageRules(_COMMON_ABBREVIATIONS + (u"ਸ੍ਰੀ", u"ਡਾ")),
+	"ur": LanguageRules(_COMMON_ABBREVIATIONS),
+}
+DEFAULT_RULES = LanguageRules(_COMMON_ABBREVIATIONS)
+
+def _charClass(chars):
+	return u"[" + u"".join(re.escape(c) for c in chars) + u"]"
+
+class Segmenter(object):
+	"""Finds segment boundaries in text according to a set of L{LanguageRules}."""
+
+	def __init__(self, rules=DEFAULT_RULES):
+		self.rules = rules
+		self._abbreviations = rules.abbreviations
+		self._boundaryRe = re.compile(
+			u"(?:(%s+)|%s+)%s*(?=\\s|\\Z)" % (
+				_charClass(SENTENCE_TERMINATORS + rules.sentenceTerminators),
+				_charClass(CLAUSE_TERMINATORS + rules.clauseTerminators),
+				_charClass(CLOSERS),
+			)
+		)
+
+	def _isAbbreviation(self, text, dotPos):
+		match = _LAST_WORD_RE.search(text, max(0, dotPos - MAX_ABBREVIATION_LENGTH - 1), dotPos)
+		if not match:
+			return False
+		word = match.group().lstrip(OPENERS)
+		if len(word) == 1 and "A" <= word <= "Z":
+			# An initial, as in J. K. Rowling.
+			return True
+		return word.lower() in self._abbreviations
+
+	def iterBoundaries(self, text, pos=0):
+		"""Lazily finds the segment boundaries in C{text}, starting at C{pos}.
+		@return: an iterator of (end, kind) tuples,
+			where C{end} is the offset just past the terminator and any closing quotes.
+		"""
+		for match in self._boundaryRe.finditer(text, pos):
+			terminator = match.group(1)
+			if terminator is None:
+				yield match.end(), CLAUSE_END
+			elif terminator == ".":
+				if not self._isAbbreviation(text, match.start()):
+					yield match.end(), SENTENCE_END
+			elif terminator[0] in u".…" and not terminator.strip(u".…"):
+				# An ellipsis is a pause, not necessarily the end of the sentence.
+				yield match.end(), CLAUSE_END
+			else:
+				yield match.end(), SENTENCE_END
+
+	def iterSegments(self, text):
+		"""Lazily splits C{text} into segments.
+		@return: an iterator of (segment, kind) tuples with white space stripped from each segment.
+			Empty segments are skipped.
+		"""
+		start = 0
+		for end, kind in self.iterBoundaries(text):
+			segment = text[start:end].strip()
+			if segment:
+				yield segment, kind
+			start = end
+		segment = text[start:].strip()
+		if segment:
+			yield segment, TEXT_END
+
+class IncrementalSegmenter(object):
+	"""Segments text which arrives in pieces, such as a file read in blocks.
+	A boundary at the very end of the text fed so far is held back until more text or L{flush} shows whether it is one.
+	"""
+
+	def __init__(self, segmenter):
+		self._segmenter = segmenter
+		self._buffer = u""
+
+	def feed(self, text):
+		"""@return: a list of the (segment, kind) tuples completed by C{text}."""
+		buffer = self._buffer + text
+		segments = []
+		start = 0
+		for end, kind in self._segmenter.iterBoundaries(buffer):
+			if end >= len(buffer):
+				break
+			segment = buffer[start:end].strip()
+			if segment:
+				segments.append((segment, kind))
+			start = end
+		self._buffer = buffer[start:]
+		return segments
+
+	def flush(self):
+		"""@return: the (segment, kind) tuples left in the buffer."""
+		buffer, self._buffer = self._buffer, u""
+		return list(self._segmenter.iterSegments(buffer))
+
+_segmenters = {}
+
+def getSegmenter(language=None):
+	"""@return: the cached L{Segmenter} for C{language}, which may include a region such as hi_IN."""
+	language = (language or "").split("_")[0].lower()
+	segmenter = _segmenters.get(language)
+	if segmenter is None:
+		segmenter = _segmenters[language] = Segmenter(LANGUAGE_RULES.get(language, DEFAULT_RULES))
+	return segmenter
+
+def iterSegments(text, language=None):
+	return getSegmenter(language).iterSegments(text)
+
+class ChunkingPolicy(object):
+	"""Sizes of the chunks passed to the engine for one language.
+	Every engine call has a fixed cost, so short clauses are merged,
+	but the first chunk of an utterance is kept short so that audio starts quickly.
+	@ivar firstChunkChars: the first chunk ends at the first boundary at or past this many characters.
+		0 ends it at the first clause.
+	@ivar targetChars: later chunks end at the first boundary at or past this many characters.
+	@ivar maxChars: segments are not merged into a chunk longer than this.
+	"""
+
+	def __init__(self, firstChunkChars=0, targetChars=120, maxChars=400):
+		self.firstChunkChars = firstChunkChars
+		self.targetChars = targetChars
+		self.maxChars = maxChars
+
+#: Chunking policies by language code. Languages without an entry use the default policy.
+#: Scripts with many combining marks need more characters for the same length of speech.
+CHUNKING_POLICIES = {
+	"en": ChunkingPolicy(targetChars=120),
+	"hi": ChunkingPolicy(targetChars=160),
+	"mr": ChunkingPolicy(targetChars=160),
+	"ne": ChunkingPolicy(targetChars=160),
+	"bn": ChunkingPolicy(targetChars=160),
+	"ta": ChunkingPolicy(targetChars=200),
+	"te": ChunkingPolicy(targetChars=180),
+	"kn": ChunkingPolicy(targetChars=180),
+	"ml": ChunkingPolicy(targetChars=200),
+}
+DEFAULT_CHUNKING_POLICY = ChunkingPolicy()
+
+class ChunkerStats(object):
+	"""Counters for the chunks produced by all L{Chunker}s.
+	@ivar utterances: the texts chunked which start an utterance.
+		Texts which go on with an utterance, such as those after the first in a speech sequence, count only in its chunks.
+	"""
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.utterances = 0
+		self.chunks = 0
+		self.characters = 0
+
+	@property
+	def chunksPerUtterance(self):
+		return self.chunks / self.utterances if self.utterances else 0.0
+
+	@property
+	def averageChunkSize(self):
+		return self.characters / self.chunks if self.chunks else 0.0
+
+	def __repr__(self):
+		return "ChunkerStats(utterances=%d, chunks=%d, chunksPerUtterance=%.2f, averageChunkSize=%.1f)" % (
+			self.utterances, self.chunks, self.chunksPerUtterance, self.averageChunkSize)
+
+chunkerStats = ChunkerStats()
+
+class Chunker(object):
+	"""Merges segments into chunks according to a L{ChunkingPolicy}."""
+
+	def __init__(self, policy=DEFAULT_CHUNKING_POLICY, stats=chunkerStats):
+		self.policy = policy
+		self.stats = stats
+
+	def iterChunks(self, segments, first=True):
+		"""Lazily merges (segment, kind) tuples into chunks.
+		@param first: whether these segments start an utterance,
+			in which case the first chunk uses the short first chunk size.
+		@return: an iterator of chunk strings.
+		"""
+		policy = self.policy
+		stats = self.stats
+		if first:
+			stats.utterances += 1
+		target = policy.firstChunkChars if first else policy.targetChars
+		parts = []
+		length = 0
+		for segment, kind in segments:
+			if parts and length + 1 + len(segment) > policy.maxChars:
+				chunk = u" ".join(parts)
+				stats.chunks += 1
+				stats.characters += len(chunk)
+				yield chunk
+				parts = []
+				length = 0
+				target = policy.targetChars
+			length += len(segment) + (1 if parts else 0)
+			parts.append(segment)
+			if length >= target:
+				chunk = u" ".join(parts)
+				stats.chunks += 1
+				stats.characters += len(chunk)
+				yield chunk
+				parts = []
+				length = 0
+				target = policy.targetChars
+		if parts:
+			chunk = u" ".join(parts)
+			stats.chunks += 1
+			stats.characters += len(chunk)
+			yield chunk
+
+_chunkers = {}
+
+def getChunker(language=None):
+	"""@return: the cached L{Chunker} for C{language}."""
+	language = (language or "").split("_")[0].lower()
+	chunker = _chunkers.get(language)
+	if chunker is None:
+		chunker = _chunkers[language] = Chunker(CHUNKING_POLICIES.get(language, DEFAULT_CHUNKING_POLICY))
+	return chunker
+
+def iterChunks(text, language=None, first=True):
+	"""Splits C{text} into segments and merges them into chunks for the engine."""
+	return getChunker(language).iterChunks(iterSegments(text, language), first)
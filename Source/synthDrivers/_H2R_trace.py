@@ -0,0 +1,110 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_trace.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Low overhead tracing of the synthesizer's hot paths.
+Events are recorded into a fixed size in memory ring buffer, with formatting put off until the buffer is dumped.
+Call sites check L{enabled} before building any event data, so a disabled tracer costs one attribute lookup:
+	if _H2R_trace.enabled: _H2R_trace.record(_H2R_trace.ENQUEUE, func.__name__)
+From the NVDA Python console:
+	import synthDrivers._H2R_trace as t; t.enable()
+	print(t.formatEvents())
+"""
+
+import itertools
+import threading
+import time
+
+#: Event types.
+SPEAK = 0
+ENQUEUE = 1
+DEQUEUE = 2
+DLL_CALL_START = 3
+DLL_CALL_END = 4
+FIRST_FEED = 5
+INDEX_QUEUED = 6
+INDEX_FIRED = 7
+DONE_SPEAKING = 8
+STOP = 9
+PAUSE = 10
+SET_PARAMETER = 11
+GET_PARAMETER = 12
+SET_VOICE = 13
+SPEECH_COMMAND = 14
+CACHE_HIT = 15
+SILENCE = 16
+
+EVENT_NAMES = {
+	SPEAK: "speak",
+	ENQUEUE: "enqueue",
+	DEQUEUE: "dequeue",
+	DLL_CALL_START: "dllCallStart",
+	DLL_CALL_END: "dllCallEnd",
+	FIRST_FEED: "firstFeed",
+	INDEX_QUEUED: "indexQueued",
+	INDEX_FIRED: "indexFired",
+	DONE_SPEAKING: "doneSpeaking",
+	STOP: "stop",
+	PAUSE: "pause",
+	SET_PARAMETER: "setParameter",
+	GET_PARAMETER: "getParameter",
+	SET_VOICE: "setVoice",
+	SPEECH_COMMAND: "speechCommand",
+	CACHE_HIT: "cacheHit",
+	SILENCE: "silence",
+}
+
+#: The number of events kept. Must be a power of 2.
+DEFAULT_SIZE = 4096
+
+#: Whether events are being recorded.
+enabled = False
+
+_size = DEFAULT_SIZE
+_buffer = [None] * _size
+# next() on an itertools.count is atomic, so recording threads never get the same slot.
+_counter = itertools.count()
+
+def record(eventType, data=None):
+	"""Records an event. Only call this when L{enabled} is true.
+	@param data: any object describing the event. It is only formatted when the buffer is dumped.
+	"""
+	seq = next(_counter)
+	_buffer[seq & (_size - 1)] = (seq, time.perf_counter(), eventType, threading.get_ident(), data)
+
+def enable(size=None):
+	"""Starts recording, clearing the buffer.
+	@param size: the number of events to keep, rounded up to a power of 2.
+	"""
+	global enabled, _size
+	if size:
+		_size = 1 << max(0, size - 1).bit_length()
+	clear()
+	enabled = True
+
+def disable():
+	global enabled
+	enabled = False
+
+def clear():
+	global _buffer, _counter
+	_buffer = [None] * _size
+	_counter = itertools.count()
+
+def dump():
+	"""@return: the recorded events, oldest first, as (seq, time, eventType, threadId, data) tuples."""
+	return sorted(event for event in list(_buffer) if event is not None)
+
+def formatEvents(events=None):
+	"""@return: the recorded events as text, one per line, with times in ms relative to the first event."""
+	if events is None:
+		events = dump()
+	if not events:
+		return ""
+	start = events[0][1]
+	return "\n".join(
+		"%6d %10.3f %-14s %6d %r" % (seq, (t - start) * 1000, EVENT_NAMES.get(eventType, eventType), threadId % 1000000, data)
+		for seq, t, eventType, threadId, data in events
+	)
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_voiceCatalog.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Index of the Hear2Read voice files installed in the Languages directory.
+Voice files are named C{H2R_<lang>_<name>_<gender>.flitevox}.
+The directory is only listed again when its modification time changes,
+so voices installed or removed by the Voice Manager are picked up without restarting NVDA.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from ._H2R_flitevox import readVoiceHeader, VoiceHeaderError, DEFAULT_SAMPLE_RATE
+
+#: File name prefixes used by the Voice Manager for add-on voice files.
+VOICE_FILE_PREFIXES = ("H2R", "H2Rplay")
+
+_NOT_READ = object()
+
+class VoiceRecord(object):
+	"""A single installed voice file."""
+
+	__slots__ = ("language", "name", "gender", "fileName", "path", "_header")
+
+	def __init__(self, language, name, gender, fileName, path):
+		self.language = language
+		self.name = name
+		self.gender = gender
+		self.fileName = fileName
+		self.path = path
+		self._header = _NOT_READ
+
+	@property
+	def displayName(self):
+		return self.name + " " + self.gender
+
+	@property
+	def header(self):
+		"""The L{_H2R_flitevox.VoiceHeader} of the voice file, read on first use, or C{None} if it could not be read."""
+		if self._header is _NOT_READ:
+			try:
+				self._header = readVoiceHeader(self.path)
+			except (OSError, VoiceHeaderError):
+				self._header = None
+		return self._header
+
+	@property
+	def sampleRate(self):
+		header = self.header
+		return header.sampleRate if header is not None else DEFAULT_SAMPLE_RATE
+
+	def __repr__(self):
+		return "VoiceRecord(%r, %r, %r)" % (self.language, self.name, self.gender)
+
+def parseVoiceFileName(fileName):
+	"""Splits a voice file name into its parts.
+	@return: a tuple of (language, name, gender) or C{None} if this is not a Hear2Read voice file.
+	"""
+	parts = fileName.split("_")
+	if parts[0] not in VOICE_FILE_PREFIXES or len(parts) < 4:
+		return None
+	gender = parts[3].split('.')[0]
+	return (parts[1], parts[2], gender)
+
+class VoiceCatalog(object):
+	"""Language to voice index over a Languages directory.
+	All lookups check the directory modification time and rebuild the index when it has changed.
+	"""
+
+	def __init__(self, directory):
+		self.directory = directory
+		#: The number of times the directory has been listed, for diagnostics.
+		self.rebuildCount = 0
+		self._lock = threading.Lock()
+		self._mtime = None
+		self._byLanguage = OrderedDict()
+
+	def _getMtime(self):
+		try:
+			return os.stat(self.directory).st_mtime_ns
+		except OSError:
+			return None
+
+	def _rebuild(self, mtime):
+		byLanguage = OrderedDict()
+		try:
+			fileNames = sorted(os.listdir(self.directory))
+		except OSError:
+			fileNames = []
+		for fileName in fileNames:
+			parsed = parseVoiceFileName(fileName)
+			if parsed is None:
+				continue
+			language, name, gender = parsed
+			# The first voice file for a language wins, as it did when the directory was scanned directly.
+			if language not in byLanguage:
+				byLanguage[language] = VoiceRecord(language, name, gender, fileName, os.path.join(self.directory, fileName))
+		self._byLanguage = byLanguage
+		self._mtime = mtime
+		self.rebuildCount += 1
+
+	def _index(self):
+		mtime = self._getMtime()
+		if mtime is None or mtime != self._mtime:
+			with self._lock:
+				if mtime is None or mtime != self._mtime:
+					self._rebuild(mtime)
+		return self._byLanguage
+
+	def refresh(self):
+		"""Forces the directory to be listed again on the next lookup."""
+		self._mtime = None
+
+	def get(self, language):
+		"""@return: the L{VoiceRecord} for C{language} or C{None} if no voice is installed for it."""
+		return self._index().get(language)
+
+	def languages(self, check=True):
+		"""@param check: whether the directory is checked for changes first.
+		Without the check this does no IO, and gives the languages as of the last lookup.
+		"""
+		return list((self._index() if check else self._byLanguage).keys())
+
+	def voices(self):
+		return list(self._index().values())
+
+	def __contains__(self, language):
+		return language in self._index()
@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+#synthDrivers/_H2R_voicePrefetch.py
+#A part of the Hear2Read voices add-on for NonVisual Desktop Access (NVDA)
+#This file is covered by the GNU General Public License.
+#See the file COPYING for more details.
+
+"""Reads voice files likely to be used into the OS file cache in the background,
+so that the engine's first switch to one of them reads it from memory rather than from disk.
+This cannot keep voices resident: the engine holds one voice at a time and parses the whole voice file again
+on every H2R_Speak_SetVoice, and the OS may drop the cached pages again under memory pressure.
+Each file is mapped only while its pages are read and then closed, so no voice file is held open
+and the Voice Manager can replace or delete installed voices while NVDA is running.
+"""
+
+import mmap
+import os
+import threading
+
+_PAGE_SIZE = mmap.PAGESIZE
+
+def prefetchFile(path):
+	"""Reads one byte from every page of the file at C{path}, which brings the whole file into the OS file cache.
+	@return: the size of the file.
+	"""
+	with open(path, "rb") as f:
+		size = os.fstat(f.fileno()).st_size
+		if size:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				for offset in range(0, size, _PAGE_SIZE):
+					m[offset]
+			finally:
+				m.close()
+	return size
+
+class VoicePrefetcher(object):
+	"""Prefetches voice files on a background thread."""
+
+	def __init__(self):
+		#: The number of voice files read.
+		self.files = 0
+		#: The total size of the voice files read.
+		self.bytes = 0
+		self._thread = None
+
+	def prefetch(self, paths):
+		"""Reads voice files into the OS file cache in the background.
+		@param paths: the voice files, most likely to be used first.
+		"""
+		if not paths:
+			return
+		thread = threading.Thread(target=self._prefetch, args=(list(paths),), name=__name__ + ".prefetch")
+		thread.daemon = True
+		self._thread = thread
+		thread.start()
+
+	def _prefetch(self, paths):
+		for path in paths:
+			try:
+				self.bytes += prefetchFile(path)
+			except (IOError, OSError, ValueError):
+				continue
+			self.files += 1
+
+	def wait(self, timeout=None):
+		"""Waits for the files being prefetched to have been read."""
+		thread = self._thread
+		if thread is not None:
+			thread.join(timeout)
+
+	def __repr__(self):
+		return "VoicePrefetcher(files=%d, bytes=%d)" % (self.files, self.bytes)